@@ -0,0 +1,115 @@
+# Memory and deepcopy cost of the planning data model on a 96-sample experiment:
+# the compact (__slots__) ActionInfo / SamWellData / ResWellData / RackData classes
+# against the previous layout, where every object keeps a __dict__, every ActionInfo
+# stores its own four duration constants and a _time_stamp tuple.
+# Run from the repository folder, in the OT2DropHandling environment:
+# $ python benchmarks/data_model_benchmark.py
+import os
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import testingTimeManagement as ttm  # noqa: E402
+
+NUM_RACKS = 12  # sample racks
+WELLS_PER_RACK = 8  # sample wells per rack, 12 x 8 = 96 samples
+NUM_RES = 24  # reservoir wells
+NUM_MIXES = 3
+NUM_RINSES = 4
+NUM_REPEATS = 5  # deepcopy timing, best of
+
+
+class LegacyActionInfo:
+    # ActionInfo before __slots__: per-instance durations and a stored _time_stamp
+    def __init__(self, keeper, sub_action, top_action, order_num, start_time_s,
+                 parent=(1, 0), targ=(1, 0), vol=0, tip=(11, 0), num_mixes=3, is_complex=True):
+        self._transf_time_s = 20
+        self._mix_time_s = 20
+        self._load_time_s = 40
+        self._rinse_time_s = 60
+        self._keeper = keeper
+        self._action = sub_action
+        self._top_act = top_action
+        self._order_num = order_num
+        self._complex = is_complex
+        self._start_stamp = start_time_s
+        if sub_action == 'mix':
+            self._end_stamp = start_time_s + self._mix_time_s
+        elif sub_action == 'transf':
+            self._end_stamp = start_time_s + self._transf_time_s
+        elif sub_action == 'load':
+            self._end_stamp = start_time_s + self._load_time_s
+        else:
+            self._end_stamp = start_time_s + self._rinse_time_s
+        self._time_stamp = (self._start_stamp, self._end_stamp)
+        self._tip_loc = tip
+        self._from_loc = parent
+        self._targ_loc = targ
+        self._transf_vol = vol
+        self._num_mixes = num_mixes
+
+
+class LegacyWell:
+    # SamWellData / ResWellData / RackData before __slots__: same attributes, in a __dict__
+    def __init__(self, template):
+        for name in type(template).__slots__:
+            setattr(self, name, getattr(template, name))
+
+
+def build_samples(action_class, well_class=None):
+    # nested list of 96 sample wells, each with its target action sequence
+    all_samples = []
+    for rack_indx in range(NUM_RACKS):
+        rack_set = []
+        for well_indx in range(WELLS_PER_RACK):
+            sam = ttm.SamWellData()
+            sam.loc = (rack_indx, well_indx)
+            incub_s = 60 * (4 + 4 * ((rack_indx + well_indx) % 8))
+            sam_sequence = [action_class(sam.loc, 'load', 'load', 0, 0)]
+            for mix_num in range(NUM_MIXES):
+                sam_sequence.append(action_class(sam.loc, 'mix', 'mix', 0, (mix_num + 1) * incub_s // 4))
+            sam_sequence.append(action_class(sam.loc, 'unload', 'unload', 0, incub_s))
+            for rinse_num in range(NUM_RINSES):
+                sam_sequence.append(action_class(sam.loc, 'rinse', 'rinse', 0, incub_s + 180 * (rinse_num + 1)))
+            sam.targ_act_seq = sam_sequence
+            if well_class is not None:
+                sam = well_class(sam)
+            rack_set.append(sam)
+        all_samples.append(rack_set)
+    res_set = [ttm.ResWellData() for _ in range(NUM_RES)]
+    racks = [ttm.RackData(slot, 'sam') for slot in range(NUM_RACKS)]
+    if well_class is not None:
+        res_set = [well_class(res) for res in res_set]
+        racks = [well_class(rack) for rack in racks]
+    return all_samples, res_set, racks
+
+
+def measure(label, action_class, well_class=None):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    data = build_samples(action_class, well_class)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    mem_bytes = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    best = None
+    for _ in range(NUM_REPEATS):
+        t_start = time.perf_counter()
+        deepcopy(data)
+        elapsed = time.perf_counter() - t_start
+        if best is None or elapsed < best:
+            best = elapsed
+    num_actions = NUM_RACKS * WELLS_PER_RACK * (2 + NUM_MIXES + NUM_RINSES)
+    print(label.ljust(10), str(num_actions).rjust(8), " actions",
+          str(round(mem_bytes / 1024, 1)).rjust(10), " KiB",
+          str(round(1000 * best, 2)).rjust(10), " ms deepcopy")
+    return mem_bytes, best
+
+
+if __name__ == '__main__':
+    print("Data model, 96-sample experiment (memory from tracemalloc, deepcopy best of", NUM_REPEATS, ")")
+    legacy = measure("legacy", LegacyActionInfo, LegacyWell)
+    compact = measure("compact", ttm.ActionInfo)
+    print("memory ratio (compact/legacy):", round(compact[0] / legacy[0], 2),
+          "; deepcopy ratio (compact/legacy):", round(compact[1] / legacy[1], 2))
@@ -0,0 +1,75 @@
+# Planning wall time with the planner's debug logging off and on, on synthetic experiments.
+# off:     configure_logging(debug=False), debug messages are skipped before formatting
+# buffer:  configure_logging(debug=True, console_level=logging.WARNING), debug messages go to log_buffer only
+# console: configure_logging(debug=True), debug messages are printed (DO_DEBUG = True)
+# Two planners are timed: create_exp_sequence, and the older shift_timestamp pass,
+# which logs on every swap and shift. Console output goes to os.devnull, so the
+# console times are a lower bound: a Jupyter terminal on the OT-2 is much slower than that.
+# Run from the repository folder, in the OT2DropHandling environment:
+# $ python benchmarks/logging_benchmark.py
+import contextlib
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic_exp  # noqa: E402
+from synthetic_exp import ttm  # noqa: E402
+
+SIZES = ((2, 4), (6, 8), (12, 8))  # (num_plates, wells_per_plate)
+NUM_REPEATS = 3  # best of
+MODES = {'off': {'debug': False},
+         'buffer': {'debug': True, 'console_level': logging.WARNING},
+         'console': {'debug': True}}
+
+
+def concat_sequence(exp: ttm.ExperimentData):
+    # target actions of all samples, shifted by the load order (as in create_exp_sequence)
+    exp_sequence = []
+    time_in_seq = ttm.start_time
+    for sam_loc in exp.incub_loc_order:
+        sam_indx = exp.find_sam_in_nest_list(sam_loc)
+        for this_action in exp.all_samples[sam_indx[0]][sam_indx[1]].targ_act_seq:
+            new_action = ttm.deepcopy(this_action)
+            new_action.change_start(this_action.start + time_in_seq)
+            exp_sequence.append(new_action)
+        time_in_seq = time_in_seq + ttm.load_time_s
+    return exp_sequence
+
+
+def time_planner(plates: int, wells: int, planner: str):
+    best = None
+    for seed in range(NUM_REPEATS):
+        exp = synthetic_exp.make_synthetic_exp(plates, wells, max_evap_m=20, seed=seed)
+        if planner == 'shift_timestamp':
+            exp_sequence = concat_sequence(exp)
+        t_start = time.perf_counter()
+        if planner == 'shift_timestamp':
+            ttm.shift_timestamp(exp_sequence, exp.incub_loc_order)
+        else:
+            ttm.create_exp_sequence(exp)
+        elapsed = time.perf_counter() - t_start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    print("planner, samples:".ljust(28) + "".join(mode.rjust(12) for mode in MODES) + "   (ms, best of " +
+          str(NUM_REPEATS) + ")")
+    for planner in ('create_exp_sequence', 'shift_timestamp'):
+        for plates, wells in SIZES:
+            times = []
+            for mode, settings in MODES.items():
+                ttm.configure_logging(**settings)
+                ttm.log_buffer.clear()
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    times.append(time_planner(plates, wells, planner))
+            print((planner + ", " + str(plates * wells) + ":").ljust(28) +
+                  "".join(str(round(1000 * t, 1)).rjust(12) for t in times))
+    ttm.configure_logging()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+# Benchmark for create_exp_sequence on synthetic experiments (see synthetic_exp.py).
+# For each configuration on the size axes (plates x wells, inoculation solutions,
+# incubation time distribution, evaporation limit) it reports
+# planning cost:     wall time and peak memory (tracemalloc)
+# schedule quality:  makespan, idle fraction, max incubation overshoot, mean and max offset
+#                    of the actions from their target start, samples whose actions were reordered
+# and writes the results to a JSON file, so runs can be compared across commits.
+# Run from the repository folder, in the OT2DropHandling environment:
+# $ python benchmarks/scheduler_benchmark.py --out bench.json
+# $ python benchmarks/scheduler_benchmark.py --quick --out bench_quick.json
+import argparse
+import contextlib
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic_exp  # noqa: E402
+from synthetic_exp import ttm  # noqa: E402
+
+# size axes, every combination is run
+PLATE_SIZES = ((1, 4), (2, 4), (3, 8), (6, 8), (12, 8))  # (num_plates, wells_per_plate)
+NUM_INOCS = (1, 2)
+INCUB_DISTS = ('uniform', 'bimodal', 'long')
+EVAP_LIMITS_M = (60, 20)  # max_time_before_evap_m, samples that incubate longer are reloaded
+QUICK_PLATE_SIZES = ((1, 4), (3, 8))
+
+
+def target_starts(exp: ttm.ExperimentData):
+    # target start of every action, as create_exp_sequence lays them out before scheduling:
+    # keeper: list of (start time, action), in the order of its targ_act_seq
+    targ = {}
+    time_in_seq = ttm.start_time
+    for sam_loc in exp.incub_loc_order:
+        sam_indx = exp.find_sam_in_nest_list(sam_loc)
+        this_sample = exp.all_samples[sam_indx[0]][sam_indx[1]]
+        targ[sam_loc] = [(this_action.start + time_in_seq, this_action.action)
+                         for this_action in this_sample.targ_act_seq]
+        time_in_seq = time_in_seq + ttm.load_time_s
+    return targ
+
+
+def schedule_quality(exp: ttm.ExperimentData, planned, targ: dict):
+    # makespan, idle fraction, max incubation overshoot, offsets from the target starts and reordered samples
+    if not planned:
+        return {'makespan_s': 0, 'idle_fraction': 0.0, 'max_overshoot_s': 0, 'mean_offset_s': 0.0,
+                'max_offset_s': 0, 'samples_reordered': 0}
+    first_start = min(this_action.start for this_action in planned)
+    last_end = max(this_action.end for this_action in planned)
+    makespan = last_end - first_start
+    busy = sum(this_action.length for this_action in planned)
+    idle_fraction = 1.0 - busy / makespan if makespan > 0 else 0.0
+
+    # incubation overshoot, against the incubation planned for each sample
+    incub_targ = {}
+    for sam_loc in exp.incub_loc_order:
+        sam_indx = exp.find_sam_in_nest_list(sam_loc)
+        incub_targ.update(ttm.find_incub_targets(exp.all_samples[sam_indx[0]][sam_indx[1]].targ_act_seq))
+    cert = ttm.certify_sequence(planned, incub_targ, exp.max_incub_error_s)
+    max_overshoot = max([0] + list(cert.incub_errors.values()))
+
+    # offset of each action from its target start: the k-th action of a type of a sample is matched
+    # to the k-th target of that type; a sample is reordered if its actions run in another order
+    planned_by_keeper = {}
+    for this_action in planned:
+        planned_by_keeper.setdefault(this_action.keeper, []).append((this_action.start, this_action.action))
+    offsets = []
+    samples_reordered = 0
+    for keeper, starts in planned_by_keeper.items():
+        starts.sort()
+        targ_list = sorted(targ.get(keeper, []))
+        if [item[1] for item in starts] != [item[1] for item in targ_list]:
+            samples_reordered += 1
+        targ_by_action = {}
+        for targ_start, action in targ_list:
+            targ_by_action.setdefault(action, []).append(targ_start)
+        num_seen = {}
+        for start, action in starts:
+            indx = num_seen.get(action, 0)
+            num_seen[action] = indx + 1
+            if indx < len(targ_by_action.get(action, [])):
+                offsets.append(abs(start - targ_by_action[action][indx]))
+    mean_offset = sum(offsets) / len(offsets) if offsets else 0.0
+    return {'makespan_s': int(makespan), 'idle_fraction': round(idle_fraction, 4),
+            'max_overshoot_s': int(max_overshoot), 'mean_offset_s': round(mean_offset, 1),
+            'max_offset_s': int(max(offsets, default=0)), 'samples_reordered': samples_reordered,
+            'cert_valid': cert.valid, 'overlaps': len(cert.overlaps), 'order_errors': len(cert.order_errors)}
+
+
+def run_one(plates: int, wells: int, num_inoc: int, incub_dist: str, max_evap_m: int, seed: int):
+    exp = synthetic_exp.make_synthetic_exp(plates, wells, num_inoc, incub_dist, max_evap_m, seed=seed)
+    num_reloads = sum(sam.targ_num_reload for rack in exp.all_samples for sam in rack)
+    targ = target_starts(exp)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        t_start = time.perf_counter()
+        planned = ttm.create_exp_sequence(exp)
+        plan_time = time.perf_counter() - t_start
+        # second run for the memory peak, so tracemalloc does not slow the timed run
+        exp = synthetic_exp.make_synthetic_exp(plates, wells, num_inoc, incub_dist, max_evap_m, seed=seed)
+        tracemalloc.start()
+        ttm.create_exp_sequence(exp)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    result = {'plates': plates, 'wells_per_plate': wells, 'num_samples': plates * wells,
+              'num_inoc': num_inoc, 'incub_dist': incub_dist, 'max_evap_m': max_evap_m, 'num_reloads': num_reloads,
+              'seed': seed, 'num_tip_swaps': exp.num_tip_swaps,
+              'num_actions': len(planned), 'plan_time_s': round(plan_time, 6),
+              'peak_mem_kib': round(peak_bytes / 1024, 1)}
+    result.update(schedule_quality(exp, planned, targ))
+    return result
+
+
+def git_commit():
+    # current commit of the repository, or None outside of git
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark create_exp_sequence on synthetic experiments")
+    parser.add_argument('--out', default='scheduler_benchmark.json', help="JSON file for the results")
+    parser.add_argument('--quick', action='store_true', help="small grid, for a fast check")
+    parser.add_argument('--seeds', type=int, default=1, help="number of random seeds for each configuration")
+    args = parser.parse_args()
+
+    plate_sizes = QUICK_PLATE_SIZES if args.quick else PLATE_SIZES
+    results = []
+    print("plates x wells, inoc, incub, evap(m):  actions  reloads  plan(ms)  peak(KiB)  makespan(s)  idle  "
+          "overshoot(s)  offset(s)  max_offset(s)  reordered  valid")
+    for (plates, wells), num_inoc, incub_dist, max_evap_m, seed in itertools.product(
+            plate_sizes, NUM_INOCS, INCUB_DISTS, EVAP_LIMITS_M, range(args.seeds)):
+        result = run_one(plates, wells, num_inoc, incub_dist, max_evap_m, seed)
+        results.append(result)
+        print(str(plates) + " x " + str(wells) + ", " + str(num_inoc) + ", " + incub_dist + ", " +
+              str(max_evap_m) + ": ", result['num_actions'], result['num_reloads'],
+              round(1000 * result['plan_time_s'], 1), result['peak_mem_kib'], result['makespan_s'],
+              result['idle_fraction'], result['max_overshoot_s'], result['mean_offset_s'], result['max_offset_s'],
+              result['samples_reordered'], result['cert_valid'])
+
+    report = {'commit': git_commit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'quick': args.quick, 'results': results}
+    with open(args.out, 'w') as out_file:
+        json.dump(report, out_file, indent=1)
+    print("Wrote", len(results), "results to", args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# Synthetic ExperimentData generator for the planner benchmarks.
+# Builds all_samples, incub_loc_order and each sample's targ_act_seq directly
+# (the same actions list_actions_each_sam plans), so create_exp_sequence can run
+# without a deck configuration or the OT-2.
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import testingTimeManagement as ttm  # noqa: E402
+
+# incubation time distributions, in minutes
+INCUB_DISTS = ('uniform', 'equal', 'bimodal', 'long')
+
+
+def draw_incub_m(rnd: random.Random, dist: str):
+    if dist == 'uniform':
+        return rnd.randint(1, 8) * 4  # 4 to 32 minutes
+    elif dist == 'equal':
+        return 20
+    elif dist == 'bimodal':
+        return rnd.choice((4, 8)) if rnd.random() < 0.5 else rnd.choice((28, 32))
+    elif dist == 'long':
+        return rnd.randint(6, 18) * 10  # 60 to 180 minutes
+    s_out = "Unknown incubation distribution: " + str(dist) + ", use one of " + str(INCUB_DISTS)
+    raise ValueError(s_out)
+
+
+def make_synthetic_exp(num_plates=2, wells_per_plate=4, num_inoc=1, incub_dist='uniform',
+                       max_evap_m=60, num_mixes=3, num_rinses=4, seed=0):
+    # returns an ExperimentData with num_plates x wells_per_plate samples,
+    # each loaded from num_inoc solutions, then mixed, reloaded, unloaded and rinsed.
+    # As in set_up_res_sam_data, a sample is reloaded only if it incubates longer than max_evap_m
+    # (exp.max_time_before_evap_m), and each sample gets its own tip from two full large tip racks
+    rnd = random.Random(seed)
+    exp = ttm.ExperimentData()
+    exp.exp_name = "synthetic_" + str(num_plates) + "x" + str(wells_per_plate)
+    exp.slots_sam_plates = tuple(range(1, num_plates + 1))
+    exp.max_time_before_evap_m = max_evap_m
+    exp.slots_tiprack_lg = (10, 11)
+    exp.tips_in_lg_racks = tuple((slot_num, [*range(0, 96, 1)]) for slot_num in exp.slots_tiprack_lg)
+    exp.tip_inventory_lg = ttm.TipInventory(exp.tips_in_lg_racks, exp.tip_policy, exp.allow_tip_refills)
+    exp.all_samples = []
+    sam_incub_set = []  # (incubation_time, (rack_num, well_id))
+    for plate_indx in range(num_plates):
+        slot_num = plate_indx + 1
+        rack_set = []
+        for well_id in range(wells_per_plate):
+            new_sam = ttm.SamWellData()
+            new_sam.sample_name = "SYN" + str(slot_num) + "_" + str(well_id)
+            new_sam.slot_num = slot_num
+            new_sam.well_id = well_id
+            new_sam.loc = (slot_num, well_id)
+            new_sam.num_inoc_sol = num_inoc
+            targ_incub_m = draw_incub_m(rnd, incub_dist)
+            new_sam.targ_incub_time_m = targ_incub_m
+            new_sam.targ_incub_time_s = 60 * targ_incub_m
+            new_sam.targ_num_mixes = num_mixes
+            if targ_incub_m > exp.max_time_before_evap_m:
+                new_sam.targ_num_reload = int(targ_incub_m / exp.max_time_before_evap_m)
+                new_sam.targ_num_mixes = max(num_mixes - new_sam.targ_num_reload, 0)
+            new_sam.targ_num_rinses = num_rinses
+            new_sam.assigned_tip = exp.assign_tip(new_sam.loc)
+            rack_set.append(new_sam)
+            sam_incub_set.append((targ_incub_m, new_sam.loc))
+        exp.all_samples.append(rack_set)
+
+    sam_incub_set.sort(reverse=exp.incub_longest_first)
+    exp.incub_loc_order = tuple(item[1] for item in sam_incub_set)
+    exp.max_incub_m = max(item[0] for item in sam_incub_set)
+    exp.tot_num_sams = len(sam_incub_set)
+    for inoc_index in range(len(exp.incub_loc_order)):
+        sam_indx = exp.find_sam_in_nest_list(exp.incub_loc_order[inoc_index])
+        new_sam = exp.all_samples[sam_indx[0]][sam_indx[1]]
+        new_sam.sam_inoculation_timing = inoc_index
+        new_sam.targ_act_seq = sample_actions(new_sam)
+    return exp
+
+
+def sample_actions(sam):
+    # target action sequence for one sample, start times relative to its first load,
+    # all on the sample's tip
+    sam_loc = sam.loc
+    sam_tip = sam.assigned_tip
+    sam_sequence = []
+    time_stmp = 0
+    for inoc_num in range(sam.num_inoc_sol):
+        new_action = ttm.ActionInfo(sam_loc, 'load', 'load', sam.sam_inoculation_timing, time_stmp, tip=sam_tip)
+        sam_sequence.append(new_action)
+        time_stmp = new_action.end
+    end_load_time = time_stmp
+    incub_time = sam.targ_incub_time_s
+    gap_time = math.ceil(incub_time / (sam.targ_num_mixes + 1))
+    for mix_num in range(sam.targ_num_mixes):
+        sam_sequence.append(ttm.ActionInfo(sam_loc, 'mix', 'only_mix', sam.sam_inoculation_timing,
+                                           end_load_time + (mix_num + 1) * gap_time, tip=sam_tip))
+    reload_gap = math.ceil(incub_time / (sam.targ_num_reload + 1))
+    for reload_num in range(sam.targ_num_reload):
+        sam_sequence.append(ttm.ActionInfo(sam_loc, 'reload', 'reload', sam.sam_inoculation_timing,
+                                           end_load_time + (reload_num + 1) * reload_gap + 30, tip=sam_tip))
+    unload_time = end_load_time + incub_time
+    new_action = ttm.ActionInfo(sam_loc, 'unload', 'unload', sam.sam_inoculation_timing, unload_time,
+                                tip=sam_tip)
+    sam_sequence.append(new_action)
+    time_stmp = new_action.end
+    for rinse_num in range(sam.targ_num_rinses):
+        new_action = ttm.ActionInfo(sam_loc, 'rinse', 'rinse', sam.sam_inoculation_timing, time_stmp, tip=sam_tip)
+        sam_sequence.append(new_action)
+        time_stmp = new_action.end
+    sam_sequence.sort(key=lambda sort_action: sort_action.start)
+    return sam_sequence
@@ -26,10 +26,23 @@
 # To close experiment, save notebook, then Shutdown kernel and Quit
 
 
-# import json
+import os
+import sys
+import csv
+import json
 import time
+import pickle
+import struct
+import hashlib
+import logging
 import math
+import heapq
+import bisect
+import functools
+import tracemalloc
+import numpy as np
 from copy import deepcopy
+from collections import deque
 from typing import List, Tuple
 import datetime  # using time module
 # from threading import Thread
@@ -48,6 +61,205 @@ metadata = {
 
 # GLOBAL variables, used throughout!
 DO_DEBUG = True
+start_time = 30  # seconds, when first action will run
+load_time_s = 40  # seconds between the start of each sample's load, in create_exp_sequence
+# priority of overlapping actions: (0) unload (1) reload (2) mix (3) load (4) rinse
+ACTION_RANK = {'unload': 0, 'reload': 1, 'mix': 2, 'load': 3, 'rinse': 4}
+OTHER_ACTION_RANK = 5  # rank for any other action, eg: 'transf'
+# order of the actions for each sample: load < (reload, mix) < unload < rinse
+SAMPLE_PHASE = {'load': 0, 'reload': 1, 'mix': 1, 'unload': 2, 'rinse': 3}
+LOG_BUFFER_SIZE = 2000  # number of planner log messages kept in log_buffer
+
+
+# planner logging: the planning functions log through logger instead of print,
+# and messages are only formatted when a handler takes them (logger.debug("...%s", x)).
+# With DO_DEBUG = False the debug messages are skipped, and planning does not wait on the terminal.
+# The last LOG_BUFFER_SIZE messages of the current planning (create_exp_sequence clears it) are kept in
+# log_buffer, print them with log_buffer.dump()
+class RingBufferHandler(logging.Handler):
+    def __init__(self, capacity=LOG_BUFFER_SIZE):
+        logging.Handler.__init__(self)
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record: logging.LogRecord):
+        # format now, the arguments (eg: a sequence of actions) may change after logging
+        record.msg = record.getMessage()
+        record.args = None
+        self.records.append(record)
+
+    def dump(self, stream=None):
+        # print the buffered messages, oldest first
+        if stream is None:
+            stream = sys.stdout
+        for record in self.records:
+            stream.write(self.format(record) + "\n")
+        stream.flush()
+
+    def clear(self):
+        self.records.clear()
+
+
+class StdoutHandler(logging.StreamHandler):
+    # writes to the current sys.stdout, where print() goes (notebooks replace sys.stdout)
+    def __init__(self):
+        logging.Handler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+
+logger = logging.getLogger('OT2DropHandling.planner')
+log_buffer = RingBufferHandler()
+log_buffer.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(funcName)s: %(message)s'))
+log_console = StdoutHandler()
+log_console.setFormatter(logging.Formatter('%(message)s'))
+
+
+def configure_logging(debug=None, console_level=None):
+    # debug: True to log debug messages (defaults to DO_DEBUG)
+    # console_level: lowest level printed to the console, eg: logging.WARNING
+    # to keep debug messages in log_buffer only (defaults to all logged messages)
+    if debug is None:
+        debug = DO_DEBUG
+    level = logging.DEBUG if debug else logging.INFO
+    logger.setLevel(level)
+    logger.propagate = False
+    log_console.setLevel(level if console_level is None else console_level)
+    for handler in list(logger.handlers):
+        if type(handler).__name__ in ('RingBufferHandler', 'StdoutHandler'):
+            logger.removeHandler(handler)  # handlers of an earlier import (notebook re-run)
+    logger.addHandler(log_buffer)
+    logger.addHandler(log_console)
+
+
+configure_logging()
+
+
+# planning profiler: wall time, number of calls and peak memory of each planning stage
+# (calc_nums_exp, set_up_res_sam_data, ...) and scheduler pass (fixed_point_schedule, ...).
+# Set exp.profile_planning = True; plan_experiment (or a profiled stage called on its own with exp)
+# starts a profile, and reports it as a table and leaves it in exp.plan_profile when it returns or raises.
+# When it is off, each profiled call costs one attribute check.
+class StageStats:
+    __slots__ = ('name', 'depth', 'calls', 'total_s', 'peak_kib')
+
+    def __init__(self, name: str, depth: int):
+        self.name = name
+        self.depth = depth  # nesting depth of the first call, for the table
+        self.calls = 0
+        self.total_s = 0.0  # wall time, including nested stages
+        self.peak_kib = 0.0  # peak memory above the memory in use when the stage started
+
+    # returns this when calling this object
+    def __repr__(self):
+        this_string = str(self.name) + ": " + str(self.calls) + " calls, " + str(round(self.total_s, 4)) + \
+                      "s, peak " + str(round(self.peak_kib, 1)) + "KiB"
+        return this_string
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        return self.__repr__()
+
+
+class PlanProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False  # peak memory with tracemalloc (slows planning while on)
+        self.stages = {}  # name: StageStats, in the order the stages first ran
+        self._stack = []  # [StageStats, start time, memory at start, peak so far] of running stages
+        self._started_tracing = False
+
+    def start(self, trace_memory=True):
+        self.enabled = True
+        self.stages = {}
+        self._stack = []
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        self.enabled = False
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.trace_memory = False
+
+    def _peak_since_reset(self):
+        # tracemalloc.reset_peak needs python 3.9, before that the peak is since tracing started
+        return tracemalloc.get_traced_memory()[1]
+
+    def enter(self, name: str):
+        this_stage = self.stages.get(name)
+        if this_stage is None:
+            this_stage = StageStats(name, len(self._stack))
+            self.stages[name] = this_stage
+        current = 0
+        if self.trace_memory:
+            current = tracemalloc.get_traced_memory()[0]
+            if self._stack:  # keep the peak of the running stage before measuring this one
+                self._stack[-1][3] = max(self._stack[-1][3], self._peak_since_reset())
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        self._stack.append([this_stage, time.perf_counter(), current, current])
+
+    def exit(self):
+        this_stage, t_start, current, peak = self._stack.pop()
+        this_stage.calls += 1
+        this_stage.total_s += time.perf_counter() - t_start
+        if self.trace_memory:
+            peak = max(peak, self._peak_since_reset())
+            this_stage.peak_kib = max(this_stage.peak_kib, (peak - current) / 1024)
+            if self._stack:
+                self._stack[-1][3] = max(self._stack[-1][3], peak)
+
+    def table(self):
+        # one line per stage, nested stages indented under the stage that called them
+        total_s = sum(stage.total_s for stage in self.stages.values() if stage.depth == 0)
+        str_out = "stage".ljust(34) + "calls".rjust(8) + "total(s)".rjust(11) + "mean(ms)".rjust(11) + \
+            "share".rjust(8) + ("peak(KiB)".rjust(12) if self.trace_memory else "")
+        for stage in self.stages.values():
+            share = stage.total_s / total_s if total_s > 0 else 0.0
+            str_out = str_out + "\n" + ("  " * stage.depth + stage.name).ljust(34) + str(stage.calls).rjust(8) + \
+                str(round(stage.total_s, 3)).rjust(11) + \
+                str(round(1000 * stage.total_s / max(stage.calls, 1), 2)).rjust(11) + \
+                (str(round(100 * share, 1)) + "%").rjust(8)
+            if self.trace_memory:
+                str_out = str_out + str(round(stage.peak_kib, 1)).rjust(12)
+        return str_out
+
+
+profiler = PlanProfiler()
+
+
+def profiled_stage(func):
+    # records func as a planning stage in profiler, while a profile is running;
+    # a call with an ExperimentData (first argument) with profile_planning = True starts one,
+    # which is reported and stopped when this call returns or raises
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not profiler.enabled:
+            if not (args and isinstance(args[0], ExperimentData) and args[0].profile_planning):
+                return func(*args, **kwargs)
+            profiler.start(args[0].profile_memory)
+            try:
+                return wrapper(*args, **kwargs)
+            finally:
+                finish_profile(args[0])
+        profiler.enter(func.__name__)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.exit()
+    return wrapper
+
+
+def finish_profile(exp):
+    # reports and stops the running profile, and leaves it in exp.plan_profile
+    exp.plan_profile = profiler.stages
+    logger.info("Planning profile:\n%s", profiler.table())
+    profiler.stop()
 
 
 # MODIFY: move these class objects and functions to a different file and import
@@ -57,6 +269,354 @@ class StopExecution(Exception):
         pass
 
 
+def index_nested_locs(nested_list):
+    # {loc: (rack_indx, well_indx)} for a nested list of wells (SamWellData or ResWellData)
+    # if a location is listed twice, the first one is kept (same as the linear search)
+    loc_index = {}
+    for rack_indx in range(len(nested_list)):
+        sub_list = nested_list[rack_indx]
+        for well_indx in range(len(sub_list)):
+            loc_index.setdefault(sub_list[well_indx].loc, (rack_indx, well_indx))
+    return loc_index
+
+
+def nested_shape(nested_list):
+    # number of wells in each rack of a nested list, to tell if it changed size since it was indexed
+    return tuple(len(sub_list) for sub_list in nested_list)
+
+
+def nested_loc_at(nested_list, indices: (int, int)):
+    # location of the well at indices in a nested list of wells, or None if out of range
+    if indices[0] < len(nested_list) and indices[1] < len(nested_list[indices[0]]):
+        return nested_list[indices[0]][indices[1]].loc
+    return None
+
+
+def find_load_rank(sam_indx):
+    # {keeper: rank} for the sample load order sam_indx (eg: exp.incub_loc_order),
+    # so order comparisons are a dict lookup instead of sam_indx.index()
+    load_rank = {}
+    for rank in range(len(sam_indx)):
+        load_rank.setdefault(sam_indx[rank], rank)
+    return load_rank
+
+
+def index_rack_slots(rack_list):
+    # {slot_num: indx} for a list of racks (RackData)
+    slot_index = {}
+    for indx in range(len(rack_list)):
+        slot_index.setdefault(rack_list[indx].slot, indx)
+    return slot_index
+
+
+def rack_slot_at(rack_list, indx: int):
+    # slot of the rack at indx, or None if out of range
+    if indx < len(rack_list):
+        return rack_list[indx].slot
+    return None
+
+
+try:
+    MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:  # __file__ is not defined when pasted into a notebook
+    MODULE_DIR = os.getcwd()
+# custom labware definitions (Opentrons labware JSON), one file per tray
+LABWARE_DIR = os.path.join(MODULE_DIR, 'labware')
+LABWARE_CACHE_NAME = '.labware_cache.json'  # parsed definitions, kept next to the JSON files
+
+
+class LabwareDef:
+    __slots__ = ('load_name', 'display_name', 'category', 'num_wells', 'well_ids',
+                 'max_vol', 'depth', 'diameter', 'label')
+
+    def __init__(self, load_name: str):
+        self.load_name = load_name  # parameters.loadName, used by protocol.load_labware
+        self.display_name = ""
+        self.category = ""  # metadata.displayCategory: 'reservoir', 'wellPlate', ...
+        self.num_wells = 0
+        self.well_ids = ()  # well names in Opentrons order (down each column): ('A1', 'B1', 'A2', ...)
+        self.max_vol = 0  # uL, smallest totalLiquidVolume of the wells
+        self.depth = 0.0  # mm
+        self.diameter = 0.0  # mm, 0.0 for rectangular wells
+        self.label = 'no_label_'  # rack label prefix, eg: 'Res3_60mL_' or 'Sam4Plate_'
+
+    @classmethod
+    def from_json(cls, definition: dict):
+        # parse the fields the planner uses from an Opentrons labware definition
+        new_def = cls(definition['parameters']['loadName'])
+        metadata = definition.get('metadata', {})
+        new_def.display_name = metadata.get('displayName', "")
+        new_def.category = metadata.get('displayCategory', "")
+        wells = definition.get('wells', {})
+        well_ids = [well for column in definition.get('ordering', []) for well in column]
+        if not well_ids:
+            well_ids = list(wells.keys())
+        new_def.well_ids = tuple(well_ids)
+        new_def.num_wells = len(well_ids)
+        if wells:
+            new_def.max_vol = min(well.get('totalLiquidVolume', 0) for well in wells.values())
+            first_well = wells[well_ids[0]]
+            new_def.depth = first_well.get('depth', 0.0)
+            new_def.diameter = first_well.get('diameter', 0.0)
+        if new_def.category == 'reservoir':
+            new_def.label = 'Res' + str(new_def.num_wells) + '_' + str(round(new_def.max_vol / 1000)) + 'mL_'
+        elif new_def.category == 'wellPlate':
+            new_def.label = 'Sam' + str(new_def.num_wells) + 'Plate_'
+        return new_def
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, fields: dict):
+        new_def = cls(fields['load_name'])
+        for name in cls.__slots__:
+            if name in fields:
+                setattr(new_def, name, fields[name])
+        new_def.well_ids = tuple(new_def.well_ids)
+        return new_def
+
+    # returns this when calling this object
+    def __repr__(self):
+        this_string = str(self.category) + " " + str(self.load_name) + ", labeled " + str(self.label) + \
+                      " with " + str(self.num_wells) + " wells of max vol " + str(self.max_vol) + \
+                      "uL, depth " + str(self.depth) + "mm, diameter " + str(self.diameter) + "mm"
+        return this_string
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        return self.__repr__()
+
+
+class LabwareRegistry:
+    # definitions of the custom labware in labware_dir, by load name
+    # each JSON file is parsed once, the parsed fields are cached in labware_dir/.labware_cache.json
+    # with the file's size and modification time, so later runs only re-parse files that changed
+    def __init__(self, labware_dir=LABWARE_DIR):
+        self.labware_dir = labware_dir
+        self.cache_file = os.path.join(labware_dir, LABWARE_CACHE_NAME)
+        self._defs = {}  # load_name: LabwareDef
+        self._files = {}  # file_name: {'size': int, 'mtime_ns': int, 'def': dict}
+        self.num_parsed = 0  # number of JSON files parsed (not served from the cache) by the last scan
+        self.scan()
+
+    def scan(self):
+        # (re)load all definitions, parsing only new or changed files
+        cached_files = self._read_cache()
+        self._defs = {}
+        self._files = {}
+        self.num_parsed = 0
+        if not os.path.isdir(self.labware_dir):
+            return
+        for file_name in sorted(os.listdir(self.labware_dir)):
+            if not file_name.endswith('.json') or file_name == LABWARE_CACHE_NAME:
+                continue
+            file_path = os.path.join(self.labware_dir, file_name)
+            file_stat = os.stat(file_path)
+            cached = cached_files.get(file_name)
+            if cached is not None and cached.get('size') == file_stat.st_size \
+                    and cached.get('mtime_ns') == file_stat.st_mtime_ns:
+                new_def = LabwareDef.from_dict(cached['def'])
+            else:
+                try:
+                    with open(file_path, encoding='utf-8') as json_file:
+                        new_def = LabwareDef.from_json(json.load(json_file))
+                except (ValueError, KeyError) as err:
+                    logger.warning("Skipping labware file %s: %s", file_name, err)
+                    continue
+                self.num_parsed += 1
+            if new_def.load_name in self._defs:
+                logger.warning("Labware %s is defined twice, using %s", new_def.load_name, file_name)
+            self._defs[new_def.load_name] = new_def
+            self._files[file_name] = {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns,
+                                      'def': new_def.to_dict()}
+        if self.num_parsed > 0 or set(self._files) != set(cached_files):
+            self._write_cache()
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_file, encoding='utf-8') as cache:
+                return json.load(cache).get('files', {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _write_cache(self):
+        # the cache only saves parsing time, so a read-only labware folder is not an error
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as cache:
+                json.dump({'files': self._files}, cache)
+        except OSError:
+            pass
+
+    def get(self, load_name: str):
+        # LabwareDef for this load name, or None if there is no definition in labware_dir
+        return self._defs.get(load_name)
+
+    def __contains__(self, load_name: str):
+        return load_name in self._defs
+
+    def __len__(self):
+        return len(self._defs)
+
+    def load_names(self):
+        return tuple(self._defs.keys())
+
+
+_labware_registry = None  # shared LabwareRegistry, created on first use
+
+
+def labware_registry():
+    # the LabwareRegistry for LABWARE_DIR, scanned once per session
+    global _labware_registry
+    if _labware_registry is None:
+        _labware_registry = LabwareRegistry()
+    return _labware_registry
+
+
+def deck_distance(slot_a: int, slot_b: int):
+    # distance between two OT-2 deck slots, in slots (1-3 front row, ..., 10-12 back row)
+    col_a, row_a = (slot_a - 1) % 3, (slot_a - 1) // 3
+    col_b, row_b = (slot_b - 1) % 3, (slot_b - 1) // 3
+    return abs(col_a - col_b) + abs(row_a - row_b)
+
+
+class TipInventory:
+    # tips of one pipette, as one 96-bit bitmap per tip rack (bit i is tip well i, column order A1, B1, ...)
+    # loaded: tips placed in the rack (tips_in_lg_racks / tips_in_sm_racks)
+    # free:   loaded tips that are clean and not assigned to anyone
+    # Each sample or reservoir (owner) keeps its assigned tip: allocate() gives an owner its tip again
+    # (reuse) instead of a new one, return_tip() puts it back in its rack for later reuse, and
+    # discard() ends the ownership of a tip that should not be used again.
+    # policy 'first':      first free tip, racks in slot order
+    # policy 'near_plate': a tip in the rack closest (on deck) to the owner's slot, at the end of the
+    #                      rack facing that slot, so dedicated tips are close to their sample plate
+    # allow_refill: when all tips are taken, the racks count as refilled by the operator (refill()) and
+    # new tips are (slot, tip, generation), with generation 1, 2, ... forecast_tip_refills maps them back
+    # to rack positions, with the operator refills placed in idle gaps of the planned sequence.
+    RACK_SIZE = 96
+
+    def __init__(self, tips_in_racks, policy='first', allow_refill=False):
+        # tips_in_racks: ((slot_num, [tip well indices]), ...) as in user_config_exp
+        self.policy = policy
+        self.allow_refill = allow_refill
+        self.generation = 0  # number of refills planned by allocate()
+        self.slots = tuple(rack[0] for rack in tips_in_racks)  # rack slots, in rack order
+        self.rack_index = {self.slots[indx]: indx for indx in range(len(self.slots))}  # slot: rack index
+        self.loaded = {}  # slot: bitmap of the tips placed in the rack
+        for rack in tips_in_racks:
+            bits = 0
+            for tip in rack[1]:
+                if not 0 <= tip < self.RACK_SIZE:
+                    s_out = "Tip " + str(tip) + " in tip rack slot " + str(rack[0]) + " is outside 0-95"
+                    raise ValueError(s_out)
+                bits |= 1 << tip
+            self.loaded[rack[0]] = bits
+        self.free = dict(self.loaded)  # slot: bitmap of clean, unassigned tips
+        self.owner_tip = {}  # owner loc: (slot, tip)
+        self.tip_owner = {}  # (slot, tip): owner loc
+        self.in_rack = {}  # (slot, tip): True if the assigned tip is back in its rack
+        self._rack_order = {}  # owner slot: rack slots, closest first (near_plate policy)
+
+    # returns this when calling this object
+    def __repr__(self):
+        this_string = "TipInventory(" + str(len(self.slots)) + " racks, " + str(self.num_free()) + " free, " + \
+                      str(len(self.owner_tip)) + " assigned, policy " + str(self.policy) + ", " + \
+                      str(self.generation) + " refills)"
+        return this_string
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        return self.__repr__()
+
+    def is_loaded(self, tip_loc: (int, int)):
+        # True if this (slot, tip) was placed in a rack
+        return tip_loc[0] in self.loaded and 0 <= tip_loc[1] < self.RACK_SIZE and \
+            bool(self.loaded[tip_loc[0]] >> tip_loc[1] & 1)
+
+    def is_free(self, tip_loc: (int, int)):
+        return tip_loc[0] in self.free and bool(self.free[tip_loc[0]] >> tip_loc[1] & 1)
+
+    def num_free(self):
+        return sum(bin(bits).count('1') for bits in self.free.values())
+
+    def positions(self):
+        # all loaded (slot, tip), racks in slot order, tips in well order
+        tip_locs = []
+        for slot in self.slots:
+            bits = self.loaded[slot]
+            for tip in range(bits.bit_length()):
+                if bits >> tip & 1:
+                    tip_locs.append((slot, tip))
+        return tip_locs
+
+    def refill(self):
+        # the operator puts fresh tips in all loaded positions: the next tips are of a new generation
+        self.generation += 1
+        self.free = dict(self.loaded)
+
+    def _racks_for(self, near_slot):
+        # rack slots to take a new tip from, in order of preference
+        if self.policy != 'near_plate' or near_slot is None:
+            return self.slots
+        if near_slot not in self._rack_order:
+            self._rack_order[near_slot] = tuple(sorted(self.slots, key=lambda slot: (deck_distance(slot, near_slot),
+                                                                                     self.rack_index[slot])))
+        return self._rack_order[near_slot]
+
+    def _take(self, slot: int, near_slot):
+        # take a free tip from the rack in slot: the lowest tip well, or the highest when the owner's
+        # slot is to the right of the rack (wells run from left (A1) to right (H12) on the rack)
+        bits = self.free[slot]
+        if self.policy == 'near_plate' and near_slot is not None and (near_slot - 1) % 3 > (slot - 1) % 3:
+            tip = bits.bit_length() - 1
+        else:
+            tip = (bits & -bits).bit_length() - 1
+        self.free[slot] = bits & ~(1 << tip)
+        if self.generation > 0:
+            return slot, tip, self.generation
+        return slot, tip
+
+    def allocate(self, owner=None, near_slot=None):
+        # the tip of owner (reused), or a new free tip, assigned to owner if given
+        # near_slot: deck slot of the owner, for the 'near_plate' policy (defaults to the owner's slot)
+        if owner is not None and owner in self.owner_tip:
+            tip_loc = self.owner_tip[owner]
+            self.in_rack[tip_loc] = False
+            return tip_loc
+        if near_slot is None and owner is not None:
+            near_slot = owner[0]
+        if self.allow_refill and not any(self.free.values()) and any(self.loaded.values()):
+            self.refill()
+        for slot in self._racks_for(near_slot):
+            if self.free[slot]:
+                tip_loc = self._take(slot, near_slot)
+                if owner is not None:
+                    self.owner_tip[owner] = tip_loc
+                    self.tip_owner[tip_loc] = owner
+                    self.in_rack[tip_loc] = False
+                return tip_loc
+        s_out = "No free tips left in tip racks " + str(self.slots) + ". Please load more, update user_config_exp()."
+        raise ValueError(s_out)
+
+    def return_tip(self, tip_loc: (int, int)):
+        # tip put back in its rack well; it stays assigned to its owner, for reuse
+        if tip_loc in self.tip_owner:
+            self.in_rack[tip_loc] = True
+        elif self.is_loaded(tip_loc):
+            self.free[tip_loc[0]] |= 1 << tip_loc[1]  # unassigned (clean) tip, free again
+
+    def discard(self, tip_loc: (int, int)):
+        # the owner is done with this tip, it is not given out again
+        owner = self.tip_owner.pop(tip_loc, None)
+        if owner is not None:
+            del self.owner_tip[owner]
+        self.in_rack.pop(tip_loc, None)
+
+    def tip_of(self, owner):
+        # assigned tip of owner, or None
+        return self.owner_tip.get(owner)
+
+
 class ExperimentData:
     # need a way to save this metadata (MODIFY!!)
     def __init__(self):
@@ -101,6 +661,9 @@ class ExperimentData:
         self.which_tip_sm = 0  # index from available_tips_sm location list, used during planning
         self.cur_lg_tip = ()  # currently-loaded lg tip
         self.cur_sm_tip = ()  # currently-loaded sm tip
+        self.tip_policy = 'first'  # TipInventory policy: 'first' or 'near_plate'
+        self.tip_inventory_lg = None  # TipInventory of the large pipette tips, from calc_nums_exp
+        self.tip_inventory_sm = None  # TipInventory of the small pipette tips, from calc_nums_exp
         self.tips_used = []  # list of tips used (wet) during solution handling
         # where 0 is A1, 1 is B1....8 is A2,... 88 is A12, ... etc to 95 for a full set of tips
         # and each tuple within the nest corresponds to each rack, with first value slot_num
@@ -153,6 +716,36 @@ class ExperimentData:
         self._cur_waste = None  # eg: (1, 2)  # updated, as dig_vol or curr_vol is exceeded
         self._cur_rinse = None  # eg: (1, 0)  # updated, as dig_vol or curr_vol is depleted
 
+        # planning mode for create_exp_sequence: 'heuristic' or 'optimal'
+        # 'optimal' searches for a better schedule after the heuristic, within the time budget
+        self.plan_mode = 'heuristic'
+        self.plan_time_budget_s = 10  # seconds, max time for the 'optimal' search
+        self.incub_error_weight = 1.0  # cost of one second of incubation error vs one second of makespan
+        self.max_incub_error_s = 10  # seconds, incubation error allowed by the schedule certificate
+        # tip changes in run(): 'home' homes the pipette after each tip swap, 'no_home' does not
+        self.tip_swap_mode = 'no_home'
+        self.model_tip_swaps = True  # plan the time of each tip change, see ActionInfo.TIP_SWAP_TIME_S
+        self.num_tip_swaps = None  # tip changes in the planned sequence, from create_exp_sequence
+        self.batch_tips = True  # group actions with the same tip into runs, see batch_tip_runs
+        self.tip_batch_window_s = 120  # seconds, how much earlier batch_tip_runs may move an action
+        self.tip_batch_report = None  # TipBatchReport of the planned sequence, from create_exp_sequence
+        # more tips than the racks hold: plan operator refills of the tip racks, see forecast_tip_refills
+        self.allow_tip_refills = True
+        self.tip_refill_time_s = 120  # seconds, pause for the operator to refill the tip racks
+        self.max_run_time_m = None  # minutes, longest run the operator can attend (checked before planning), or None
+        self.tip_forecast = None  # TipForecast of the planned sequence, from create_exp_sequence
+        self.volume_ledger = None  # VolumeLedger of the planned sequence, from create_exp_sequence
+        self.plan_waste_rinse = True  # waste and rinse reservoir of each unload / rinse, see allocate_waste_rinse
+        self.waste_rinse_report = None  # WasteRinseReport of the planned sequence, from create_exp_sequence
+        self.plan_certificate = None  # ScheduleCertificate of the planned sequence, from create_exp_sequence
+        self.profile_planning = False  # True to time each planning stage, see PlanProfiler
+        self.profile_memory = True  # also record peak memory (tracemalloc) when profiling
+        self.plan_profile = None  # {stage name: StageStats} of the last profiled planning
+        self.use_plan_cache = True  # reuse the plan of an identical configuration, see plan_experiment
+        self.plan_key = None  # plan_config_key of this experiment, set by plan_experiment
+        self.plan_file = None  # path of a plan file (save_plan_file) to load, or to save the new plan to
+        self.preflight_report = None  # PreflightReport of the inputs, from plan_experiment
+
         self.do_dilutions = False
         self.start_dry = True
         self.store_dry = False
@@ -186,6 +779,8 @@ class ExperimentData:
         self.sam4_400uL_max_vol = 400  # uL (max volume of sample well-plate)
         self.sam4_400uL_label = 'Sam4Plate_'  # 4-well plate label
         # custom 8-well sample plate w/ 'A1','B1','A2','B2','A3','B3','A4','B4' wells
+        # (labware/usctrayfoam_8_wellplate_400ul.json is its Labware Creator export, as in
+        # test_usctrayfoam_8_wellplate_400ul.py)
         self.sam8_400uL_name = 'usctrayfoam_8_wellplate_400ul'
         self.sam8_400uL_max_vol = 400  # uL (max volume of sample well-plate)
         self.sam8_400uL_label = 'Sam8Plate_'  # 8-well plate label
@@ -200,8 +795,21 @@ class ExperimentData:
         self.pipette_sm_name = 'p20_single_gen2'
         self.pipette_lg_loc = 'left'  # pipette hardware mounted on the left
         self.pipette_sm_loc = 'right'  # pipette hardware mounted on the right
-
-        self.planned_sequence: list[ActionInfo] = []  # in seconds
+        self.pipette_lg_range_ul = (100, 1000)  # uL, (min, max) volume of one large pipette transfer
+        self.pipette_sm_range_ul = (1, 20)  # uL, (min, max) volume of one small pipette transfer
+
+        # location indices for all_samples, all_res_data, res_plate_wells and sam_plate_wells,
+        # (slot, well): (rack_indx, well_indx) and slot: rack_indx, built when first needed
+        self._sam_index = None
+        self._res_index = None
+        self._res_rack_index = None
+        self._sam_rack_index = None
+        self._index_shapes = {}  # index name: nested_shape (or length) of the list when it was indexed
+        # keeper: rank in incub_loc_order, rebuilt when incub_loc_order is replaced
+        self._load_rank = None
+        self._load_rank_order = None
+        self._planned_sequence: list[ActionInfo] = []  # in seconds
+        self.plan_table = None  # ActionTable of the planned sequence, when loaded from a plan file
         self.pln_seq_stamps: list[ActionInfo] = []  # in seconds
         self.pln_dilut_seq: list[ActionInfo] = []  # in seconds
         # where each tuple is (sample_index, action, start_time_s, end_time_s)
@@ -220,12 +828,84 @@ class ExperimentData:
         this_string = "ExperimentData(" + str(self.exp_name) + ")"
         return this_string
 
+    # nested lists of wells and lists of racks, the location indices are rebuilt when they are replaced
+    @property
+    def all_samples(self):
+        return self._all_samples
+
+    @all_samples.setter
+    def all_samples(self, sam_list):
+        self._all_samples = sam_list
+        self._sam_index = None
+
+    @property
+    def all_res_data(self):
+        return self._all_res_data
+
+    @all_res_data.setter
+    def all_res_data(self, res_list):
+        self._all_res_data = res_list
+        self._res_index = None
+
+    @property
+    def res_plate_wells(self):
+        return self._res_plate_wells
+
+    @res_plate_wells.setter
+    def res_plate_wells(self, rack_list):
+        self._res_plate_wells = rack_list
+        self._res_rack_index = None
+
+    @property
+    def sam_plate_wells(self):
+        return self._sam_plate_wells
+
+    @sam_plate_wells.setter
+    def sam_plate_wells(self, rack_list):
+        self._sam_plate_wells = rack_list
+        self._sam_rack_index = None
+
+    @property
+    def planned_sequence(self):
+        # list of planned actions; a plan loaded from a plan file is only kept as an ActionTable
+        # (memory-mapped), and the ActionInfo objects are made the first time they are needed
+        if self._planned_sequence is None:
+            self._planned_sequence = self.plan_table.to_actions()
+        return self._planned_sequence
+
+    @planned_sequence.setter
+    def planned_sequence(self, exp_sequence):
+        self._planned_sequence = exp_sequence
+        self.plan_table = None  # the table is for the old sequence
+
+    def index_locations(self):
+        # (re)build the location indices, eg: after set_up_res_sam_data
+        self._sam_index = index_nested_locs(self._all_samples)
+        self._res_index = index_nested_locs(self._all_res_data)
+        self._res_rack_index = index_rack_slots(self._res_plate_wells)
+        self._sam_rack_index = index_rack_slots(self._sam_plate_wells)
+        self._index_shapes = {'sam': nested_shape(self._all_samples), 'res': nested_shape(self._all_res_data),
+                              'res_rack': len(self._res_plate_wells), 'sam_rack': len(self._sam_plate_wells)}
+
     def find_sam_in_nest_list(self, loc: (int, int), sam_list=None):
         # for the sample with given location (loc) = (plate_indx, well_indx)
         # finds the nested indices (#,#) in the list, sam_list
-        # if nested list is not specified, using self.all_samples
-        if sam_list is None:
-            sam_list = self.all_samples
+        # if nested list is not specified, using self.all_samples (hash index, O(1))
+        if sam_list is None or sam_list is self._all_samples:
+            if self._sam_index is not None:
+                indices = self._sam_index.get(loc)
+                if indices is not None and nested_loc_at(self._all_samples, indices) == loc:
+                    return indices
+                # a miss, and the list has the same size as when it was indexed: not in it, no rebuild
+                if indices is None and self._index_shapes.get('sam') == nested_shape(self._all_samples):
+                    s_out = "Loc " + str(loc) + " is not in this nested list of samples!"
+                    raise ValueError(s_out)
+            self._sam_index = index_nested_locs(self._all_samples)  # new or stale index, eg: edited in place
+            self._index_shapes['sam'] = nested_shape(self._all_samples)
+            if loc in self._sam_index:
+                return self._sam_index[loc]
+            s_out = "Loc " + str(loc) + " is not in this nested list of samples!"
+            raise ValueError(s_out)
         main_list_length = len(sam_list)
         for rack_indx in range(main_list_length):
             sub_list = sam_list[rack_indx]
@@ -241,9 +921,22 @@ class ExperimentData:
     def find_res_in_nest_list(self, loc: (int, int), res_list=None):
         # for the reservoir with given location (loc) = (plate_indx, well_indx)
         # finds the nested indices (#,#) in the list, res_list
-        # if nested list is not specified, using self.all_res_data
-        if res_list is None:
-            res_list = self.all_res_data
+        # if nested list is not specified, using self.all_res_data (hash index, O(1))
+        if res_list is None or res_list is self._all_res_data:
+            if self._res_index is not None:
+                indices = self._res_index.get(loc)
+                if indices is not None and nested_loc_at(self._all_res_data, indices) == loc:
+                    return indices
+                # a miss, and the list has the same size as when it was indexed: not in it, no rebuild
+                if indices is None and self._index_shapes.get('res') == nested_shape(self._all_res_data):
+                    s_out = "Loc " + str(loc) + " is not in this nested list of reservoirs!"
+                    raise ValueError(s_out)
+            self._res_index = index_nested_locs(self._all_res_data)  # new or stale index, eg: edited in place
+            self._index_shapes['res'] = nested_shape(self._all_res_data)
+            if loc in self._res_index:
+                return self._res_index[loc]
+            s_out = "Loc " + str(loc) + " is not in this nested list of reservoirs!"
+            raise ValueError(s_out)
         main_list_length = len(res_list)
         for rack_indx in range(main_list_length):
             sub_list = res_list[rack_indx]
@@ -259,9 +952,22 @@ class ExperimentData:
     def find_rack_in_res_plates(self, slot_num: int, rack_list=None):
         # for rack with given slot number,
         # finds the index in the list of racks,
-        # if list not specified, using self.res_plate_wells
-        if rack_list is None:
-            rack_list = self.res_plate_wells
+        # if list not specified, using self.res_plate_wells (hash index, O(1))
+        if rack_list is None or rack_list is self._res_plate_wells:
+            if self._res_rack_index is not None:
+                indx = self._res_rack_index.get(slot_num)
+                if indx is not None and rack_slot_at(self._res_plate_wells, indx) == slot_num:
+                    return indx
+                # a miss, and the list has the same size as when it was indexed: not in it, no rebuild
+                if indx is None and self._index_shapes.get('res_rack') == len(self._res_plate_wells):
+                    s_out = "Slot # " + str(slot_num) + " is not in this list of reservoirs!"
+                    raise ValueError(s_out)
+            self._res_rack_index = index_rack_slots(self._res_plate_wells)  # new or stale index
+            self._index_shapes['res_rack'] = len(self._res_plate_wells)
+            if slot_num in self._res_rack_index:
+                return self._res_rack_index[slot_num]
+            s_out = "Slot # " + str(slot_num) + " is not in this list of reservoirs!"
+            raise ValueError(s_out)
         list_length = len(rack_list)
         for indx in range(list_length):
             rack = rack_list[indx]
@@ -273,9 +979,22 @@ class ExperimentData:
     def find_rack_in_sam_plates(self, slot_num: int, rack_list=None):
         # for rack with given slot number,
         # finds the index in the list of racks,
-        # if list not specified, using self.sam_plate_wells
-        if rack_list is None:
-            rack_list = self.sam_plate_wells
+        # if list not specified, using self.sam_plate_wells (hash index, O(1))
+        if rack_list is None or rack_list is self._sam_plate_wells:
+            if self._sam_rack_index is not None:
+                indx = self._sam_rack_index.get(slot_num)
+                if indx is not None and rack_slot_at(self._sam_plate_wells, indx) == slot_num:
+                    return indx
+                # a miss, and the list has the same size as when it was indexed: not in it, no rebuild
+                if indx is None and self._index_shapes.get('sam_rack') == len(self._sam_plate_wells):
+                    s_out = "Slot # " + str(slot_num) + " is not in this list of reservoirs!"
+                    raise ValueError(s_out)
+            self._sam_rack_index = index_rack_slots(self._sam_plate_wells)  # new or stale index
+            self._index_shapes['sam_rack'] = len(self._sam_plate_wells)
+            if slot_num in self._sam_rack_index:
+                return self._sam_rack_index[slot_num]
+            s_out = "Slot # " + str(slot_num) + " is not in this list of reservoirs!"
+            raise ValueError(s_out)
         list_length = len(rack_list)
         for indx in range(list_length):
             rack = rack_list[indx]
@@ -293,7 +1012,7 @@ class ExperimentData:
             if self.which_tip_sm >= self.tot_num_sm_tips:
                 str_out = "Small pipette has insufficient tips. " \
                           "Please load more, update user_config_exp() and restart."
-                print(str_out)
+                logger.error("%s", str_out)
                 raise StopExecution
             new_tip = self.available_tips_sm[self.which_tip_sm]
         else:
@@ -302,11 +1021,83 @@ class ExperimentData:
             if self.which_tip_lg >= self.tot_num_lg_tips:
                 str_out = "Large pipette has insufficient tips. " \
                           "Please load more, update user_config_exp() and restart."
-                print(str_out)
+                logger.error("%s", str_out)
                 raise StopExecution
             new_tip = self.available_tips_lg[self.which_tip_lg]
         return new_tip
 
+    def needs_dilutions(self):
+        # True if a solution reservoir in input_res_data ends at another concentration than it starts,
+        # the rule calc_nums_exp sets do_dilutions with, usable before calc_nums_exp
+        for in_res in self.input_res_data:
+            res_loc = (in_res[0][0], in_res[0][1])
+            if res_loc in self.waste_res_locs or res_loc in self.rinse_res_locs:
+                continue
+            if in_res[1][1] != in_res[2][1]:
+                return True
+        return False
+
+    def route_pipette(self, transf_vol):
+        # pipette for a transfer (or mix) of transf_vol uL: with 'both', volumes within the small pipette's
+        # range, and volumes between its max and the large pipette's min (split by transfer_steps), go to 'small'
+        if self.pipettes_in_use == 'both':
+            if transf_vol <= self.pipette_sm_range_ul[1] or transf_vol < self.pipette_lg_range_ul[0]:
+                return 'small'
+            return 'large'
+        elif self.pipettes_in_use == 'small':
+            return 'small'
+        return 'large'
+
+    def transfer_steps(self, transf_vol, which_pip: str):
+        # volumes of the transfers that move transf_vol uL with which_pip: a single transfer for the large pipette,
+        # ceil(transf_vol / max) equal transfers of at most pipette_sm_range_ul[1] uL for the small pipette
+        if which_pip != 'small' or transf_vol <= self.pipette_sm_range_ul[1]:
+            return [transf_vol]
+        num_steps = math.ceil(transf_vol / self.pipette_sm_range_ul[1])
+        return [transf_vol / num_steps] * num_steps
+
+    @property
+    def sample_pipette(self):
+        # pipette of the sample actions (load, reload, mix, unload, rinse) and the reservoir tips:
+        # the large pipette, unless only the small one is loaded
+        if self.pipettes_in_use == 'small':
+            return 'small'
+        return 'large'
+
+    @property
+    def transfer_step_ul(self):
+        # smallest volume step the planned transfers can take: multiples of the large pipette's minimum
+        # (100 uL) with only the large pipette, any whole uL when the small pipette is in use
+        if self.pipettes_in_use == 'large':
+            return self.pipette_lg_range_ul[0]
+        return 1
+
+    @property
+    def tip_swap_s(self):
+        # planned time (s) of one tip change, 0 if tip changes are not planned
+        if not self.model_tip_swaps:
+            return 0
+        if self.tip_swap_mode not in ActionInfo.TIP_SWAP_TIME_S:
+            s_out = "Unknown tip_swap_mode: " + str(self.tip_swap_mode) + ", use one of " + \
+                    str(tuple(ActionInfo.TIP_SWAP_TIME_S))
+            raise ValueError(s_out)
+        return ActionInfo.TIP_SWAP_TIME_S[self.tip_swap_mode]
+
+    def assign_tip(self, owner: (int, int), which_pip: str = 'large'):
+        # tip assigned to a sample or reservoir (owner loc): its earlier tip, or a new one from the inventory
+        if which_pip == 'small':
+            inventory = self.tip_inventory_sm
+        else:
+            inventory = self.tip_inventory_lg
+        if inventory is None:
+            s_out = "No tip inventory for the " + str(which_pip) + " pipette, run calc_nums_exp first."
+            raise ValueError(s_out)
+        try:
+            return inventory.allocate(owner)
+        except ValueError as err:
+            logger.warning("%s pipette has insufficient tips. %s", which_pip.capitalize(), err)
+            raise StopExecution
+
     def give_rinse_loc(self, pull_vol: int = 0):
         if self._cur_rinse is None:
             # if current rinse not assigned, select the first location
@@ -319,11 +1110,11 @@ class ExperimentData:
         goal_vol = dig_vol - pull_vol
         if goal_vol < 1000:
             # less than a mL remaining in Rinse with this step, switch to next Rinse res!
-            print("Digital volume depleted, switching to next Rinse reservoir.")
+            logger.info("Digital volume depleted, switching to next Rinse reservoir.")
             indx = self.rinse_res_locs.index(res_loc)
             indx += 1
-            if indx >= self.tot_num_waste:
-                str_out = "WARNING: experiment does not have sufficient waste containers. " \
+            if indx >= self.tot_num_rinse:
+                str_out = "Experiment does not have sufficient rinse containers. " \
                           "Load more and restart planning phase. "
                 raise ValueError(str_out)
             self._cur_rinse = self.rinse_res_locs[indx]  # updating current rinse location
@@ -342,50 +1133,52 @@ class ExperimentData:
         max_vol = res.max_vol - 1000  # max vol less 1000uL
         if goal_vol > max_vol:
             # less than a mL of headspace remaining, switching to next Waste res!
-            print("Digital volume exceeded, switching to next Waste reservoir.")
+            logger.info("Digital volume exceeded, switching to next Waste reservoir.")
             indx = self.waste_res_locs.index(res_loc)
             indx += 1
             if indx >= self.tot_num_waste:
-                str_out = "WARNING: experiment does not have sufficient waste containers. " \
+                str_out = "Experiment does not have sufficient waste containers. " \
                           "Load more and restart planning phase. "
                 raise ValueError(str_out)
             self._cur_waste = self.waste_res_locs[indx]
         return self._cur_waste
 
+    @property
+    def load_rank(self):
+        # {sample loc: position in incub_loc_order}, the order actions of the same type run in
+        if self._load_rank is None or self._load_rank_order is not self.incub_loc_order:
+            self._load_rank = find_load_rank(self.incub_loc_order)
+            self._load_rank_order = self.incub_loc_order
+        return self._load_rank
+
+    def builtin_labware(self):
+        # {name: (max_vol, label)} for the labware set up in __init__,
+        # used when a name has no JSON definition in the labware folder
+        return {self.res3_60mL_name: (self.res3_60mL_max_vol, self.res3_60mL_label),
+                self.res4_32mL_name: (self.res4_32mL_max_vol, self.res4_32mL_label),
+                self.res6_20mL_name: (self.res6_20mL_max_vol, self.res6_20mL_label),
+                self.res6_40mL_name: (self.res6_40mL_max_vol, self.res6_40mL_label),
+                self.sam4_400uL_name: (self.sam4_400uL_max_vol, self.sam4_400uL_label),
+                self.sam8_400uL_name: (self.sam8_400uL_max_vol, self.sam8_400uL_label)}
+
     def find_max_res_vol(self, this_name: str):
-        volume = 0
-        if this_name == self.res3_60mL_name:
-            volume = self.res3_60mL_max_vol
-        elif this_name == self.res4_32mL_name:
-            volume = self.res4_32mL_max_vol
-        elif this_name == self.res6_20mL_name:
-            volume = self.res6_20mL_max_vol
-        elif this_name == self.res6_40mL_name:
-            volume = self.res6_40mL_max_vol
-        elif this_name == self.sam4_400uL_name:
-            volume = self.sam4_400uL_max_vol
-        elif this_name == self.sam8_400uL_name:
-            volume = self.sam8_400uL_max_vol
-        return volume
+        # max volume (uL) of the wells in this labware, from its definition in the labware folder
+        this_def = labware_registry().get(this_name)
+        if this_def is not None:
+            return this_def.max_vol
+        return self.builtin_labware().get(this_name, (0, 'no_label_'))[0]
 
     def find_label(self, this_name: str):
-        this_label = 'no_label_'
-        if this_name == self.res3_60mL_name:
-            this_label = self.res3_60mL_label
-        elif this_name == self.res4_32mL_name:
-            this_label = self.res4_32mL_label
-        elif this_name == self.res6_20mL_name:
-            this_label = self.res6_20mL_label
-        elif this_name == self.res6_40mL_name:
-            this_label = self.res6_40mL_label
-        elif this_name == self.sam4_400uL_name:
-            this_label = self.sam4_400uL_label
-        elif this_name == self.sam8_400uL_name:
-            this_label = self.sam8_400uL_label
-        return this_label
+        # rack label prefix for this labware, eg: 'Res3_60mL_'
+        this_def = labware_registry().get(this_name)
+        if this_def is not None:
+            return this_def.label
+        return self.builtin_labware().get(this_name, (0, 'no_label_'))[1]
 
 
 class RackData:
+    __slots__ = ('slot', 'type', 'offset', 'name', 'label', 'max_vol', 'num_wells', 'well_ids')
+
     def __init__(self, slot_num: int, res_type: str):
         self.slot = slot_num  # slot_# on OT-2 Deck (slots 1-11)
         self.type = res_type  # 'res' or 'sam'
@@ -412,6 +1205,10 @@ class RackData:
 
 
 class ResWellData:
+    __slots__ = ('loc', 'slot_num', 'well_id', 'assigned_tip', 'contents', 'curr_conc', 'goal_conc',
+                 'curr_vol', 'goal_vol', 'dig_vol', 'max_vol', 'dilution_complete',
+                 'parent_loc', 'parent_conc', 'par_transf_vol')
+
     def __init__(self):
         self.loc = (1, 0)  # (Slot_#, Well_#), location of this reservoir
         self.slot_num = 0  # Slot_# for this reservoir's rack, 1-11 on OT2 Deck
@@ -451,6 +1248,15 @@ class ResWellData:
 class SamWellData:
     # need a way to save this metadata (MODIFY!!)
     # may want to switch to getters/setters/properties
+    __slots__ = ('sample_name', 'loc', 'slot_num', 'well_id', 'assigned_tip',
+                 'targ_incub_time_m', 'targ_incub_time_s', 'targ_num_mixes', 'targ_num_rinses',
+                 'targ_num_reload', 'rinsed_num', 'mixed_num', 'reloaded_num',
+                 'max_vol', 'dig_vol', 'cur_vol', 'start_dry', 'store_dry',
+                 'sam_inoculation_timing', 'num_inoc_sol', 'inoc_locs', 'inoc_fracs', 'incub_sols', 'incub_conc',
+                 'incub_st_timestmp', 'incub_end_timestmp', 'incub_reload_timestmps', 'incub_mix_timestmps',
+                 'rinse_timestmps', 'incub_tot_time_s', 'incub_mix_time_s', 'incub_rinse_time_s',
+                 'targ_act_seq', 'pln_seq_stamps')
+
     def __init__(self):
         self.sample_name = "USC22Blnk1118a"  # name on the QR-coded label of the sample
         self.loc = (3, 0)  # (plate_indx, well_indx) # tuple has to be replaced, not edited
@@ -488,8 +1294,8 @@ class SamWellData:
         self.incub_tot_time_s = 15  # integer, in seconds
         self.incub_mix_time_s = []  # eg: [100, 200, ]  # integer, in seconds
         self.incub_rinse_time_s = []  # eg: [100, 200, ]  # integer, in seconds
-        self.targ_act_seq = List[ActionInfo]  # action list for each sample
-        self.pln_seq_stamps = List[ActionInfo]  # action list with shifted timestamps
+        self.targ_act_seq: List[ActionInfo] = []  # action list for each sample
+        self.pln_seq_stamps: List[ActionInfo] = []  # action list with shifted timestamps
         # where each action is of the class:
         # ActClass(keeper_loc, 'action', start_time_s,
         #           parent_loc, targ_loc, transf_vol,
@@ -508,16 +1314,23 @@ class SamWellData:
 
 
 class ActionInfo:
+    # est. time, in seconds, for each action type, shared by all actions:
+    # 'transf' and 'mix' SIMPLE actions, 'load' COMPLEX action
+    ACTION_TIME_S = {'transf': 20, 'mix': 20, 'load': 40}
+    OTHER_ACTION_TIME_S = 60  # est. time (s) for 'reload' or 'rinse' or 'unload' COMPLEX actions
+    # est. time (s) to return the mounted tip and pick up the action's tip, by ExperimentData.tip_swap_mode
+    # 'home' also homes the pipette after each swap
+    TIP_SWAP_TIME_S = {'home': 25, 'no_home': 10}
+    __slots__ = ('_keeper', '_action', '_top_act', '_order_num', '_complex', '_start_stamp', '_end_stamp',
+                 '_tip_loc', '_from_loc', '_targ_loc', '_transf_vol', '_num_mixes', '_swap_s', '_pipette',
+                 '_rinse_loc', '_waste_loc', '_rinse_vol')
+
     def __init__(self, keeper: (int, int), sub_action: str, top_action: str,
                  order_num: int, start_time_s: int,
                  parent=(1, 0), targ=(1, 0), vol=0, tip=(11, 0),
                  num_mixes=3, is_complex=True):
         # par = from loc, targ = to loc, tip loc, vol, and is_complex are optional parameters
         # initializing function, _attribute is a hidden attribute!
-        self._transf_time_s = 20  # est. time, in seconds, for 'transfer' SIMPLE action
-        self._mix_time_s = 20  # est. time, in seconds, for 'mix' SIMPLE action
-        self._load_time_s = 40  # est. time, in seconds, for 'load' COMPLEX action
-        self._rinse_time_s = 60  # est. time (s) for 'reload' or 'rinse' or 'unload' COMPLEX actions
         self._keeper = keeper  # (rack_num, well_id)  # action belongs to 'keeper'
         # independent of from_loc and to_loc
         self._action = sub_action  # complex or simple action string
@@ -529,18 +1342,24 @@ class ActionInfo:
         self._complex = is_complex  # set to True whe complex actions are expanded to simple ones
         # complex actions can be swapped, but simple are expanded and cannot be swapped
         self._start_stamp = start_time_s  # integer of start timestamp (seconds) for the desired action
+        self._swap_s = 0  # time (s) for a tip change at the start of the action, 0 if the mounted tip is used
         self._end_stamp = self._calc_end()  # calculated, estimated end timestamp
-        self._time_stamp = (self._start_stamp, self._end_stamp)  # timestamp
         self._tip_loc = tip  # tip_loc (rack_slot,well_loc) - for SIMPLE actions
         self._from_loc = parent  # parent location, transfer 'from' (rack_slot,well_loc)
         self._targ_loc = targ  # target location, transfer 'to' (rack_slot,well_loc)
         self._transf_vol = vol  # uL target transfer amount from_loc to targ_loc
         self._num_mixes = num_mixes  # number of mixes for each SIMPLE 'mix' action,
         # or for the 'mix' in a COMPLEX action
+        self._pipette = 'large'  # pipette (mount) of the action, 'large' or 'small', see route_pipette
+        # 'unload' and 'rinse': rinse and waste reservoirs set by allocate_waste_rinse (None if not allocated),
+        # and the uL of rinse liquid moved from rinse_loc through the sample into waste_loc
+        self._rinse_loc = None
+        self._waste_loc = None
+        self._rinse_vol = 0
 
     # returns this when calling this object
     def __repr__(self):
-        this_string = "(" + str(self._time_stamp) + ", '" + \
+        this_string = "(" + str(self.stamp) + ", '" + \
                       str(self.action) + "', from:" + str(self._from_loc) + \
                       ", to:" + str(self._targ_loc) + ", vol:" + str(self._transf_vol) + \
                       ", tip: " + str(self._tip_loc) + ")"
@@ -548,27 +1367,51 @@ class ActionInfo:
 
     # returns this string when called via print(x)
     def __str__(self):
-        this_string = "(" + str(self._time_stamp) + ", '" + \
+        this_string = "(" + str(self.stamp) + ", '" + \
                       str(self.action) + "', from:" + str(self._from_loc) + \
                       ", to:" + str(self._targ_loc) + ", vol:" + str(self._transf_vol) + \
                       ", tip: " + str(self._tip_loc) + ")"
         return this_string
 
+    def __deepcopy__(self, memo):
+        # attributes are ints, strings and location tuples (immutable), so copying each slot is enough
+        new_action = ActionInfo.__new__(ActionInfo)
+        for name in ActionInfo.__slots__:
+            setattr(new_action, name, getattr(self, name))
+        memo[id(self)] = new_action
+        return new_action
+
     # setter methods
     def change_start(self, new_start: int):
         self._start_stamp = new_start
         self._end_stamp = self._calc_end()
-        self._time_stamp = (self._start_stamp, self._end_stamp)
 
     def change_tip(self, set_tip: (int, int)):
         self._tip_loc = set_tip
 
+    def set_pipette(self, which_pip: str):
+        self._pipette = which_pip
+
+    def set_tip_swap(self, swap_s: int):
+        # time of the tip change before this action (same start, the end moves)
+        self._swap_s = swap_s
+        self._end_stamp = self._calc_end()
+
     def set_targ(self, targ_loc: (int, int)):
         self._targ_loc = targ_loc
 
     def set_parent(self, par_loc: (int, int)):
         self._from_loc = par_loc
 
+    def set_vol(self, transf_vol):
+        self._transf_vol = transf_vol
+
+    def set_rinse_waste(self, rinse_loc: (int, int), waste_loc: (int, int), rinse_vol):
+        # reservoirs of the rinse, rinse_loc and waste_loc may be the same (shared) well
+        self._rinse_loc = rinse_loc
+        self._waste_loc = waste_loc
+        self._rinse_vol = rinse_vol
+
     def set_num_mixes(self, num_mixes: int):
         self._num_mixes = num_mixes
 
@@ -584,6 +1427,14 @@ class ActionInfo:
     def action(self):
         return self._action
 
+    @property
+    def top_act(self):
+        return self._top_act
+
+    @property
+    def order_num(self):
+        return self._order_num
+
     @property
     def complex(self):
         return self._complex
@@ -598,7 +1449,7 @@ class ActionInfo:
 
     @property
     def stamp(self):
-        return self._time_stamp
+        return self._start_stamp, self._end_stamp  # timestamp
 
     @property
     def num_mixes(self):
@@ -616,6 +1467,30 @@ class ActionInfo:
     def tip_loc(self):
         return self._tip_loc
 
+    @property
+    def transf_vol(self):
+        return self._transf_vol
+
+    @property
+    def rinse_loc(self):
+        return self._rinse_loc
+
+    @property
+    def waste_loc(self):
+        return self._waste_loc
+
+    @property
+    def rinse_vol(self):
+        return self._rinse_vol
+
+    @property
+    def tip_swap_s(self):
+        return self._swap_s
+
+    @property
+    def pipette(self):
+        return self._pipette
+
     @property
     def length(self):
         time2complete = self._end_stamp - self._start_stamp
@@ -623,18 +1498,1022 @@ class ActionInfo:
 
     # other functions
     def _calc_end(self):
-        # MODIFY: check that global variables are defined.
-        if self.action == 'mix':
-            prev_end_stamp = self._start_stamp + self._mix_time_s
-        elif self.action == 'transf':
-            prev_end_stamp = self._start_stamp + self._transf_time_s
-        elif self.action == 'load':
-            prev_end_stamp = self._start_stamp + self._load_time_s
-        else:
-            prev_end_stamp = self._start_stamp + self._rinse_time_s
+        # est. end timestamp, from the action time table
+        prev_end_stamp = self._start_stamp + self._swap_s + \
+            self.ACTION_TIME_S.get(self._action, self.OTHER_ACTION_TIME_S)
         return prev_end_stamp
 
 
+class ActionSequence:
+    # list of ActionInfo objects that is edited in place by the scheduler passes
+    # each edit made inside a transaction (begin) is written to an undo log,
+    # so a pass can commit its changes or roll them back without a deepcopy.
+    # Transactions can be nested, the log is cleared when the outer one commits.
+    # The sequence also indexes its actions by keeper (sample) and by load order,
+    # so shifting one sample's timeline only touches the actions of that sample.
+    def __init__(self, actions=None):
+        if actions is None:
+            actions = []
+        elif not isinstance(actions, list):
+            actions = list(actions)
+        self._actions = actions  # alias to the list of actions, not a copy
+        self._undo_log = []  # ('start', action, old_start), ('set', pos, old_action), ('order', old_list)
+        self._marks = []  # length of _undo_log when each open transaction began
+        # indices, built when first needed (None means rebuild)
+        self._by_keeper = None  # keeper: list of its actions, independent of the order
+        self._pos = None  # action: position in the sequence
+        self._load_order = None  # (position, keeper) of each 'load' action, in sequence order
+        self._load_pos = None  # keeper: index in _load_order of its first 'load'
+
+    # returns this when calling this object
+    def __repr__(self):
+        return repr(self._actions)
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        return str(self._actions)
+
+    def __len__(self):
+        return len(self._actions)
+
+    def __iter__(self):
+        return iter(self._actions)
+
+    def __getitem__(self, pos):
+        return self._actions[pos]
+
+    def __setitem__(self, pos: int, new_action: ActionInfo):
+        if self._marks:
+            self._undo_log.append(('set', pos, self._actions[pos]))
+        self._actions[pos] = new_action
+        if self._pos is not None and new_action in self._pos:
+            self._pos[new_action] = pos  # action moved within the sequence, eg: swap_actions
+            if new_action.action == 'load':
+                self._load_order = None  # a load moved, rebuild the load order when needed
+        else:
+            self._clear_index()  # a new action, rebuild the indices when needed
+
+    def __add__(self, other):
+        return ActionSequence(self._actions + list(other))
+
+    @property
+    def in_transaction(self):
+        return len(self._marks) > 0
+
+    def to_list(self):
+        return list(self._actions)
+
+    def begin(self):
+        # start a transaction, edits from here on can be rolled back
+        self._marks.append(len(self._undo_log))
+
+    def commit(self):
+        # keep the edits since the last begin()
+        self._marks.pop()
+        if not self._marks:
+            self._undo_log = []  # no open transactions, nothing left to undo
+
+    def rollback(self):
+        # undo the edits since the last begin(), newest first
+        mark = self._marks.pop()
+        while len(self._undo_log) > mark:
+            entry = self._undo_log.pop()
+            if entry[0] == 'start':
+                entry[1].change_start(entry[2])
+            elif entry[0] == 'set':
+                self._actions[entry[1]] = entry[2]
+            elif entry[0] == 'order':
+                self._actions[:] = entry[1]
+        self._clear_index()
+
+    def change_start(self, this_action: ActionInfo, new_start: int):
+        # change the start timestamp of an action in this sequence
+        if self._marks:
+            self._undo_log.append(('start', this_action, this_action.start))
+        this_action.change_start(new_start)
+
+    def reorder(self, new_order: List[ActionInfo]):
+        # replace the order of the actions with new_order (same actions)
+        if self._marks:
+            self._undo_log.append(('order', list(self._actions)))
+        self._actions[:] = new_order
+        self._pos = None
+        self._load_order = None
+
+    def sort(self, key=None, reverse=False):
+        if self._marks:
+            self._undo_log.append(('order', list(self._actions)))
+        self._actions.sort(key=key, reverse=reverse)
+        self._pos = None
+        self._load_order = None
+
+    # indices by keeper and by load order
+    def _clear_index(self):
+        self._by_keeper = None
+        self._pos = None
+        self._load_order = None
+        self._load_pos = None
+
+    def _keeper_index(self):
+        if self._by_keeper is None:
+            self._by_keeper = {}
+            for this_action in self._actions:
+                self._by_keeper.setdefault(this_action.keeper, []).append(this_action)
+        return self._by_keeper
+
+    def _pos_index(self):
+        if self._pos is None:
+            self._pos = {}
+            for pos in range(len(self._actions)):
+                self._pos[self._actions[pos]] = pos
+        return self._pos
+
+    def _load_index(self):
+        # (position, keeper) of each 'load' action, in sequence order (start times do not change it)
+        if self._load_order is None:
+            self._load_order = []
+            self._load_pos = {}
+            for pos in range(len(self._actions)):
+                this_action = self._actions[pos]
+                if this_action.action == 'load':
+                    self._load_pos.setdefault(this_action.keeper, len(self._load_order))
+                    self._load_order.append((pos, this_action.keeper))
+        return self._load_order
+
+    def actions_of(self, keeper):
+        # list of the actions that belong to keeper (not in sequence order)
+        return self._keeper_index().get(keeper, [])
+
+    def position_of(self, this_action: ActionInfo):
+        return self._pos_index()[this_action]
+
+    def find_action(self, action: str, keeper):
+        # position of the first 'action' for keeper in the sequence, or None
+        pos_of = self._pos_index()
+        found = None
+        for this_action in self.actions_of(keeper):
+            if this_action.action == action:
+                pos = pos_of[this_action]
+                if found is None or pos < found:
+                    found = pos
+        return found
+
+    def loaded_after(self, keeper):
+        # keepers with a 'load' at or after the first 'load' of keeper in the sequence (including keeper),
+        # in sequence order; with several inoculations, a keeper is listed if any of its loads comes after
+        load_order = self._load_index()
+        if keeper not in self._load_pos:
+            return []  # keeper is not loaded in this sequence
+        keepers = []
+        listed = set()
+        for indx in range(self._load_pos[keeper], len(load_order)):
+            this_keeper = load_order[indx][1]
+            if this_keeper not in listed:
+                listed.add(this_keeper)
+                keepers.append(this_keeper)
+        return keepers
+
+    def shift_keepers(self, keepers, shift_time: int, action=None, from_start=None):
+        # shift the actions of each keeper by shift_time, or only its actions of
+        # type 'action' that start at or after from_start (if given)
+        # the positions do not change, so the indices stay valid
+        for keeper in keepers:
+            for this_action in self.actions_of(keeper):
+                if action is not None and this_action.action != action:
+                    continue
+                if from_start is not None and this_action.start < from_start:
+                    continue
+                if self._marks:
+                    self._undo_log.append(('start', this_action, this_action.start))
+                this_action.change_start(this_action.start + shift_time)
+
+
+def as_action_sequence(exp_sequence):
+    # wraps a list of actions in an ActionSequence (without copying), if it isn't one
+    if isinstance(exp_sequence, ActionSequence):
+        return exp_sequence
+    return ActionSequence(exp_sequence)
+
+
+class ActionTable:
+    # columnar (struct of arrays) copy of a planned sequence, one NumPy array per attribute:
+    # start, end, keeper, action, top action, order number, parent loc, target loc, tip, volume,
+    # number of mixes, is_complex, tip swap time, pipette and the allocated rinse/waste reservoirs.
+    # Keepers, locations, tips, action names and pipettes are stored as integer codes into the lookup
+    # lists below, so a thousand-action plan is a few small arrays.
+    # Overlap checks and time shifts are vectorized, and ActionInfo objects (views) are only
+    # created when they are needed, eg: by run_sequence with action_at(pos).
+    # one fixed-width record per action in a plan file (little-endian, 72 bytes)
+    RECORD_DTYPE = np.dtype([('start', '<i8'), ('end', '<i8'), ('vol', '<f8'), ('rinse_vol', '<f8'),
+                             ('keeper', '<i4'), ('order_num', '<i4'), ('par_loc', '<i4'), ('targ_loc', '<i4'),
+                             ('tip_loc', '<i4'), ('rinse_loc', '<i4'), ('waste_loc', '<i4'),
+                             ('num_mixes', '<i2'), ('swap_s', '<i2'), ('action', 'i1'), ('top_act', 'i1'),
+                             ('pipette', 'i1'), ('complex', '?'), ('_pad', 'V4')])
+    COLUMNS = ('start', 'end', 'keeper', 'action', 'top_act', 'order_num', 'par_loc', 'targ_loc', 'tip_loc',
+               'vol', 'num_mixes', 'complex', 'swap_s', 'pipette', 'rinse_loc', 'waste_loc', 'rinse_vol')
+    NO_LOC = -1  # rinse_loc/waste_loc code of an action without allocated reservoirs
+
+    def __init__(self, num_actions=0):
+        self.start = np.zeros(num_actions, dtype=np.int64)
+        self.end = np.zeros(num_actions, dtype=np.int64)
+        self.keeper = np.zeros(num_actions, dtype=np.int32)  # code into self.locs
+        self.action = np.zeros(num_actions, dtype=np.int8)  # code into self.act_names
+        self.top_act = np.zeros(num_actions, dtype=np.int8)  # code into self.act_names
+        self.order_num = np.zeros(num_actions, dtype=np.int32)
+        self.par_loc = np.zeros(num_actions, dtype=np.int32)  # code into self.locs
+        self.targ_loc = np.zeros(num_actions, dtype=np.int32)  # code into self.locs
+        self.tip_loc = np.zeros(num_actions, dtype=np.int32)  # code into self.locs
+        self.vol = np.zeros(num_actions, dtype=np.float64)  # uL
+        self.num_mixes = np.zeros(num_actions, dtype=np.int16)
+        self.complex = np.zeros(num_actions, dtype=bool)
+        self.swap_s = np.zeros(num_actions, dtype=np.int16)  # tip change time (s) at the start of the action
+        self.pipette = np.zeros(num_actions, dtype=np.int8)  # code into self.pipettes
+        self.rinse_loc = np.full(num_actions, self.NO_LOC, dtype=np.int32)  # code into self.locs, or NO_LOC
+        self.waste_loc = np.full(num_actions, self.NO_LOC, dtype=np.int32)  # code into self.locs, or NO_LOC
+        self.rinse_vol = np.zeros(num_actions, dtype=np.float64)  # uL
+        self.locs = []  # (slot, well) locations (keepers, parent/target locs and tips), by code
+        self.act_names = []  # action names, by code
+        self.pipettes = []  # pipette names ('large', 'small'), by code
+        self._loc_code = {}  # (slot, well): code
+        self._act_code = {}  # action name: code
+        self._pip_code = {}  # pipette name: code
+
+    # returns this when calling this object
+    def __repr__(self):
+        this_string = "ActionTable(" + str(len(self)) + " actions)"
+        return this_string
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        this_string = "ActionTable(" + str(len(self)) + " actions)"
+        return this_string
+
+    def __len__(self):
+        return len(self.start)
+
+    def loc_code(self, loc):
+        # integer code for a location, added to self.locs if new
+        if loc not in self._loc_code:
+            self._loc_code[loc] = len(self.locs)
+            self.locs.append(loc)
+        return self._loc_code[loc]
+
+    def act_code(self, action: str):
+        # integer code for an action name, added to self.act_names if new
+        if action not in self._act_code:
+            self._act_code[action] = len(self.act_names)
+            self.act_names.append(action)
+        return self._act_code[action]
+
+    def pip_code(self, which_pip: str):
+        # integer code for a pipette name, added to self.pipettes if new
+        if which_pip not in self._pip_code:
+            self._pip_code[which_pip] = len(self.pipettes)
+            self.pipettes.append(which_pip)
+        return self._pip_code[which_pip]
+
+    @classmethod
+    def from_actions(cls, exp_sequence: List[ActionInfo]):
+        # columnar copy of a list (or ActionSequence) of actions, in the same order
+        table = cls(len(exp_sequence))
+        for pos in range(len(exp_sequence)):
+            this_action = exp_sequence[pos]
+            table.start[pos] = this_action.start
+            table.end[pos] = this_action.end
+            table.keeper[pos] = table.loc_code(this_action.keeper)
+            table.action[pos] = table.act_code(this_action.action)
+            table.top_act[pos] = table.act_code(this_action.top_act)
+            table.order_num[pos] = this_action.order_num
+            table.par_loc[pos] = table.loc_code(this_action.par_loc)
+            table.targ_loc[pos] = table.loc_code(this_action.targ_loc)
+            table.tip_loc[pos] = table.loc_code(this_action.tip_loc)
+            table.vol[pos] = this_action.transf_vol
+            table.num_mixes[pos] = this_action.num_mixes
+            table.complex[pos] = this_action.complex
+            table.swap_s[pos] = this_action.tip_swap_s
+            table.pipette[pos] = table.pip_code(this_action.pipette)
+            if this_action.waste_loc is not None:
+                table.rinse_loc[pos] = table.loc_code(this_action.rinse_loc)
+                table.waste_loc[pos] = table.loc_code(this_action.waste_loc)
+                table.rinse_vol[pos] = this_action.rinse_vol
+        return table
+
+    @classmethod
+    def from_records(cls, records, locs, act_names, pipettes):
+        # table whose columns are views into records (RECORD_DTYPE), eg: a memory-mapped plan file,
+        # so no action data is copied or converted
+        table = cls(0)
+        for name in cls.COLUMNS:
+            setattr(table, name, records[name])
+        table.locs = list(locs)
+        table.act_names = list(act_names)
+        table._loc_code = {table.locs[code]: code for code in range(len(table.locs))}
+        table.pipettes = list(pipettes)
+        table._act_code = {table.act_names[code]: code for code in range(len(table.act_names))}
+        table._pip_code = {table.pipettes[code]: code for code in range(len(table.pipettes))}
+        return table
+
+    def to_records(self):
+        # the columns as one array of RECORD_DTYPE records
+        records = np.zeros(len(self), dtype=self.RECORD_DTYPE)
+        for name in self.COLUMNS:
+            records[name] = getattr(self, name)
+        return records
+
+    def copy(self):
+        # independent copy of the table (columns and lookup lists)
+        table = ActionTable.from_records(self.to_records(), self.locs, self.act_names, self.pipettes)
+        return table
+
+    def action_at(self, pos: int):
+        # new ActionInfo for the action at pos (a view, edits are not written back to the table)
+        pos = int(pos)
+        this_action = ActionInfo(self.locs[self.keeper[pos]], self.act_names[self.action[pos]],
+                                 self.act_names[self.top_act[pos]], int(self.order_num[pos]),
+                                 int(self.start[pos]), self.locs[self.par_loc[pos]],
+                                 self.locs[self.targ_loc[pos]], float(self.vol[pos]),
+                                 self.locs[self.tip_loc[pos]], int(self.num_mixes[pos]),
+                                 bool(self.complex[pos]))
+        if self.swap_s[pos]:
+            this_action.set_tip_swap(int(self.swap_s[pos]))
+        this_action.set_pipette(self.pipettes[self.pipette[pos]])
+        if self.waste_loc[pos] != self.NO_LOC:
+            this_action.set_rinse_waste(self.locs[self.rinse_loc[pos]], self.locs[self.waste_loc[pos]],
+                                        float(self.rinse_vol[pos]))
+        return this_action
+
+    def to_actions(self):
+        # list of ActionInfo objects for the whole table
+        return [self.action_at(pos) for pos in range(len(self))]
+
+    def mask_of(self, keepers=None, action=None):
+        # boolean mask of the actions of these keepers and/or of this action type
+        mask = np.ones(len(self), dtype=bool)
+        if keepers is not None:
+            codes = [self._loc_code[keeper] for keeper in keepers if keeper in self._loc_code]
+            mask &= np.isin(self.keeper, codes)
+        if action is not None:
+            if action not in self._act_code:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.action == self._act_code[action]
+        return mask
+
+    def shift(self, shift_time: int, mask=None):
+        # shift the start and end of the actions in mask (all, if mask is None) by shift_time
+        if mask is None:
+            self.start += shift_time
+            self.end += shift_time
+        else:
+            self.start[mask] += shift_time
+            self.end[mask] += shift_time
+
+    def sort_by_start(self):
+        # reorder all the columns by start time (stable, so equal starts keep their order)
+        order = np.argsort(self.start, kind='stable')
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            column[:] = column[order]
+        return order
+
+    def overlaps(self):
+        # positions pos where the action at pos + 1 starts before the action at pos ends
+        return np.nonzero(self.start[1:] < self.end[:-1])[0]
+
+    def has_overlaps(self):
+        return bool(np.any(self.start[1:] < self.end[:-1]))
+
+
+# binary plan file (save_plan_file / load_plan_file), version PLAN_FILE_VERSION:
+# header:   PLAN_FILE_HEADER at offset 0 (magic, version, record size, number of actions,
+#           offsets and sizes of the sections below, plan_config_key of the experiment)
+# records:  one ActionTable.RECORD_DTYPE record per planned action, at PLAN_FILE_ALIGN
+# strings:  UTF-8 JSON {'locs': [...], 'act_names': [...], 'pipettes': [...], 'state': {...}}, the values of
+#           the codes in the records, and the state index (see save_plan_file)
+# state:    record arrays of the samples, reservoirs, racks and their action lists, each at a multiple of
+#           PLAN_STATE_ALIGN from the start of the section
+# The records are memory-mapped when loaded, so no action objects are made until they are used.
+# Nothing in the file is executed when it is loaded: the state is plain numbers, strings and lists.
+PLAN_FILE_MAGIC = b'OT2PLAN\x00'
+PLAN_FILE_VERSION = 6
+PLAN_FILE_HEADER = struct.Struct('<8sHHIQQQQQ64s')
+PLAN_FILE_ALIGN = 64  # bytes, alignment of the records section
+PLAN_STATE_ALIGN = 8  # bytes, alignment of the blocks of the state section
+
+# fields of the state records, (attribute, dtype, kind) with kind:
+# 'num' the number as is, 'code' a code into the state 'values' list (text, tuples), 'list' the same for a list
+PLAN_SAM_FIELDS = (('max_vol', '<f8', 'num'), ('dig_vol', '<f8', 'num'), ('cur_vol', '<f8', 'num'),
+                   ('targ_incub_time_m', '<f8', 'num'), ('targ_incub_time_s', '<i8', 'num'),
+                   ('incub_st_timestmp', '<i8', 'num'), ('incub_end_timestmp', '<i8', 'num'),
+                   ('incub_tot_time_s', '<i8', 'num'), ('sample_name', '<i4', 'code'), ('loc', '<i4', 'code'),
+                   ('slot_num', '<i4', 'num'), ('well_id', '<i4', 'num'), ('assigned_tip', '<i4', 'code'),
+                   ('targ_num_mixes', '<i4', 'num'), ('targ_num_rinses', '<i4', 'num'),
+                   ('targ_num_reload', '<i4', 'num'), ('rinsed_num', '<i4', 'num'), ('mixed_num', '<i4', 'num'),
+                   ('reloaded_num', '<i4', 'num'), ('sam_inoculation_timing', '<i4', 'num'),
+                   ('num_inoc_sol', '<i4', 'num'), ('inoc_locs', '<i4', 'code'), ('inoc_fracs', '<i4', 'code'),
+                   ('incub_sols', '<i4', 'code'), ('incub_conc', '<i4', 'code'),
+                   ('incub_reload_timestmps', '<i4', 'list'), ('incub_mix_timestmps', '<i4', 'list'),
+                   ('rinse_timestmps', '<i4', 'list'), ('incub_mix_time_s', '<i4', 'list'),
+                   ('incub_rinse_time_s', '<i4', 'list'), ('start_dry', '?', 'num'), ('store_dry', '?', 'num'))
+PLAN_RES_FIELDS = (('curr_conc', '<f8', 'num'), ('goal_conc', '<f8', 'num'), ('curr_vol', '<f8', 'num'),
+                   ('goal_vol', '<f8', 'num'), ('dig_vol', '<f8', 'num'), ('max_vol', '<f8', 'num'),
+                   ('parent_conc', '<f8', 'num'), ('par_transf_vol', '<f8', 'num'), ('loc', '<i4', 'code'),
+                   ('slot_num', '<i4', 'num'), ('well_id', '<i4', 'num'), ('assigned_tip', '<i4', 'code'),
+                   ('contents', '<i4', 'code'), ('parent_loc', '<i4', 'code'), ('dilution_complete', '?', 'num'))
+PLAN_RACK_FIELDS = (('max_vol', '<f8', 'num'), ('slot', '<i4', 'num'), ('type', '<i4', 'code'),
+                    ('offset', '<i4', 'code'), ('name', '<i4', 'code'), ('label', '<i4', 'code'),
+                    ('num_wells', '<i4', 'num'), ('well_ids', '<i4', 'list'))
+# a sample's action lists, as spans (first record, number of records) of the state action records
+PLAN_SAM_ACT_LISTS = ('targ_act_seq', 'pln_seq_stamps')
+# ExperimentData attributes kept in the state records, or rebuilt (location indices), not in the state 'exp'
+PLAN_STATE_SKIP = ('_all_samples', '_all_res_data', '_res_plate_wells', '_sam_plate_wells', '_planned_sequence',
+                   'plan_table', '_sam_index', '_res_index', '_res_rack_index', '_sam_rack_index', '_index_shapes',
+                   '_load_rank', '_load_rank_order')
+# classes of the objects (reports, tip inventories) that may be in the state 'exp', saved by their attributes
+PLAN_STATE_CLASSES = ('TipInventory', 'TipForecast', 'TipBatchReport', 'VolumeLedger', 'WasteRinseReport',
+                      'ScheduleCertificate', 'PreflightReport', 'StageStats')
+
+
+def _as_tuples(item):
+    # JSON lists back to the tuples used for locations, eg: [2, [3, 1]] -> (2, (3, 1))
+    if isinstance(item, list):
+        return tuple(_as_tuples(sub_item) for sub_item in item)
+    return item
+
+
+def nest_by_lengths(items: list, lengths: list):
+    # items split into consecutive lists of these lengths, eg: the wells of each rack
+    nested = []
+    first = 0
+    for length in lengths:
+        nested.append(items[first:first + length])
+        first += length
+    return nested
+
+
+def _state_dtype(fields):
+    return np.dtype([(name, dtype) for name, dtype, kind in fields])
+
+
+class _StateValues:
+    # lookup list of the text and tuple values in the state records, by code (as ActionTable.locs)
+    def __init__(self, values=None):
+        self.values = [] if values is None else [_as_tuples(value) for value in values]
+        self._code = {}  # JSON text of the value: code
+
+    def code(self, value):
+        if isinstance(value, list):
+            value = tuple(value)
+        key = json.dumps(value)  # 1, 1.0 and True are different values
+        if key not in self._code:
+            self._code[key] = len(self.values)
+            self.values.append(value)
+        return self._code[key]
+
+
+def _to_records(items, fields, values: _StateValues):
+    # record array of items (SamWellData, ResWellData or RackData) with the attributes in fields
+    records = np.zeros(len(items), dtype=_state_dtype(fields))
+    for pos in range(len(items)):
+        for name, dtype, kind in fields:
+            value = getattr(items[pos], name)
+            records[name][pos] = value if kind == 'num' else values.code(value)
+    return records
+
+
+def _from_records(records, fields, values: list, new_item):
+    # items made by new_item(record), with the attributes in fields set from the records
+    items = []
+    for record in records:
+        this_item = new_item(record)
+        for name, dtype, kind in fields:
+            value = record[name].item()
+            if kind == 'code':
+                value = values[value]
+            elif kind == 'list':
+                value = list(values[value])
+            setattr(this_item, name, value)
+        items.append(this_item)
+    return items
+
+
+def _state_value(value):
+    # JSON form of an ExperimentData attribute: tuples and dicts are tagged so they load back as they were,
+    # and objects of PLAN_STATE_CLASSES are saved by their attributes; ValueError for anything else
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return {'tuple': [_state_value(item) for item in value]}
+    if isinstance(value, list):
+        return [_state_value(item) for item in value]
+    if isinstance(value, dict):
+        return {'dict': [[_state_value(key), _state_value(item)] for key, item in value.items()]}
+    if type(value).__name__ in PLAN_STATE_CLASSES:
+        names = value.__slots__ if hasattr(value, '__slots__') else list(value.__dict__)
+        return {'object': type(value).__name__,
+                'attrs': {name: _state_value(getattr(value, name)) for name in names if hasattr(value, name)}}
+    s_out = "Cannot save " + type(value).__name__ + " " + str(value) + " in a plan file."
+    raise ValueError(s_out)
+
+
+def _load_state_value(value):
+    # undo _state_value, only objects of PLAN_STATE_CLASSES are made (without calling their __init__)
+    if isinstance(value, list):
+        return [_load_state_value(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if 'tuple' in value:
+        return tuple(_load_state_value(item) for item in value['tuple'])
+    if 'dict' in value:
+        return {_load_state_value(key): _load_state_value(item) for key, item in value['dict']}
+    if value.get('object') not in PLAN_STATE_CLASSES:
+        s_out = "Plan file has an object of unknown class " + str(value.get('object'))
+        raise ValueError(s_out)
+    cls = globals()[value['object']]
+    this_object = cls.__new__(cls)
+    for name, item in value['attrs'].items():
+        setattr(this_object, name, _load_state_value(item))
+    return this_object
+
+
+def save_plan_file(exp: ExperimentData, file_path: str):
+    # write the planned sequence and the state of exp to file_path in the binary plan format:
+    # samples, reservoirs and racks as record arrays (PLAN_SAM_FIELDS, PLAN_RES_FIELDS, PLAN_RACK_FIELDS),
+    # the samples' action lists as ActionTable records, and the other attributes of exp as JSON
+    table = exp.plan_table
+    if table is None:
+        table = ActionTable.from_actions(exp.planned_sequence)
+    records = table.to_records()
+
+    values = _StateValues()
+    samples = [sam for sam_rack in exp.all_samples for sam in sam_rack]
+    sam_records = _to_records(samples, PLAN_SAM_FIELDS, values)
+    res_records = _to_records([res for res_rack in exp.all_res_data for res in res_rack], PLAN_RES_FIELDS, values)
+    rack_records = _to_records(list(exp.res_plate_wells) + list(exp.sam_plate_wells), PLAN_RACK_FIELDS, values)
+    sam_actions = []
+    act_spans = {name: [] for name in PLAN_SAM_ACT_LISTS}  # per sample (first, count) of each action list
+    for sam in samples:
+        for name in PLAN_SAM_ACT_LISTS:
+            act_spans[name].append((len(sam_actions), len(getattr(sam, name))))
+            sam_actions.extend(getattr(sam, name))
+    exp_act_spans = {}  # ExperimentData action lists, eg: pln_seq_stamps
+    exp_state = {}
+    for name, value in exp.__dict__.items():
+        if name in PLAN_STATE_SKIP:
+            continue
+        if isinstance(value, list) and value and all(isinstance(item, ActionInfo) for item in value):
+            exp_act_spans[name] = (len(sam_actions), len(value))
+            sam_actions.extend(value)
+        else:
+            exp_state[name] = _state_value(value)
+    act_table = ActionTable.from_actions(sam_actions)
+
+    blocks = {}  # block name: (offset in the state section, number of records)
+    state = b''
+    for name, block in (('samples', sam_records), ('res', res_records), ('racks', rack_records),
+                        ('actions', act_table.to_records())):
+        state = state + b'\x00' * (-len(state) % PLAN_STATE_ALIGN)
+        blocks[name] = (len(state), len(block))
+        state = state + block.tobytes()
+    state_index = {'blocks': blocks, 'values': values.values, 'exp': exp_state,
+                   'sam_racks': [len(sam_rack) for sam_rack in exp.all_samples],
+                   'res_racks': [len(res_rack) for res_rack in exp.all_res_data],
+                   'num_res_plates': len(exp.res_plate_wells), 'act_spans': act_spans, 'exp_act_spans': exp_act_spans,
+                   'act_strings': {'locs': act_table.locs, 'act_names': act_table.act_names,
+                                   'pipettes': act_table.pipettes}}
+    strings = json.dumps({'locs': table.locs, 'act_names': table.act_names, 'pipettes': table.pipettes,
+                          'state': state_index}).encode('utf-8')
+
+    records_offset = -(-PLAN_FILE_HEADER.size // PLAN_FILE_ALIGN) * PLAN_FILE_ALIGN
+    strings_offset = records_offset + records.nbytes
+    state_offset = strings_offset + len(strings)
+    state_offset = state_offset + (-state_offset % PLAN_STATE_ALIGN)
+    plan_key = (exp.plan_key or '').encode('ascii')
+    header = PLAN_FILE_HEADER.pack(PLAN_FILE_MAGIC, PLAN_FILE_VERSION, ActionTable.RECORD_DTYPE.itemsize,
+                                   len(records), records_offset, strings_offset, len(strings),
+                                   state_offset, len(state), plan_key)
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as plan_file:
+        plan_file.write(header)
+        plan_file.write(b'\x00' * (records_offset - len(header)))
+        plan_file.write(records.tobytes())
+        plan_file.write(strings)
+        plan_file.write(b'\x00' * (state_offset - strings_offset - len(strings)))
+        plan_file.write(state)
+    os.replace(tmp_path, file_path)
+
+
+def read_plan_header(file_path: str):
+    # header fields of a plan file, as a dict; ValueError if it is not a plan file of this version
+    with open(file_path, 'rb') as plan_file:
+        header = plan_file.read(PLAN_FILE_HEADER.size)
+    if len(header) < PLAN_FILE_HEADER.size:
+        s_out = "File " + str(file_path) + " is too short to be a plan file."
+        raise ValueError(s_out)
+    fields = PLAN_FILE_HEADER.unpack(header)
+    if fields[0] != PLAN_FILE_MAGIC:
+        s_out = "File " + str(file_path) + " is not a plan file."
+        raise ValueError(s_out)
+    if fields[1] != PLAN_FILE_VERSION or fields[2] != ActionTable.RECORD_DTYPE.itemsize:
+        s_out = "Plan file " + str(file_path) + " has version " + str(fields[1]) + ", expected version " + \
+                str(PLAN_FILE_VERSION) + ". Plan the experiment again."
+        raise ValueError(s_out)
+    names = ('magic', 'version', 'record_size', 'num_actions', 'records_offset', 'strings_offset',
+             'strings_size', 'state_offset', 'state_size', 'plan_key')
+    header_dict = dict(zip(names, fields))
+    header_dict['plan_key'] = header_dict['plan_key'].rstrip(b'\x00').decode('ascii')
+    return header_dict
+
+
+def _read_plan_strings(file_path: str, header: dict):
+    with open(file_path, 'rb') as plan_file:
+        plan_file.seek(header['strings_offset'])
+        return json.loads(plan_file.read(header['strings_size']).decode('utf-8'))
+
+
+def read_plan_table(file_path: str, header=None):
+    # ActionTable of the planned sequence in a plan file, with memory-mapped columns
+    # (copy-on-write: shifting or sorting the table does not change the file)
+    if header is None:
+        header = read_plan_header(file_path)
+    if header['num_actions'] > 0:
+        records = np.memmap(file_path, dtype=ActionTable.RECORD_DTYPE, mode='c',
+                            offset=header['records_offset'], shape=(header['num_actions'],))
+    else:
+        records = np.zeros(0, dtype=ActionTable.RECORD_DTYPE)
+    strings = _read_plan_strings(file_path, header)
+    return ActionTable.from_records(records, [_as_tuples(loc) for loc in strings['locs']], strings['act_names'],
+                                    strings['pipettes'])
+
+
+def load_plan_file(file_path: str):
+    # ExperimentData saved by save_plan_file, with its planned sequence as a memory-mapped exp.plan_table
+    header = read_plan_header(file_path)
+    state_index = _read_plan_strings(file_path, header)['state']
+    with open(file_path, 'rb') as plan_file:
+        plan_file.seek(header['state_offset'])
+        state = plan_file.read(header['state_size'])
+
+    def block_of(name, dtype):
+        offset, count = state_index['blocks'][name]
+        return np.frombuffer(state, dtype=dtype, count=count, offset=offset)
+
+    exp = ExperimentData()
+    for name, value in state_index['exp'].items():
+        setattr(exp, name, _load_state_value(value))
+    values = _StateValues(state_index['values']).values
+    act_strings = state_index['act_strings']
+    act_table = ActionTable.from_records(block_of('actions', ActionTable.RECORD_DTYPE),
+                                         [_as_tuples(loc) for loc in act_strings['locs']],
+                                         act_strings['act_names'], act_strings['pipettes'])
+    for name, (first, count) in state_index['exp_act_spans'].items():
+        setattr(exp, name, [act_table.action_at(pos) for pos in range(first, first + count)])
+    samples = _from_records(block_of('samples', _state_dtype(PLAN_SAM_FIELDS)), PLAN_SAM_FIELDS, values,
+                            lambda record: SamWellData())
+    for name, spans in state_index['act_spans'].items():
+        for sam, (first, count) in zip(samples, spans):
+            setattr(sam, name, [act_table.action_at(pos) for pos in range(first, first + count)])
+    res_wells = _from_records(block_of('res', _state_dtype(PLAN_RES_FIELDS)), PLAN_RES_FIELDS, values,
+                              lambda record: ResWellData())
+    racks = _from_records(block_of('racks', _state_dtype(PLAN_RACK_FIELDS)), PLAN_RACK_FIELDS, values,
+                          lambda record: RackData(int(record['slot']), values[record['type']]))
+    exp.all_samples = nest_by_lengths(samples, state_index['sam_racks'])
+    exp.all_res_data = nest_by_lengths(res_wells, state_index['res_racks'])
+    exp.res_plate_wells = racks[:state_index['num_res_plates']]
+    exp.sam_plate_wells = racks[state_index['num_res_plates']:]
+    exp.plan_table = read_plan_table(file_path, header)
+    exp._planned_sequence = None  # made from plan_table when first used
+    return exp
+
+
+class GapIndex:
+    # index of the free time between the actions of a sorted exp_sequence
+    # each gap is [gap_start, gap_end) in seconds, and for each action length
+    # a sorted list of gap starts is kept with the gaps where that length fits,
+    # so finding the first gap for an action is a bisect, O(log n) for n gaps.
+    # Gaps are updated in place when an action is moved with release() and take();
+    # an update inserts into or deletes from the sorted lists (bisect.insort), O(n) for each of
+    # the L action lengths seen so far, so O(n * L). The schedules here have a handful of
+    # action lengths (ActionInfo.ACTION_TIME_S, with or without a tip change), so L stays small.
+    def __init__(self, exp_sequence: List[ActionInfo]):
+        self._starts = []  # sorted list of gap start timestamps
+        self._gap_end = {}  # gap_start: gap_end
+        self._fits = {}  # action length: sorted list of gap starts where that length fits
+        busy_until = None  # latest end timestamp of the actions so far
+        for this_action in exp_sequence:
+            if busy_until is not None and this_action.start > busy_until:
+                self._starts.append(busy_until)  # in ascending order, busy_until only increases
+                self._gap_end[busy_until] = this_action.start
+            if busy_until is None or this_action.end > busy_until:
+                busy_until = this_action.end
+
+    # returns this when calling this object
+    def __repr__(self):
+        this_string = "GapIndex(" + str(len(self._starts)) + " gaps)"
+        return this_string
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        this_string = "GapIndex(" + str(len(self._starts)) + " gaps)"
+        return this_string
+
+    def __len__(self):
+        return len(self._starts)
+
+    @property
+    def gaps(self):
+        # list of (gap_start, gap_len) in time order
+        return [(start, self._gap_end[start] - start) for start in self._starts]
+
+    def _fit_list(self, length: int):
+        # sorted gap starts for gaps that fit an action of this length, built once per length
+        if length not in self._fits:
+            self._fits[length] = [start for start in self._starts if self._gap_end[start] - start >= length]
+        return self._fits[length]
+
+    def _add_gap(self, start: int, end: int):
+        if end <= start:
+            return  # no free time
+        bisect.insort(self._starts, start)
+        self._gap_end[start] = end
+        for length in self._fits:
+            if end - start >= length:
+                bisect.insort(self._fits[length], start)
+
+    def _remove_gap(self, start: int):
+        end = self._gap_end.pop(start)
+        del self._starts[bisect.bisect_left(self._starts, start)]
+        for length in self._fits:
+            if end - start >= length:
+                fit_list = self._fits[length]
+                del fit_list[bisect.bisect_left(fit_list, start)]
+
+    def _gap_at(self, time_s: int):
+        # start of the gap with gap_start <= time_s < gap_end, or None
+        indx = bisect.bisect_right(self._starts, time_s) - 1
+        if indx >= 0:
+            start = self._starts[indx]
+            if time_s < self._gap_end[start]:
+                return start
+        return None
+
+    def find_fit(self, length: int, earliest: int, latest: int):
+        # returns the first start time >= earliest and < latest where an action of
+        # this length fits into a gap, or None if there is no such gap
+        start = self._gap_at(earliest)
+        if start is not None and earliest + length <= self._gap_end[start]:
+            if earliest < latest:
+                return earliest  # fits in the gap that is open at the earliest time
+        fit_list = self._fit_list(length)
+        indx = bisect.bisect_left(fit_list, earliest)
+        if indx < len(fit_list) and fit_list[indx] < latest:
+            return fit_list[indx]
+        return None
+
+    def take(self, start: int, length: int):
+        # occupy [start, start + length), which must lie inside a single gap
+        gap_start = self._gap_at(start)
+        if gap_start is None or start + length > self._gap_end[gap_start]:
+            s_out = "Time " + str(start) + " to " + str(start + length) + " is not inside a gap!"
+            raise ValueError(s_out)
+        gap_end = self._gap_end[gap_start]
+        self._remove_gap(gap_start)
+        self._add_gap(gap_start, start)
+        self._add_gap(start + length, gap_end)
+
+    def release(self, start: int, end: int):
+        # free [start, end), merging with the gaps right before and right after it
+        if end <= start:
+            return
+        indx = bisect.bisect_right(self._starts, start) - 1
+        if indx >= 0 and self._gap_end[self._starts[indx]] == start:
+            prev_start = self._starts[indx]
+            self._remove_gap(prev_start)
+            start = prev_start  # merge with gap before
+        if end in self._gap_end:
+            next_end = self._gap_end[end]
+            self._remove_gap(end)
+            end = next_end  # merge with gap after
+        self._add_gap(start, end)
+
+
+class VolumeLedger:
+    # volume of each reservoir and sample well over the planned sequence, piecewise constant in time.
+    # Each action that moves liquid (transf_vol > 0, from_loc != targ_loc) takes its volume from from_loc
+    # at its start and adds it to targ_loc at its end; an action with an allocated rinse (see
+    # allocate_waste_rinse) also takes rinse_vol from rinse_loc at its start and adds it to waste_loc
+    # at its end. For each location the change times are kept
+    # sorted, with the volume after each change and its running minimum and maximum, so
+    # volume_at(), first_below() and first_above() are a bisect (logarithmic) query.
+    # A reordering pass can move an action with remove_action(), change_start(), add_action();
+    # only the locations of that action are rebuilt at their next query.
+    def __init__(self):
+        self.start_vol = {}  # loc: uL before the first action
+        self.max_vol = {}  # loc: uL, max volume of the well
+        self._times = {}  # loc: sorted list of change times
+        self._deltas = {}  # loc: volume change (uL) at each time in _times
+        self._levels = {}  # loc: volume after each change, built when queried
+        self._low = {}  # loc: running minimum of _levels
+        self._high = {}  # loc: running maximum of _levels
+
+    # returns this when calling this object
+    def __repr__(self):
+        this_string = "VolumeLedger(" + str(len(self.locs())) + " wells, " + \
+                      str(sum(len(times) for times in self._times.values())) + " volume changes)"
+        return this_string
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        return self.__repr__()
+
+    @classmethod
+    def from_exp(cls, exp: ExperimentData, exp_sequence: List[ActionInfo]):
+        # ledger of the planned sequence, with the start volumes of exp.all_res_data and exp.all_samples
+        # (reservoirs filled by dilutions start at their goal volume, as in preflight_check, and waste
+        # and rinse reservoirs at their planned volume dig_vol, after the dilutions drew from them;
+        # samples whose loads do not move liquid start at their planned fill, as preflight_check, so
+        # the unload has the liquid to empty into the waste)
+        ledger = cls()
+        loaded = set(this_action.keeper for this_action in exp_sequence
+                     if this_action.action == 'load' and cls._moves_liquid(this_action))
+        for res_rack in exp.all_res_data:
+            for res in res_rack:
+                start_vol = res.curr_vol
+                if res.loc in exp.waste_res_locs or res.loc in exp.rinse_res_locs:
+                    start_vol = res.dig_vol
+                elif exp.do_dilutions and res.goal_vol > start_vol:
+                    start_vol = res.goal_vol
+                ledger.set_well(res.loc, start_vol, res.max_vol)
+        for sam_rack in exp.all_samples:
+            for sam in sam_rack:
+                start_vol = sam.cur_vol
+                if sam.loc not in loaded:
+                    start_vol = max(start_vol, sam.max_vol * sum(sam.inoc_fracs))
+                ledger.set_well(sam.loc, start_vol, sam.max_vol)
+        for this_action in exp_sequence:
+            ledger.add_action(this_action)
+        return ledger
+
+    def locs(self):
+        return set(self.start_vol) | set(self._times)
+
+    def set_well(self, loc: (int, int), start_vol, max_vol=None):
+        self.start_vol[loc] = start_vol
+        if max_vol is not None:
+            self.max_vol[loc] = max_vol
+
+    def add(self, loc: (int, int), time_s: int, delta):
+        # volume of loc changes by delta (uL) at time_s, after the changes already at time_s
+        times = self._times.setdefault(loc, [])
+        indx = bisect.bisect_right(times, time_s)
+        times.insert(indx, time_s)
+        self._deltas.setdefault(loc, []).insert(indx, delta)
+        self._levels.pop(loc, None)
+
+    def remove(self, loc: (int, int), time_s: int, delta):
+        # undo add(loc, time_s, delta)
+        times = self._times.get(loc, [])
+        deltas = self._deltas.get(loc, [])
+        indx = bisect.bisect_left(times, time_s)
+        while indx < len(times) and times[indx] == time_s:
+            if deltas[indx] == delta:
+                del times[indx]
+                del deltas[indx]
+                self._levels.pop(loc, None)
+                return
+            indx += 1
+        s_out = "No volume change of " + str(delta) + "uL at " + str(time_s) + "s for " + str(loc) + " in the ledger"
+        raise ValueError(s_out)
+
+    @staticmethod
+    def _moves_liquid(this_action: ActionInfo):
+        return bool(this_action.transf_vol) and this_action.par_loc != this_action.targ_loc
+
+    def add_action(self, this_action: ActionInfo):
+        if self._moves_liquid(this_action):
+            self.add(this_action.par_loc, this_action.start, -this_action.transf_vol)
+            self.add(this_action.targ_loc, this_action.end, this_action.transf_vol)
+        if this_action.waste_loc is not None and this_action.rinse_vol:
+            # a shared waste/rinse well gets both changes, so the rinse volume is back at the end
+            self.add(this_action.rinse_loc, this_action.start, -this_action.rinse_vol)
+            self.add(this_action.waste_loc, this_action.end, this_action.rinse_vol)
+
+    def remove_action(self, this_action: ActionInfo):
+        # with the action's current times, call before changing its start
+        if self._moves_liquid(this_action):
+            self.remove(this_action.par_loc, this_action.start, -this_action.transf_vol)
+            self.remove(this_action.targ_loc, this_action.end, this_action.transf_vol)
+        if this_action.waste_loc is not None and this_action.rinse_vol:
+            self.remove(this_action.rinse_loc, this_action.start, -this_action.rinse_vol)
+            self.remove(this_action.waste_loc, this_action.end, this_action.rinse_vol)
+
+    def _build(self, loc: (int, int)):
+        # volume after each change of loc, and its running minimum and maximum
+        if loc not in self._levels:
+            levels = []
+            low = []
+            high = []
+            vol = self.start_vol.get(loc, 0)
+            for delta in self._deltas.get(loc, []):
+                vol = vol + delta
+                levels.append(vol)
+                low.append(min(low[-1], vol) if low else vol)
+                high.append(max(high[-1], vol) if high else vol)
+            self._levels[loc] = levels
+            self._low[loc] = low
+            self._high[loc] = high
+        return self._levels[loc]
+
+    def volume_at(self, loc: (int, int), time_s: int):
+        # uL in loc at time_s, after the changes at time_s
+        levels = self._build(loc)
+        indx = bisect.bisect_right(self._times.get(loc, []), time_s)
+        if indx == 0:
+            return self.start_vol.get(loc, 0)
+        return levels[indx - 1]
+
+    def first_below(self, loc: (int, int), threshold):
+        # first time the volume of loc changes to below threshold, or None (the start volume is not checked)
+        self._build(loc)
+        indx = self._first_index(self._low[loc], lambda vol: vol < threshold)
+        return self._times[loc][indx] if indx is not None else None
+
+    def first_above(self, loc: (int, int), threshold):
+        # first time the volume of loc changes to above threshold, or None (the start volume is not checked)
+        self._build(loc)
+        indx = self._first_index(self._high[loc], lambda vol: vol > threshold)
+        return self._times[loc][indx] if indx is not None else None
+
+    @staticmethod
+    def _first_index(running: list, past):
+        # first index where past(running[indx]) is True, for a running minimum / maximum, where
+        # past is False up to some index and True after it; None if it is never True
+        low_indx = 0
+        high_indx = len(running)
+        while low_indx < high_indx:
+            mid_indx = (low_indx + high_indx) // 2
+            if past(running[mid_indx]):
+                high_indx = mid_indx
+            else:
+                low_indx = mid_indx + 1
+        return low_indx if low_indx < len(running) else None
+
+    def violations(self, min_vol=0):
+        # [(loc, time_s, volume), ...] of the first time each well drops below min_vol (uL) or
+        # goes above its max volume, in time order
+        problems = []
+        for loc in self.locs():
+            time_s = self.first_below(loc, min_vol)
+            if time_s is not None:
+                problems.append((time_s, loc, self.volume_at(loc, time_s)))
+            if loc in self.max_vol:
+                time_s = self.first_above(loc, self.max_vol[loc])
+                if time_s is not None:
+                    problems.append((time_s, loc, self.volume_at(loc, time_s)))
+        problems.sort()
+        return [(loc, time_s, vol) for time_s, loc, vol in problems]
+
+
+class ScheduleCertificate:
+    # result of certify_sequence(), a check that a planned sequence can be run as is:
+    # (1) no two actions overlap (one pipette)
+    # (2) each sample's actions run in the order load < (reload, mix) < unload < rinse
+    # (3) each sample's incubation error is at most max_incub_error_s (seconds)
+    # incub_targ holds the target time from the end of each sample's last 'load' to its 'unload',
+    # so the check can be repeated with certify_sequence(seq, cert.incub_targ, cert.max_incub_error_s)
+    def __init__(self, incub_targ: dict, max_incub_error_s: int):
+        self.incub_targ = incub_targ  # keeper: target load end to unload start, in seconds
+        self.max_incub_error_s = max_incub_error_s
+        self.num_actions = 0
+        self.overlaps = []  # (pos, pos) of actions that overlap in time
+        self.order_errors = []  # (keeper, pos) of actions that run before an earlier step of the same sample
+        self.incub_errors = {}  # keeper: unload start - (load end + target), in seconds
+
+    # returns this when calling this object
+    def __repr__(self):
+        this_string = "ScheduleCertificate(valid: " + str(self.valid) + ", " + str(self.num_actions) + \
+                      " actions, overlaps: " + str(len(self.overlaps)) + ", order errors: " + \
+                      str(len(self.order_errors)) + ", max incub error: " + str(self.max_error) + \
+                      " of " + str(self.max_incub_error_s) + "s)"
+        return this_string
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        return self.__repr__()
+
+    @property
+    def max_error(self):
+        # largest incubation error (absolute value), in seconds
+        if not self.incub_errors:
+            return 0
+        return max(abs(error) for error in self.incub_errors.values())
+
+    @property
+    def valid(self):
+        return not self.overlaps and not self.order_errors and self.max_error <= self.max_incub_error_s
+
+
 # define functions on these class objects
 def swap_actions(exp_sequence: List[ActionInfo], act_pos_this: int, act_pos_that: int):
     # swap the two actions in the list  (^ this_action, old_action)
@@ -642,7 +2521,7 @@ def swap_actions(exp_sequence: List[ActionInfo], act_pos_this: int, act_pos_that
     num_actions = len(exp_sequence)
     if act_pos_this >= num_actions or act_pos_this < 0 \
             or act_pos_that >= num_actions or act_pos_that < 0:
-        print("WARNING: Cannot swap actions, positions are out of index range.")
+        logger.warning("Cannot swap actions, positions are out of index range.")
         return exp_sequence
     exp_sequence[act_pos_this], exp_sequence[act_pos_that] = exp_sequence[act_pos_that], exp_sequence[act_pos_this]
     # print("Swapping actions for the positions: ", act_pos_this, " and ", act_pos_that)  # debug
@@ -650,54 +2529,46 @@ def swap_actions(exp_sequence: List[ActionInfo], act_pos_this: int, act_pos_that
     return exp_sequence
 
 
-def check_order_swap(exp_sequence: List[ActionInfo], sam_indx: Tuple[int], this_pos: int, old_pos: int):
+def check_order_swap(exp_sequence: List[ActionInfo], sam_indx: Tuple[int], this_pos: int, old_pos: int,
+                     load_rank=None):
     # if two actions are of the same type, check the order in the sam_indx
+    # load_rank: {keeper: rank} from find_load_rank(sam_indx), build it once per plan and pass it in
+    if load_rank is None:
+        load_rank = find_load_rank(sam_indx)
     old_action = exp_sequence[old_pos]
     this_action = exp_sequence[this_pos]
     # print("Checking if ", old_pos, ":", old_action, "should precede", this_pos, ":", this_action)  # debug
-    old_action_sam_indx = sam_indx.index(old_action.keeper)
-    this_action_sam_indx = sam_indx.index(this_action.keeper)
+    last_rank = len(sam_indx)  # keepers that are not samples go last
+    old_action_sam_indx = load_rank.get(old_action.keeper, last_rank)
+    this_action_sam_indx = load_rank.get(this_action.keeper, last_rank)
     # this means if two actions have the same index, they are probably in the correct order!
     if this_action_sam_indx < old_action_sam_indx:
-        print(this_pos, ":", this_action, " should come before ", old_pos, ":", old_action, " Swapping them.")  # debug
+        logger.debug("%s : %s should come before %s : %s Swapping them.", this_pos, this_action, old_pos, old_action)
         swap_actions(exp_sequence, this_pos, old_pos)
     return exp_sequence
 
 
 def swap_time_w_gap(exp_sequence: List[ActionInfo], be_first_pos: int, be_second_pos: int, gap_time: int):
     # maybe should be an inner function for shift_timestamp
+    exp_sequence = as_action_sequence(exp_sequence)
     # print("Swapping timestamps for the actions in positions: ", be_first_pos, " and ", be_second_pos)  # debug
     # print("Before swap:", exp_sequence[be_first_pos], " and ", exp_sequence[be_second_pos])
     be_first_time = exp_sequence[be_second_pos].start  # new time to start first action
-    exp_sequence[be_second_pos].change_start(be_first_time + gap_time)  # new time for second action
-    exp_sequence[be_first_pos].change_start(be_first_time)  # change timestamp for first action
+    exp_sequence.change_start(exp_sequence[be_second_pos], be_first_time + gap_time)  # new time for second action
+    exp_sequence.change_start(exp_sequence[be_first_pos], be_first_time)  # change timestamp for first action
     # print("After swap:", exp_sequence[be_first_pos], " and ", exp_sequence[be_second_pos])
     return exp_sequence
 
 
 def shift_all_for_load(exp_sequence: List[ActionInfo], this_sam_id: int, shift_time: int):
-    # make a list of all load actions that come after sam_index 'load'
-    # shift all actions for samples in that list by a time shift_time
-    # then sorts and prioritizes the action list
+    # make a list of all samples whose 'load' comes after sam_index 'load'
+    # shift all actions for samples in that list by a time shift_time,
+    # using the load order and keeper index of the sequence (no scan over all actions)
     # print("Shifting all for load of action:", sam_index)  # debug
-    shift_for_load = False
-    sams_2_shift = []  # list of samples that are loaded after this_sam_id
-    for ix in range(len(exp_sequence)):
-        # find all load actions that come after sam_index load
-        this_action = exp_sequence[ix]
-        if this_action.keeper == this_sam_id:
-            if this_action.action == 'load':
-                shift_for_load = True
-        if shift_for_load and this_action.action == 'load':
-            sams_2_shift.append(this_action.keeper)
-            # list of samples that are loaded after this_sam_id
-
-    print("Shifting all actions for samples: ", sams_2_shift)  # debug
-    for ix in range(len(exp_sequence)):
-        # shift timestamp for all actions for samples in the list
-        this_action = exp_sequence[ix]
-        if this_action.keeper in sams_2_shift:
-            this_action.change_start(this_action.start + shift_time)
+    exp_sequence = as_action_sequence(exp_sequence)
+    sams_2_shift = exp_sequence.loaded_after(this_sam_id)  # samples loaded after this_sam_id
+    logger.debug("Shifting all actions for samples: %s", sams_2_shift)
+    exp_sequence.shift_keepers(sams_2_shift, shift_time)
 
     # sort and prioritize the list again
     # exp_sequence = prioritize_sequence(exp_sequence)
@@ -706,131 +2577,77 @@ def shift_all_for_load(exp_sequence: List[ActionInfo], this_sam_id: int, shift_t
 
 
 def shift_all_for_rinse(exp_sequence: List[ActionInfo], act_pos, shift_time):
-    print("Shifting all rinse after step")
-    this_indx = exp_sequence[act_pos].keeper
-    print("Shifting all rinse for samples ", this_indx)
-    for ix in range(act_pos, len(exp_sequence)):
-        this_action = exp_sequence[ix]
-        if this_action.keeper == this_indx and this_action.action == 'rinse':
-            this_action.change_start(this_action.start + shift_time)
+    # shift the 'rinse' at act_pos, and the later rinses of the same sample
+    logger.debug("Shifting all rinse after step")
+    exp_sequence = as_action_sequence(exp_sequence)
+    this_action = exp_sequence[act_pos]
+    this_indx = this_action.keeper
+    logger.debug("Shifting all rinse for samples %s", this_indx)
+    exp_sequence.shift_keepers((this_indx,), shift_time, 'rinse', this_action.start)
     return exp_sequence
 
 
-def prioritize_sequence(in_seq: List[ActionInfo], sam_indx: Tuple[int]):
-    # sort the list by timestamp, then iterate over the sorted list
-    # if two timestamps overlap, rearrange the order in the following way:
-    # prioritize in order (1) unload (2) mix (3) load (4) rinse
+@profiled_stage
+def prioritize_sequence(in_seq: List[ActionInfo], sam_indx: Tuple[int], load_rank=None):
+    # sort the list by timestamp, and if two timestamps overlap,
+    # order the actions in the following way:
+    # prioritize in order (1) unload (2) reload (3) mix (4) load (5) rinse
     # if two actions are the same (eg. both 'mix'),
-    # use the sample load order to choose which goes first
+    # use the sample load order (sam_indx) to choose which goes first
+    # Actions wait in a heap keyed on start time (pending). Every pending action that
+    # starts before the pipette is free, or before the earliest waiting action ends,
+    # moves to a second heap keyed on (action rank, load rank, start) (ready),
+    # and the top of the ready heap is placed next. Each action enters and leaves
+    # each heap once, so the ordering is O(n log n) and never needs to bail out.
     # The second loop modifies the timestamp so that exp_sequence.sort doesn't undo the work
+    # in_seq is edited in place (no copy), and the edits are logged in an ActionSequence
 
-    print("Running: prioritize_sequence(). Prioritizing and sorting list.")  # debug
+    logger.debug("Running: prioritize_sequence(). Prioritizing and sorting list.")
     # print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")  # debug
-    exp_sequence = deepcopy(in_seq)
-    # MODIFY: sometimes this sort swaps previously swapped actions, undoing work...
-    exp_sequence.sort(key=lambda sort_action: sort_action.start)
-    # print("Concatenated, sorted sequence is: ")  # debug
-    # print(exp_sequence)  # debug
-    # old_action = ActClass(0, 'none', 0)
-    iterations = 0
-    hall_pass = len(exp_sequence) * 3
-    ix = 1
-    while ix < len(exp_sequence):
-        iterations += 1
-        if iterations > hall_pass:
-            print("WARNING: something is wrong, bailing out of prioritize_sequence while loop.")
-            break  # emergency break out of while loop
-        # iterate over list of actions, starting with the second action
-        if ix == 0:
-            ix = 1  # if accidentally went back to the first
-        # print("p-loop, ix is now:", ix)  # debug
-        this_action = deepcopy(exp_sequence[ix])
-        old_action = deepcopy(exp_sequence[(ix - 1)])
-        # if two timestamps overlap
-        if this_action.start < old_action.end:
-            # print("______________________________________________________________________________")  # debug
-            # print(ix, ":", this_action, " starts at ", this_action.start,
-            #      ", before ", (ix-1), ":", old_action, " ends at ", old_action.end)  # debug
-            # Case: both are identical (0)
-            if this_action.action == old_action.action:
-                # print("Case: both are identical (0)")
-                exp_sequence = check_order_swap(exp_sequence, sam_indx, ix, (ix - 1))
-                if this_action.keeper == exp_sequence[ix].keeper and \
-                        this_action.start == exp_sequence[ix].start:
-                    # print("no change in exp_sequence")  # debug
-                    # print("Actions are in the correct order.")  # debug
-                    ix = ix + 1  # going forward one, so next_action can be checked
-                else:
-                    # print("changed exp_sequence")
-                    ix = ix - 1  # going back one , to check that old_action moved correctly
-            # Case: unload  (1)
-            elif this_action.action == 'unload':
-                # print("Case: unload  (1)")  # debug
-                print(ix, ": ", this_action, " should come before ", (ix - 1), ": ", old_action,
-                      " Swapping them.")  # debug
-                exp_sequence = swap_actions(exp_sequence, ix, (ix - 1))
-                ix = ix - 1  # going back one , to check that old_action moved correctly
-            # Case: reload  (2)
-            elif this_action.action == 'reload':
-                # print("Case: reload  (2)")  # debug
-                if old_action.action == 'unload' or old_action.action == 'reload':
-                    # print("Actions are in the correct order.")  # debug
-                    ix = ix + 1  # going forward one, so next_action can be checked
-                    # pass  # do nothing, no swapping!
-                else:
-                    print(ix, ": ", this_action, " should come before ", (ix - 1), ": ", old_action,
-                          " Swapping them.")  # debug
-                    exp_sequence = swap_actions(exp_sequence, ix, (ix - 1))
-                    ix = ix - 1  # going back one , to check that old_action moved correctly
-            # Case: mix  (3)
-            elif this_action.action == 'mix':
-                # print("Case: mix  (3)")
-                if old_action.action == 'load' or old_action.action == 'rinse':
-                    print(ix, ": ", this_action, " should come before ", (ix - 1), ": ", old_action,
-                          " Swapping them.")  # debug
-                    exp_sequence = swap_actions(exp_sequence, ix, (ix - 1))
-                    ix = ix - 1  # going back one , to check that old_action moved correctly
-                else:
-                    # print("Actions are in the correct order.")  # debug
-                    ix = ix + 1  # going forward one, so next_action can be checked
-                    # pass  # do nothing, no swapping!
-            # Case: load  (4)
-            elif this_action.action == 'load':
-                # print("Case: load  (4)")
-                if old_action.action == 'rinse':
-                    print(ix, ": ", this_action, " should come before ", (ix - 1), ": ", old_action,
-                          " Swapping them.")  # debug
-                    exp_sequence = swap_actions(exp_sequence, ix, (ix - 1))
-                    ix = ix - 1  # going back one , to check that old_action moved correctly
-                else:
-                    # print("Actions are in the correct order.")  # debug
-                    ix = ix + 1  # going forward one, so next_action can be checked
-                    # pass  # do nothing, no swapping!
-            # Case: rinse  (5) or any others
-            else:
-                # print("Case: rinse  (5) or any others")
-                # if adding other actions, will need to re-asses
-                # print("Actions are in the correct order.")  # debug
-                ix = ix + 1  # going forward one, so next_action can be checked
-                # pass # do nothing, no swapping!
-            # print("Changing ix to :", ix)  # debug
+    exp_sequence = as_action_sequence(in_seq)
+    exp_sequence.begin()
+    num_actions = len(exp_sequence)
+    if load_rank is None:
+        load_rank = find_load_rank(sam_indx)  # sample keeper: position in the sample load order
+    last_rank = len(sam_indx)  # for keepers that are not samples, eg: dilution reservoirs
+
+    pending = []  # heap of (start, action rank, load rank, position), not yet competing
+    for ix in range(num_actions):
+        this_action = exp_sequence[ix]
+        act_rank = ACTION_RANK.get(this_action.action, OTHER_ACTION_RANK)
+        sam_rank = load_rank.get(this_action.keeper, last_rank)
+        pending.append((this_action.start, act_rank, sam_rank, ix))
+    heapq.heapify(pending)
+    ready = []  # heap of (action rank, load rank, start, position), competing for the pipette
+    ready_starts = []  # heap of (start, position) for the ready actions, cleared lazily
+    placed = [False] * num_actions  # True once the action at this position is in the new order
+    ordered = []  # new order of actions
+    free_at = None  # end timestamp of the last placed action
+    while pending or ready:
+        while ready_starts and placed[ready_starts[0][1]]:
+            heapq.heappop(ready_starts)  # drop the actions that were already placed
+        # the earliest action still waiting, ready or pending
+        if ready_starts and (not pending or ready_starts[0][0] <= pending[0][0]):
+            first_ix = ready_starts[0][1]
         else:
-            ix = ix + 1  # going forward one, so next_action can be checked
+            first_ix = pending[0][3]
+        window = exp_sequence[first_ix].end  # actions starting before this overlap the earliest one
+        if free_at is not None and free_at > window:
+            window = free_at  # actions starting before this overlap the last placed action
+        while pending and (pending[0][0] < window or not ready):
+            start, act_rank, sam_rank, ix = heapq.heappop(pending)
+            heapq.heappush(ready, (act_rank, sam_rank, start, ix))
+            heapq.heappush(ready_starts, (start, ix))
+        ix = heapq.heappop(ready)[3]  # highest priority of the overlapping actions
+        placed[ix] = True
+        ordered.append(exp_sequence[ix])
+        free_at = exp_sequence[ix].end
+    exp_sequence.reorder(ordered)
 
     # print("Shifting start timestamps in case start times are equal to one another.")  # debug
     # print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")  # debug
-    iterations = 0
-    hall_pass = len(exp_sequence) * 3
-    ix = 1
-    while ix < len(exp_sequence):
-        iterations += 1
-        if iterations > hall_pass:
-            print("WARNING: something is wrong, bailing out of prioritize_sequence while loop.")
-            break  # emergency break out of while loop
+    for ix in range(1, len(exp_sequence)):
         # iterate over list of actions, starting with the second action
-        if ix == 0:
-            ix = 1  # if accidentally went back to the first
-        # print("p-loop, ix is now:", ix)  # debug
         this_action = exp_sequence[ix]  # should be an alias, not a copy
         old_action = exp_sequence[(ix - 1)]  # should be an alias, not a copy
         # if two timestamps overlap
@@ -839,13 +2656,11 @@ def prioritize_sequence(in_seq: List[ActionInfo], sam_indx: Tuple[int]):
             if this_action.action == 'mix' or \
                     this_action.action == 'reload' or \
                     this_action.action == 'rinse':
-                this_action.change_start(old_action.start + 10)
+                exp_sequence.change_start(this_action, old_action.start + 10)
                 # so that swap is not done redundantly, the time will be shifted again
-                print("Shifted action: ", ix, this_action)
-            ix = ix + 1  # going forward one, so next_action can be checked
-        else:
-            ix = ix + 1  # going forward one, so next_action can be checked
+                logger.debug("Shifted action: %s %s", ix, this_action)
     # print("+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++")  # debug
+    exp_sequence.commit()
     return exp_sequence
 
 
@@ -859,16 +2674,13 @@ def find_when_action(action: str, exp_sequence: List[ActionInfo], act_pos: int):
     elif act_pos < 0:
         act_pos = 0  # position must be within sequence
 
+    exp_sequence = as_action_sequence(exp_sequence)
     find_action = exp_sequence[act_pos]
     # print("This action is:", find_action) # debug
-    find_action_id = find_action.keeper  # sample id of action # MODIFY: use sam Location instead?
-    when_action = 0
-    for ix in range(len(exp_sequence)):
-        this_action = exp_sequence[ix]  # should be an alias, not a copy
-        # MODIFY: use sam Location instead?
-        if this_action.action == action and this_action.keeper == find_action_id:
-            when_action = ix
-            break  # action index found, break out of for loop
+    find_action_id = find_action.keeper  # sample id of action
+    when_action = exp_sequence.find_action(action, find_action_id)  # from the keeper index
+    if when_action is None:
+        when_action = 0
     # print("This action is correlated with:", exp_sequence[when_action])  # debug
     return when_action
 
@@ -920,16 +2732,20 @@ def find_next_gap(exp_sequence: List[ActionInfo], from_pos: int, to_pos: int):
     return which_gap  # returns index of first gap where action @ to_pos can fit, but after action @ from_pos
 
 
+@profiled_stage
 def shift_timestamp(in_seq: List[ActionInfo], sam_indx: Tuple[int]):
     # next, iterate over the sorted list and shift all except unload
     # shift the action if the previous one has a timestamp that
     # overlaps with the time needed to complete the previous action
     # prioritize in order (1) unload (2) mix (3) load (4) rinse
     # old_action = ActClass(0, 'none', 0)
-    exp_sequence = deepcopy(in_seq)  # deep copy so that mix-ups can be interrupted
-    print("Shifting timestamps for the list of ", len(exp_sequence), " actions.")  # debug
+    # in_seq is edited in place, and rolled back if the loop has to bail out
+    exp_sequence = as_action_sequence(in_seq)
+    exp_sequence.begin()  # so that mix-ups can be interrupted
+    logger.debug("Shifting timestamps for the list of %s actions.", len(exp_sequence))
     # print("Sample index in order of inoculation", sam_indx)  # debug
-    exp_sequence = prioritize_sequence(exp_sequence, sam_indx)
+    load_rank = find_load_rank(sam_indx)  # once per plan, for every order comparison below
+    exp_sequence = prioritize_sequence(exp_sequence, sam_indx, load_rank)
     # print("Concatenated, sorted, swapped sequence is: ")  # debug
     # print(exp_sequence)  # debug
     # print("=====================================================================================")  # debug
@@ -941,8 +2757,10 @@ def shift_timestamp(in_seq: List[ActionInfo], sam_indx: Tuple[int]):
     while ix < len(exp_sequence):
         iterations += 1
         if iterations > hall_pass:
-            print("WARNING: something is wrong, bailing out of infinite while loop.")
-            break  # emergency break out of while loop
+            logger.warning("Something is wrong, bailing out of infinite while loop.")
+            logger.warning("Rolling back the changes made by shift_timestamp().")
+            exp_sequence.rollback()
+            return exp_sequence  # emergency break out of while loop
         # iterate over list of actions, starting with the second action
         if ix == 0:
             ix = 1  # if accidentally went back to the first
@@ -964,54 +2782,54 @@ def shift_timestamp(in_seq: List[ActionInfo], sam_indx: Tuple[int]):
             # print("=====================================================================================")  # debug
             # print(ix, ":", this_action, " starts at ", this_action.start,
             #      "before ", old_action, " ends at ", old_action.end)  # debug
-            print("OVERLAP, changing timestamp. ix is now:", ix)  # debug
+            logger.debug("OVERLAP, changing timestamp. ix is now: %s", ix)
             # prioritize in order (1) unload (2) mix (3) load (4) rinse
             # Case: both are identical (0)
             if this_action.action == old_action.action:
                 # print("Both actions are the same, checking order")
-                exp_sequence = check_order_swap(exp_sequence, sam_indx, ix, (ix - 1))
+                exp_sequence = check_order_swap(exp_sequence, sam_indx, ix, (ix - 1), load_rank)
                 this_action = exp_sequence[ix]  # should be an alias, not a copy
                 old_action = exp_sequence[(ix - 1)]  # should be an alias, not a copy
             # Case: unload  (1)
             if this_action.action == 'unload':
-                print("Unload shouldn't move! Only another unload can overlap! ")  # debug
+                logger.debug("Unload shouldn't move! Only another unload can overlap! ")
                 # Case: unload (1) + old: unload (1)
                 if old_action.action == 'unload':
-                    print("Two unloads overlap! Check order:", sam_indx)  # debug
+                    logger.debug("Two unloads overlap! Check order: %s", sam_indx)
                     sam_id = this_action.keeper  # moving this_action
                     shift_time = old_action.end - this_action.start
                     # print("Load needs to shift for all loads/steps after sam_id: ",
                     #      sam_id, " by time: ", shift_time)  # debug
                     exp_sequence = shift_all_for_load(exp_sequence, sam_id, shift_time)
-                    print("Now we have to take ix back to the beginning to resort!")
+                    logger.debug("Now we have to take ix back to the beginning to resort!")
                     ix = 1
                 else:
-                    print("WARNING: Why didn't prioritize_sequence work?")
+                    logger.warning("Why didn't prioritize_sequence work?")
                     ix = 1
             # Case: reload (2)
             elif this_action.action == 'reload':
                 # print("Reload can be moved earlier or later.")  # debug
                 if old_action.action == 'unload' or old_action.action == 'reload':
-                    this_action.change_start(old_action.end)  # new time to start mixing
-                    print("Moving 'reload' to later:", this_action)  # debug
+                    exp_sequence.change_start(this_action, old_action.end)  # new time to start mixing
+                    logger.debug("Moving 'reload' to later: %s", this_action)
                 else:
-                    print("WARNING: old action should have been swapped with reload!", old_action)
+                    logger.warning("Old action should have been swapped with reload! %s", old_action)
                     ix = 1
             # Case: mix (2)
             elif this_action.action == 'mix':
                 # print("Mix can be moved earlier or later.")  # debug
                 if old_action.action == 'mix' or old_action.action == 'unload' or old_action.action == 'reload':
-                    this_action.change_start(old_action.end)  # new time to start mixing
-                    print("Moving 'mix' to later:", this_action)  # debug
+                    exp_sequence.change_start(this_action, old_action.end)  # new time to start mixing
+                    logger.debug("Moving 'mix' to later: %s", this_action)
                     # MODIFY: check that the mix will not come after unload for the same sample
                 else:
-                    print("WARNING: old action should have been swapped with mix!", old_action)
+                    logger.warning("Old action should have been swapped with mix! %s", old_action)
                     ix = 1
             # Case: load (3)
             elif this_action.action == 'load':
                 # Case: load (3) + rinse (4)
                 if old_action.action == 'rinse':
-                    print("WARNING: rinse action should have been swapped with load!", old_action)
+                    logger.warning("Rinse action should have been swapped with load! %s", old_action)
                     ix = 1
                 # Case: load (3) + (unload (1) or mix(2) or load(3))
                 else:
@@ -1027,23 +2845,25 @@ def shift_timestamp(in_seq: List[ActionInfo], sam_indx: Tuple[int]):
                 # MODIFY: shift ALL 'rinse' actions after this one for this sample.
                 shift_time = old_action.end - this_action.start
                 shift_all_for_rinse(exp_sequence, ix, shift_time)
-                this_action.change_start(old_action.end)  # new time to start rinse
+                exp_sequence.change_start(this_action, old_action.end)  # new time to start rinse
             else:
-                print("WARNING: what else?")
+                logger.warning("What else?")
                 # ix = 1
-            print("Re-prioritizing, since a change was likely")
-            exp_sequence = prioritize_sequence(exp_sequence, sam_indx)
+            logger.debug("Re-prioritizing, since a change was likely")
+            exp_sequence = prioritize_sequence(exp_sequence, sam_indx, load_rank)
             ix = ix - 1  # going back one , to check that old_action moved correctly
-            print("Changing ix to :", ix)  # debug
+            logger.debug("Changing ix to : %s", ix)
         else:
             ix = ix + 1  # going forward one, so next_action can be checked
+    exp_sequence.commit()
     return exp_sequence
 
 
+@profiled_stage
 def find_gaps_compress_actions(in_seq: List[ActionInfo]):
     # Find the gaps in exp_sequence and compress when there are gaps
     # moving all 'rinse' steps forward if they fit into gaps (no swapping)
-    exp_sequence = deepcopy(in_seq)
+    exp_sequence = as_action_sequence(in_seq)  # edited in place
     num_actions = len(exp_sequence)
     for ix in range(1, num_actions):
         # cycle through indices from 1 to (num_actions - 1)
@@ -1053,68 +2873,1003 @@ def find_gaps_compress_actions(in_seq: List[ActionInfo]):
             old_action = exp_sequence[(ix - 1)]  # should be an alias, not a copy
             if this_action.start > old_action.end:
                 # print("Changing action: ", this_action)  # debug
-                this_action.change_start(old_action.end)  # moving action to start earlier
+                exp_sequence.change_start(this_action, old_action.end)  # moving action to start earlier
     return exp_sequence
 
 
-def swap_into_gaps(in_seq: List[ActionInfo], sam_indx: Tuple[int]):
-    # Check the gaps between two actions and see if
-    # 'rinse' actions can be swapped into the gap
-    exp_sequence = deepcopy(in_seq)  # not alias, deep copy
-    iterations = 0  # tracking when to bail
-    hall_pass = len(exp_sequence) * 5  # when to bail out of loop
-    iter_ix = 2  # start at index 2 (third in sequence)
-    while iter_ix < len(exp_sequence):
-        # cycle through the action step in_seq
-        iterations += 1  # track to bail
-        if iterations > hall_pass:
-            print("WARNING: something is wrong, bailing out of swap_into_gaps while loop.")
-            break  # emergency break out of while loop
-        # iterate over list of actions, starting with the second action
-        if iter_ix < 2:
-            iter_ix = 2  # if accidentally went back too far
-
-        print("ix is now:", iter_ix)  # debug
-        this_action = exp_sequence[iter_ix]  # should be an alias, not a copy
-        which_gap = iter_ix - 1  # gap index prior to this action
-        prev = which_gap  # previous action and gap
-
-        # index for actions (eg __0___), gaps (eg 0 ), and gap-time (eg x0) shown below:
-        # __0__  0  __1__  1  __2__  2  __3__  3  __4__  4  __5__  5  __6__  6  __7__ ...etc
-        #       x0        x1        x2        x3        x4        x5        x6
-        # if this_action.action == 'mix':
-        #     # MODIFY: mix step should be spread out, not shuffled all together
-        #     # 'mix' must come after 'load'
-        #     when_loaded = find_when_action('load', exp_sequence, iter_ix)  # index when this sample was loaded
-        #     which_gap = find_next_gap(exp_sequence, when_loaded, iter_ix)  # gap index for the first gap
-        #     # between when sample was loaded and now, where action will fit
-        if this_action.action == 'rinse':
-            # 'rinse' must come after 'unload'
-            when_unloaded = find_when_action('unload', exp_sequence, iter_ix)  # index when sample was unloaded
-            which_gap = find_next_gap(exp_sequence, when_unloaded, iter_ix)  # gap index for the first gap
-            # between when the sample was unloaded and now, where action will fit
-
-        if which_gap < prev:
-            # if the first gap where action fits comes before the gap prior to this step
-            last_action = exp_sequence[which_gap]  # action before the gap
-            print("ix:", iter_ix, "Moving ", this_action, " after ", last_action)  # debug
-            this_action.change_start(last_action.end)
-            exp_sequence = prioritize_sequence(exp_sequence, sam_indx)
-            exp_sequence = find_gaps_compress_actions(exp_sequence)
-            iter_ix = iter_ix - 2  # going back two, to check that this_action moved correctly
+def add_tip_swaps(in_seq: List[ActionInfo], swap_s: int):
+    # before scheduling, the order of the actions is not known, so every action gets the time of
+    # a tip change (the worst case); drop_tip_swaps removes the ones the planned order does not need
+    # the actions after each 'load' of a sample start that much later, to keep its incubation time
+    shift = {}  # keeper: time added to its 'load' actions so far
+    for this_action in sorted(in_seq, key=lambda sort_action: sort_action.start):
+        keeper = this_action.keeper
+        if shift.get(keeper, 0) > 0:
+            this_action.change_start(this_action.start + shift[keeper])
+        this_action.set_tip_swap(swap_s)
+        if this_action.action == 'load':
+            shift[keeper] = shift.get(keeper, 0) + swap_s
+    return in_seq
+
+
+def drop_tip_swaps(in_seq: List[ActionInfo]):
+    # removes the tip change time of the actions that use the tip mounted by the action before them
+    # on the same pipette (each pipette mount keeps its own tip)
+    # the 'unload' keeps its start, and the other actions keep their end (they start later),
+    # so the incubation of each sample (end of 'load' to start of 'unload') does not change
+    # returns the number of tip changes left in the sequence
+    exp_sequence = as_action_sequence(in_seq)  # edited in place
+    exp_sequence.sort(key=lambda sort_action: sort_action.start)
+    num_swaps = 0
+    mounted_tip = {}  # pipette: tip mounted on it
+    for this_action in exp_sequence:
+        if this_action.tip_loc != mounted_tip.get(this_action.pipette):
+            num_swaps += 1
+        elif this_action.tip_swap_s > 0:
+            swap_s = this_action.tip_swap_s
+            this_action.set_tip_swap(0)
+            if this_action.action != 'unload':
+                exp_sequence.change_start(this_action, this_action.start + swap_s)
+        mounted_tip[this_action.pipette] = this_action.tip_loc
+    logger.debug("Tip changes in the planned sequence: %s of %s actions", num_swaps, len(exp_sequence))
+    return num_swaps
+
+
+def count_tip_swaps(exp_sequence: List[ActionInfo]):
+    # number of tip changes when the actions run in start order, the first tip of each pipette included
+    num_swaps = 0
+    mounted_tip = {}  # pipette: tip mounted on it
+    for this_action in sorted(exp_sequence, key=lambda sort_action: sort_action.start):
+        if this_action.tip_loc != mounted_tip.get(this_action.pipette):
+            num_swaps += 1
+            mounted_tip[this_action.pipette] = this_action.tip_loc
+    return num_swaps
+
+
+class TipBatchReport:
+    # result of batch_tip_runs(): tip changes of the time-ordered plan, and after batching
+    def __init__(self, swaps_before: int, swaps_after: int, swap_time_s: int, num_moved: int):
+        self.swaps_before = swaps_before  # tip changes in the time-ordered plan
+        self.swaps_after = swaps_after  # tip changes after batching
+        self.swap_time_s = swap_time_s  # est. time (s) of one tip change
+        self.num_moved = num_moved  # actions moved next to an action with the same tip
+
+    # returns this when calling this object
+    def __repr__(self):
+        this_string = "TipBatchReport(tip changes: " + str(self.swaps_before) + " -> " + \
+                      str(self.swaps_after) + ", saved " + str(self.swaps_saved) + " swaps, ~" + \
+                      str(self.time_saved_s) + "s, moved " + str(self.num_moved) + " actions)"
+        return this_string
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        return self.__repr__()
+
+    @property
+    def swaps_saved(self):
+        return self.swaps_before - self.swaps_after
+
+    @property
+    def time_saved_s(self):
+        return self.swaps_saved * self.swap_time_s
+
+
+# actions that batch_tip_runs may move: the timing of 'load' and 'unload' sets the incubation, so they stay
+TIP_BATCH_MOVABLE = ('mix', 'reload', 'rinse', 'transf')
+
+
+@profiled_stage
+def batch_tip_runs(in_seq: List[ActionInfo], swap_s: int, window_s: int, swap_time_s=None):
+    # groups actions that use the same tip into contiguous runs, so run_sequence swaps tips less often.
+    # Walking the sequence in start order, when the next action on the same pipette uses another tip, the
+    # first later action with the mounted tip (a 'rinse', or a timed action starting within window_s of the
+    # end of the mounted tip's action), and the actions right after it with the same tip, are moved right
+    # after the mounted tip's action, if no action of their own sample runs in between (the sample's order
+    # is kept) and this saves tip changes. The actions in between run after them, pushed later by at most
+    # window_s. Each pipette mount keeps its own tip, so only tip changes on the same pipette are counted.
+    # Only TIP_BATCH_MOVABLE actions move, so 'load' / 'unload' (the incubation) do not change.
+    # swap_s: planned time (s) of one tip change in the actions (ExperimentData.tip_swap_s, 0 if not planned);
+    # the planned swaps of the moved actions and of the next action on their pipette are updated,
+    # keeping the end of the action (the start of an 'unload'), as drop_tip_swaps does.
+    # swap_time_s: est. time (s) of one tip change for the report, defaults to swap_s
+    # returns (exp_sequence, TipBatchReport); in_seq is edited in place, and returned sorted by start
+    exp_sequence = as_action_sequence(in_seq)
+    exp_sequence.sort(key=lambda sort_action: sort_action.start)
+    if swap_time_s is None:
+        swap_time_s = swap_s
+    swaps_before = count_tip_swaps(exp_sequence)
+    actions = exp_sequence.to_list()  # start order, kept up to date as actions move
+    num_moved = 0
+
+    def in_window(move_action: ActionInfo, new_start: int):
+        # 'rinse' can run any time after its sample's 'unload', timed actions move earlier by window_s at most
+        return move_action.action == 'rinse' or move_action.start - new_start <= window_s
+
+    def next_on_mount(from_pos: int, step: int, mount: str):
+        # position of the first action on this pipette mount from from_pos, going by step (+1 or -1), or None
+        while 0 <= from_pos < len(actions):
+            if actions[from_pos].pipette == mount:
+                return from_pos
+            from_pos += step
+        return None
+
+    exp_sequence.begin()
+    pos = 0
+    while pos < len(actions) - 1:
+        this_action = actions[pos]
+        mount = this_action.pipette  # each pipette keeps its own tip, only this one's tip changes count
+        mount_pos = next_on_mount(pos + 1, 1, mount)
+        if mount_pos is None or actions[mount_pos].tip_loc == this_action.tip_loc:
+            pos += 1
+            continue
+        found = None  # first and last position of the run of actions to move
+        keepers_between = {actions[pos + 1].keeper}
+        for look_pos in range(pos + 2, len(actions)):
+            cand = actions[look_pos]
+            if cand.tip_loc == this_action.tip_loc and cand.action in TIP_BATCH_MOVABLE and \
+                    cand.keeper not in keepers_between and in_window(cand, this_action.end):
+                # the actions right after it with the same tip move with it
+                run_end = look_pos
+                while run_end + 1 < len(actions) and actions[run_end + 1].tip_loc == cand.tip_loc and \
+                        actions[run_end + 1].action in TIP_BATCH_MOVABLE and \
+                        actions[run_end + 1].keeper not in keepers_between and \
+                        in_window(actions[run_end + 1], this_action.end):
+                    run_end += 1
+                # tip changes on this mount around the old place: before -> run -> after,
+                # and before -> after once moved
+                before_tip = actions[next_on_mount(look_pos - 1, -1, mount)].tip_loc
+                after_pos = next_on_mount(run_end + 1, 1, mount)
+                after_tip = actions[after_pos].tip_loc if after_pos is not None else before_tip
+                if (before_tip != cand.tip_loc) + (cand.tip_loc != after_tip) > (before_tip != after_tip):
+                    found = (look_pos, run_end)
+                break
+            keepers_between.add(cand.keeper)
+        if found is None:
+            pos += 1
+            continue
+
+        # new starts of the run (on the mounted tip), then of the actions in between, pushed after it
+        run = actions[found[0]:found[1] + 1]
+        free_at = this_action.end
+        run_starts = []
+        for run_action in run:
+            run_starts.append(free_at)
+            free_at = free_at + run_action.length - run_action.tip_swap_s
+        new_starts = []
+        fits = True
+        for between in actions[pos + 1:found[0]]:
+            new_start = max(between.start, free_at)
+            if new_start != between.start and (between.action not in TIP_BATCH_MOVABLE or
+                                               new_start - between.start > window_s):
+                fits = False
+                break
+            new_starts.append(new_start)
+            free_at = new_start + between.length
+        if fits and found[1] + 1 < len(actions):
+            fits = free_at <= actions[found[1] + 1].start
+
+        # the next action on this mount after the run's old place follows another tip now,
+        # check its tip change still fits
+        before_tip = actions[next_on_mount(found[0] - 1, -1, mount)].tip_loc
+        after_pos = next_on_mount(found[1] + 1, 1, mount)
+        after_swap = None  # new tip change time of the action at after_pos, None if it does not change
+        if fits and after_pos is not None and swap_s > 0:
+            after = actions[after_pos]
+            if after.tip_loc != before_tip and after.tip_swap_s == 0:
+                after_swap = swap_s
+                prev_end = free_at if after_pos == found[1] + 1 else actions[after_pos - 1].end
+                if after.action == 'unload':
+                    next_start = actions[after_pos + 1].start if after_pos + 1 < len(actions) else None
+                    fits = prev_end <= after.start and (next_start is None or after.end + swap_s <= next_start)
+                else:
+                    fits = prev_end <= after.start - swap_s
+            elif after.tip_loc == before_tip and after.tip_swap_s > 0:
+                after_swap = 0
+        if not fits:
+            pos += 1
+            continue
+
+        logger.debug("Batching %s actions from %s after %s (same tip %s)", len(run), run[0], this_action,
+                     this_action.tip_loc)
+        for indx in range(len(run)):
+            if run[indx].tip_swap_s > 0:
+                run[indx].set_tip_swap(0)  # uses the mounted tip
+            exp_sequence.change_start(run[indx], run_starts[indx])
+        for indx in range(len(new_starts)):
+            between = actions[pos + 1 + indx]
+            if between.start != new_starts[indx]:
+                exp_sequence.change_start(between, new_starts[indx])
+        if after_swap is not None:
+            after = actions[after_pos]
+            old_swap = after.tip_swap_s
+            old_start = after.start
+            after.set_tip_swap(after_swap)
+            if after.action != 'unload':
+                exp_sequence.change_start(after, old_start + old_swap - after_swap)  # same end
+        del actions[found[0]:found[1] + 1]
+        actions[pos + 1:pos + 1] = run
+        num_moved += len(run)
+        pos += len(run)
+
+    exp_sequence.sort(key=lambda sort_action: sort_action.start)
+    exp_sequence.commit()
+    report = TipBatchReport(swaps_before, count_tip_swaps(exp_sequence), swap_time_s, num_moved)
+    logger.debug("%s", report)
+    return exp_sequence, report
+
+
+class TipForecast:
+    # result of forecast_tip_refills(): tip demand of the planned sequence, and the planned tip rack refills
+    def __init__(self):
+        self.demand = {}  # pipette: [(first use (s), tips taken so far), ...] in time order
+        self.capacity = {}  # pipette: tips in the racks that the sequence can take
+        self.run_out_s = {}  # pipette: first use (s) of the first tip beyond capacity, None if the racks suffice
+        self.peak_in_use = {}  # pipette: most tips taken and not yet spent at one time (the racks hold at least these)
+        self.refills = []  # (start (s), end (s), pipette, ((slot, tip), ...) positions to refill), by start
+
+    # returns this when calling this object
+    def __repr__(self):
+        this_string = "TipForecast("
+        for pipette in self.demand:
+            this_string = this_string + pipette + ": " + str(self.num_tips(pipette)) + " of " + \
+                          str(self.capacity[pipette]) + " tips, "
+        this_string = this_string + str(len(self.refills)) + " refills)"
+        return this_string
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        return self.__repr__()
+
+    def num_tips(self, pipette: str):
+        # fresh tips the sequence takes on this pipette
+        if not self.demand.get(pipette):
+            return 0
+        return self.demand[pipette][-1][1]
+
+
+def idle_gaps(exp_sequence: List[ActionInfo]):
+    # [(gap_start, gap_end), ...] of the time between the actions of a sequence sorted by start
+    gaps = []
+    busy_until = None
+    for this_action in exp_sequence:
+        if busy_until is not None and this_action.start > busy_until:
+            gaps.append((busy_until, this_action.start))
+        if busy_until is None or this_action.end > busy_until:
+            busy_until = this_action.end
+    return gaps
+
+
+@profiled_stage
+def forecast_tip_refills(in_seq: List[ActionInfo], inventories: dict, refill_time_s: int):
+    # tip demand over the planned sequence, and operator refills of the tip racks where the tips run out.
+    # A tip is taken at its first action and is spent after its last action (each sample keeps its tip),
+    # so a refill can only reuse the positions of samples that are done: the racks still need to hold
+    # the tips in use at one time (TipForecast.peak_in_use).
+    # When a pipette's inventory planned refills (TipInventory.allow_refill, tips (slot, tip, generation)),
+    # the tips are mapped to rack positions in order of first use; when no position is left, a refill is
+    # placed in the latest idle gap of at least refill_time_s before that first use, where the operator
+    # puts fresh tips in the positions of the tips spent by then (except the tip still on the pipette).
+    # The refill pauses are in idle time, so no action moves. ValueError if there is no such gap.
+    # inventories: {pipette: TipInventory or None}
+    # returns TipForecast; the tips of the actions in in_seq are changed in place to rack positions
+    exp_sequence = sorted(in_seq, key=lambda sort_action: sort_action.start)
+    gaps = [gap for gap in idle_gaps(exp_sequence) if gap[1] - gap[0] >= refill_time_s]
+    forecast = TipForecast()
+    for pipette, inventory in inventories.items():
+        if inventory is None:
+            continue
+        pip_actions = [this_action for this_action in exp_sequence if this_action.pipette == pipette]
+        uses = {}  # tip: [first start, last end], in order of first use
+        for this_action in pip_actions:
+            if this_action.tip_loc not in uses:
+                uses[this_action.tip_loc] = [this_action.start, this_action.end]
+            uses[this_action.tip_loc][1] = max(uses[this_action.tip_loc][1], this_action.end)
+        # positions of owners that do not use their tip in this sequence (reservoirs, eg: dilutions)
+        # may be wet: they are not taken, but can be refilled
+        kept = set(tip_loc for tip_loc in inventory.tip_owner if len(tip_loc) == 2 and tip_loc not in uses)
+        positions = [tip_loc for tip_loc in inventory.positions() if tip_loc not in kept]
+        forecast.capacity[pipette] = len(positions)
+        forecast.demand[pipette] = []
+        forecast.run_out_s[pipette] = None
+        num_taken = 0
+        for tip_loc, use in uses.items():
+            num_taken += 1
+            forecast.demand[pipette].append((use[0], num_taken))
+            if num_taken > len(positions) and forecast.run_out_s[pipette] is None:
+                forecast.run_out_s[pipette] = use[0]
+        spent_ends = sorted(use[1] for use in uses.values())
+        num_spent = 0
+        peak = 0
+        for taken in range(len(forecast.demand[pipette])):
+            while num_spent < len(spent_ends) and spent_ends[num_spent] <= forecast.demand[pipette][taken][0]:
+                num_spent += 1
+            peak = max(peak, taken + 1 - num_spent)
+        forecast.peak_in_use[pipette] = peak
+        if not any(len(tip_loc) == 3 for tip_loc in uses):
+            continue  # tips are rack positions already
+
+        fresh = list(positions)  # positions with a fresh tip, taken from the front
+        spent = [(None, tip_loc) for tip_loc in sorted(kept)]  # [(last end, position), ...] of the tips taken
+        new_tip = {}  # planned tip: rack position
+        refill_after = None  # end of the last refill of this pipette
+        pip_ends = [this_action.end for this_action in pip_actions]  # ascending, the actions do not overlap
+        for tip_loc, use in uses.items():
+            if not fresh:
+                refill = None
+                for gap in reversed(gaps):
+                    if gap[0] + refill_time_s > use[0]:
+                        continue
+                    if refill_after is not None and gap[0] < refill_after:
+                        break
+                    # tip on the pipette during the gap: of its last action before the gap
+                    act_pos = bisect.bisect_right(pip_ends, gap[0])
+                    mounted = new_tip.get(pip_actions[act_pos - 1].tip_loc) if act_pos > 0 else None
+                    refilled = [item[1] for item in spent if (item[0] is None or item[0] <= gap[0]) and
+                                item[1] != mounted]
+                    if refilled:
+                        refill = (gap[0], gap[0] + refill_time_s, pipette, tuple(sorted(refilled)))
+                        break
+                if refill is None:
+                    s_out = pipette.capitalize() + " pipette tips run out at " + str(use[0]) + \
+                            "s, and no idle time of " + str(refill_time_s) + "s with spent tips comes before " + \
+                            "it to refill the tip racks (up to " + str(forecast.peak_in_use[pipette]) + \
+                            " tips are in use at once, the racks hold " + str(len(positions) + len(kept)) + \
+                            "). Please load more tips, or update tip_refill_time_s in user_config_exp()."
+                    raise ValueError(s_out)
+                logger.debug("Tip refill of the %s pipette at %s s, %s tips", pipette, refill[0], len(refill[3]))
+                forecast.refills.append(refill)
+                refill_after = refill[1]
+                spent = [item for item in spent if item[1] not in refill[3]]
+                fresh = list(refill[3])
+            new_tip[tip_loc] = fresh.pop(0)
+            spent.append((use[1], new_tip[tip_loc]))
+        for this_action in pip_actions:
+            this_action.change_tip(new_tip[this_action.tip_loc])
+    forecast.refills.sort()
+    logger.debug("%s", forecast)
+    return forecast
+
+
+WASTE_RINSE_MARGIN_UL = 1000  # uL, headspace kept in waste and volume kept in rinse reservoirs, as give_waste_loc
+
+
+class WasteRinseReport:
+    # result of allocate_waste_rinse(): gantry travel of the unloads and rinses, against filling the
+    # waste and rinse reservoirs one at a time in list order (give_waste_loc / give_rinse_loc)
+    def __init__(self, num_assigned: int, travel: int, travel_in_order, end_vols: dict):
+        self.num_assigned = num_assigned  # unload and rinse actions given a waste and rinse reservoir
+        self.travel = travel  # deck slots moved, sample -> waste -> rinse -> sample, for all of them
+        self.travel_in_order = travel_in_order  # the same, one reservoir at a time; None if they run out
+        self.end_vols = end_vols  # waste / rinse loc: uL at the end of the sequence
+
+    # returns this when calling this object
+    def __repr__(self):
+        this_string = "WasteRinseReport(" + str(self.num_assigned) + " unloads/rinses, travel " + \
+                      str(self.travel) + " slots, in list order " + str(self.travel_in_order) + " slots)"
+        return this_string
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        return self.__repr__()
+
+
+@profiled_stage
+def allocate_waste_rinse(exp: ExperimentData, exp_sequence: List[ActionInfo], ledger: VolumeLedger):
+    # gives each 'unload' and 'rinse' a rinse reservoir to draw from and a waste reservoir to empty into:
+    # in start order, the pair with the least gantry travel (sample -> waste -> rinse -> sample, in deck
+    # slots, see deck_distance) that still has room (waste) or volume (rinse) left at the end of the
+    # sequence, keeping WASTE_RINSE_MARGIN_UL, as in the ledger; ties go to the pair with the most left,
+    # so the reservoirs are used evenly and none runs dry early. An unload rinses the well twice.
+    # The action stays a transfer of the sample's liquid (its ledger volume at the start of the action)
+    # from the sample (par_loc) to the waste (targ_loc); the pair and the rinse volume
+    # go in the action's rinse_loc / waste_loc / rinse_vol, so the waste takes the unloaded liquid plus
+    # the rinse. A well listed as both waste and rinse can serve as both: the rinse goes back into it,
+    # so it only has to hold the rinse volume at the start and room for the unloaded liquid.
+    # returns WasteRinseReport, or None if the ledger has no waste or rinse reservoirs;
+    # ValueError if the reservoirs run out
+    res_locs = set(res.loc for res_rack in exp.all_res_data for res in res_rack if res.loc in ledger.max_vol)
+    waste_locs = [loc for loc in exp.waste_res_locs if loc in res_locs]
+    rinse_locs = [loc for loc in exp.rinse_res_locs if loc in res_locs]
+    if not waste_locs or not rinse_locs:
+        return None
+    end_s = max([this_action.end for this_action in exp_sequence] + [0])
+    # uL in each waste / rinse reservoir at the end of the sequence, a shared well has one level
+    level = {loc: ledger.volume_at(loc, end_s) for loc in waste_locs + rinse_locs}
+
+    def fits(vols: dict, waste_loc, rinse_loc, unload_vol, rinse_vol):
+        # room in the waste and volume in the rinse for this action, keeping WASTE_RINSE_MARGIN_UL
+        if rinse_loc == waste_loc:
+            return vols[rinse_loc] - rinse_vol >= WASTE_RINSE_MARGIN_UL and \
+                vols[waste_loc] + unload_vol <= ledger.max_vol[waste_loc] - WASTE_RINSE_MARGIN_UL
+        return vols[rinse_loc] - rinse_vol >= WASTE_RINSE_MARGIN_UL and \
+            vols[waste_loc] + unload_vol + rinse_vol <= ledger.max_vol[waste_loc] - WASTE_RINSE_MARGIN_UL
+
+    def use(vols: dict, waste_loc, rinse_loc, unload_vol, rinse_vol):
+        vols[rinse_loc] -= rinse_vol
+        vols[waste_loc] += unload_vol + rinse_vol
+
+    in_order = [0, 0, 0]  # waste index, rinse index, travel, as give_waste_loc / give_rinse_loc
+    in_order_level = dict(level)
+    travel = 0
+    num_assigned = 0
+    for this_action in sorted(exp_sequence, key=lambda sort_action: sort_action.start):
+        if this_action.action not in ('unload', 'rinse'):
+            continue
+        keeper = this_action.keeper
+        sam_slot = keeper[0]
+        sam_vol = ledger.max_vol.get(keeper, 400)
+        rinse_vol = 2 * sam_vol if this_action.action == 'unload' else sam_vol
+        ledger.remove_action(this_action)
+        unload_vol = max(ledger.volume_at(keeper, this_action.start), 0)
+        best = None
+        for waste_loc in waste_locs:
+            for rinse_loc in rinse_locs:
+                if not fits(level, waste_loc, rinse_loc, unload_vol, rinse_vol):
+                    continue
+                room = ledger.max_vol[waste_loc] - WASTE_RINSE_MARGIN_UL - level[waste_loc]
+                cost = (deck_distance(sam_slot, waste_loc[0]) + deck_distance(waste_loc[0], rinse_loc[0]) +
+                        deck_distance(rinse_loc[0], sam_slot),
+                        -min(room / ledger.max_vol[waste_loc], (level[rinse_loc] - WASTE_RINSE_MARGIN_UL) /
+                             max(ledger.max_vol.get(rinse_loc, 1), 1)))
+                if best is None or cost < best[0]:
+                    best = (cost, waste_loc, rinse_loc)
+        if best is None:
+            ledger.add_action(this_action)
+            s_out = "Waste or rinse reservoirs run out at the " + this_action.action + " of sample " + \
+                    str(keeper) + " (" + str(this_action.start) + "s). Load more and restart planning phase."
+            raise ValueError(s_out)
+        cost, waste_loc, rinse_loc = best
+        this_action.set_parent(keeper)
+        this_action.set_targ(waste_loc)
+        this_action.set_vol(unload_vol)
+        this_action.set_rinse_waste(rinse_loc, waste_loc, rinse_vol)
+        ledger.add_action(this_action)
+        use(level, waste_loc, rinse_loc, unload_vol, rinse_vol)
+        travel += cost[0]
+        num_assigned += 1
+
+        # one reservoir at a time, for the report
+        if in_order is not None:
+            while in_order[0] < len(waste_locs) and in_order[1] < len(rinse_locs) and \
+                    not fits(in_order_level, waste_locs[in_order[0]], rinse_locs[in_order[1]], unload_vol, rinse_vol):
+                waste_loc = waste_locs[in_order[0]]
+                rinse_loc = rinse_locs[in_order[1]]
+                if in_order_level[rinse_loc] - rinse_vol < WASTE_RINSE_MARGIN_UL:
+                    in_order[1] += 1
+                else:
+                    in_order[0] += 1
+            if in_order[0] >= len(waste_locs) or in_order[1] >= len(rinse_locs):
+                in_order = None
+            else:
+                waste_loc = waste_locs[in_order[0]]
+                rinse_loc = rinse_locs[in_order[1]]
+                use(in_order_level, waste_loc, rinse_loc, unload_vol, rinse_vol)
+                in_order[2] += deck_distance(sam_slot, waste_loc[0]) + deck_distance(waste_loc[0], rinse_loc[0]) + \
+                    deck_distance(rinse_loc[0], sam_slot)
+    end_vols = {loc: ledger.volume_at(loc, end_s) for loc in waste_locs + rinse_locs}
+    return WasteRinseReport(num_assigned, travel, in_order[2] if in_order is not None else None, end_vols)
+
+
+def find_incub_targets(exp_sequence: List[ActionInfo]):
+    # target incubation for each sample: time from the end of its last 'load'
+    # to the start of its first 'unload', as planned in exp_sequence
+    load_end = {}  # keeper: end of the last 'load'
+    unload_start = {}  # keeper: start of the first 'unload'
+    for this_action in exp_sequence:
+        keeper = this_action.keeper
+        if this_action.action == 'load':
+            if keeper not in load_end or this_action.end > load_end[keeper]:
+                load_end[keeper] = this_action.end
+        elif this_action.action == 'unload':
+            if keeper not in unload_start or this_action.start < unload_start[keeper]:
+                unload_start[keeper] = this_action.start
+    incub_targ = {}
+    for keeper in load_end:
+        if keeper in unload_start and unload_start[keeper] >= load_end[keeper]:
+            incub_targ[keeper] = unload_start[keeper] - load_end[keeper]
+    return incub_targ
+
+
+@profiled_stage
+def certify_sequence(exp_sequence: List[ActionInfo], incub_targ: dict, max_incub_error_s=10):
+    # checks a planned sequence and returns a ScheduleCertificate,
+    # see ScheduleCertificate for the three conditions
+    cert = ScheduleCertificate(incub_targ, max_incub_error_s)
+    num_actions = len(exp_sequence)
+    cert.num_actions = num_actions
+    by_start = sorted(range(num_actions), key=lambda pos: (exp_sequence[pos].start, pos))
+
+    busy_pos = None  # position of the action that ends last, so far
+    last_phase = {}  # keeper: (phase, pos) of its latest action so far
+    load_end = {}  # keeper: end of its last 'load'
+    for pos in by_start:
+        this_action = exp_sequence[pos]
+        keeper = this_action.keeper
+        if busy_pos is not None and this_action.start < exp_sequence[busy_pos].end:
+            cert.overlaps.append((busy_pos, pos))
+        if busy_pos is None or this_action.end > exp_sequence[busy_pos].end:
+            busy_pos = pos
+        if this_action.action in SAMPLE_PHASE:
+            phase = SAMPLE_PHASE[this_action.action]
+            if keeper in last_phase and phase < last_phase[keeper]:
+                cert.order_errors.append((keeper, pos))
+            else:
+                last_phase[keeper] = phase
+        if this_action.action == 'load':
+            load_end[keeper] = this_action.end
+        elif this_action.action == 'unload' and keeper in incub_targ and keeper not in cert.incub_errors:
+            if keeper not in load_end:
+                cert.order_errors.append((keeper, pos))  # unloaded before it was loaded
+            else:
+                cert.incub_errors[keeper] = this_action.start - (load_end[keeper] + incub_targ[keeper])
+    for keeper in incub_targ:
+        if keeper not in cert.incub_errors and keeper in load_end:
+            cert.order_errors.append((keeper, None))  # loaded, but never unloaded
+    return cert
+
+
+def timed_pattern(chain: List[ActionInfo], targ_start):
+    # [(offset from the first load, action)] of the timed actions (loads, mixes, reloads, unload) of one
+    # sample after its first load, chain[0]. The offsets are spaced so the reserved slots of a sample never
+    # overlap each other (GapIndex.take fails on a reload planned close to a mix otherwise).
+    first_start = targ_start[chain[0]]
+    pattern = []
+    free_from = chain[0].length  # offset where the previous timed action ends
+    for this_action in chain[1:]:
+        if SAMPLE_PHASE.get(this_action.action, 3) < SAMPLE_PHASE['rinse']:
+            offset = max(targ_start[this_action] - first_start, free_from)  # no overlap within a sample
+            pattern.append((offset, this_action))
+            free_from = offset + this_action.length
+    return pattern
+
+
+@profiled_stage
+def fixed_point_schedule(in_seq: List[ActionInfo], sam_indx: Tuple[int], max_incub_error_s=10):
+    # Schedules the actions in a single pass and returns (exp_sequence, certificate),
+    # instead of repeating shift_timestamp() until the overlaps are gone.
+    # Each sample's actions form a chain (load < mix < unload < rinse), and only the next action
+    # of each chain waits in a heap keyed on (release time, action rank, load rank).
+    # When the first 'load' of a sample is placed, the load is delayed until the slots of its
+    # timed actions (loads, mixes, reloads and unload, at their planned offsets) are all free,
+    # and those slots are reserved in a GapIndex, like shift_all_for_load shifts a whole sample.
+    # Other actions cannot take a reserved slot, so each sample incubates for its planned time.
+    # 'rinse' and other actions go in the first free gap at or after their release time:
+    # the target start shifted by the delay of the sample's load, and the end of its previous action.
+    # Each action is placed once, with a GapIndex query and update (see GapIndex for their cost).
+    # in_seq is edited in place, and returned sorted by the new start times
+    exp_sequence = as_action_sequence(in_seq)
+    num_actions = len(exp_sequence)
+    incub_targ = find_incub_targets(exp_sequence)
+    if num_actions == 0:
+        return exp_sequence, certify_sequence(exp_sequence, incub_targ, max_incub_error_s)
+    logger.debug("Running: fixed_point_schedule(). Scheduling %s actions in one pass.", num_actions)
+    exp_sequence.begin()
+    load_rank = find_load_rank(sam_indx)  # sample keeper: position in the sample load order
+    last_rank = len(sam_indx)
+
+    # one chain of actions per keeper, in the order they have to run
+    targ_start = {}  # action: target start, before scheduling
+    chains = {}  # keeper: list of actions
+    for this_action in exp_sequence:
+        targ_start[this_action] = this_action.start
+        chains.setdefault(this_action.keeper, []).append(this_action)
+    timed = {}  # keeper: list of (offset from first load, action) for its timed actions after the first load
+    for keeper, chain in chains.items():
+        chain.sort(key=lambda sort_action: (SAMPLE_PHASE.get(sort_action.action, 1), sort_action.start))
+        if chain[0].action == 'load':
+            timed[keeper] = timed_pattern(chain, targ_start)
+
+    # timeline of free time, extended when it runs out
+    time_zero = min(targ_start.values())
+    horizon = max(this_action.end for this_action in exp_sequence) + \
+        sum(this_action.length for this_action in exp_sequence)
+    gaps = GapIndex([])
+    gaps.release(time_zero, horizon)
+
+    def fit(earliest: int, length: int):
+        # first start at or after earliest where the free time fits length
+        nonlocal horizon
+        start = gaps.find_fit(length, earliest, horizon)
+        while start is None:
+            gaps.release(horizon, 2 * horizon - time_zero)
+            horizon = 2 * horizon - time_zero
+            start = gaps.find_fit(length, earliest, horizon)
+        return start
+
+    def fit_pattern(earliest: int, length: int, pattern):
+        # first start at or after earliest for an action of this length,
+        # such that every (offset, action) in pattern fits at start + offset
+        start = fit(earliest, length)
+        moved = True
+        while moved:
+            moved = False
+            for offset, this_action in pattern:
+                free_at = fit(start + offset, this_action.length)
+                if free_at != start + offset:
+                    start = fit(free_at - offset, length)  # try again from the first time it fits
+                    moved = True
+                    break
+        return start
+
+    delay = {}  # keeper: how much its first 'load' was delayed
+    prev_end = {}  # keeper: end of its last placed action
+    reserved = {}  # action: start reserved for it
+    next_k = {}  # keeper: index of the next action to place in its chain
+    waiting = []  # heap of (release, action rank, load rank, counter, keeper)
+    counter = 0
+
+    def push_next(keeper):
+        # put the next action of keeper in the heap, with its release time
+        nonlocal counter
+        k = next_k[keeper]
+        chain = chains[keeper]
+        if k >= len(chain):
+            return
+        this_action = chain[k]
+        if this_action in reserved:
+            release = reserved[this_action]
         else:
-            iter_ix = iter_ix + 1  # iterating forward for 'load', 'reload' and 'unload'
+            release = targ_start[this_action] + delay.get(keeper, 0)
+            if keeper in prev_end and prev_end[keeper] > release:
+                release = prev_end[keeper]
+        heapq.heappush(waiting, (release, ACTION_RANK.get(this_action.action, OTHER_ACTION_RANK),
+                                 load_rank.get(keeper, last_rank), counter, keeper))
+        counter += 1
+
+    for keeper in chains:
+        next_k[keeper] = 0
+        push_next(keeper)
+
+    while waiting:
+        release, act_rank, sam_rank, count, keeper = heapq.heappop(waiting)
+        this_action = chains[keeper][next_k[keeper]]
+        length = this_action.length
+        if this_action in reserved:
+            start = reserved.pop(this_action)
+            gaps.release(start, start + length)  # give back the reserved slot, taken again below
+        elif next_k[keeper] == 0 and keeper in timed:
+            # first load of a sample, delay it until all of its timed actions fit
+            start = fit_pattern(release, length, timed[keeper])
+            delay[keeper] = start - targ_start[this_action]
+            for offset, timed_action in timed[keeper]:
+                gaps.take(start + offset, timed_action.length)
+                reserved[timed_action] = start + offset
+        else:
+            start = fit(release, length)
+        gaps.take(start, length)
+        if this_action.start != start:
+            exp_sequence.change_start(this_action, start)
+        prev_end[keeper] = this_action.end
+        next_k[keeper] += 1
+        push_next(keeper)
 
+    exp_sequence.sort(key=lambda sort_action: sort_action.start)
+    exp_sequence.commit()
+    cert = certify_sequence(exp_sequence, incub_targ, max_incub_error_s)
+    logger.debug("%s", cert)
+    return exp_sequence, cert
+
+
+@profiled_stage
+def plan_optimal_sequence(exp: ExperimentData, in_seq: List[ActionInfo], time_budget_s=None, incub_targ=None):
+    # 'optimal' planning mode: the actions are a disjunctive scheduling problem
+    # (1) one pipette: no two actions overlap
+    # (2) each sample's actions keep their order, eg: load < mix < unload < rinse
+    # (3) release times from the end of the sample's load: mixes and reloads at their offsets in the
+    #     heuristic plan (in_seq), unload at the target incubation
+    # (4) hard limit: unload start <= end of load + target incubation + exp.max_incub_error_s,
+    #     branches that cannot meet it are pruned
+    # cost = makespan + incub_error_weight * total incubation error (seconds of overshoot)
+    # (5) an action takes exp.tip_swap_s longer when its tip is not the one mounted on its pipette,
+    #     and among actions that can start at the same time, the one using the mounted tip is tried first
+    # Depth-first branch-and-bound over which sample's next action goes next,
+    # only branching on actions that can start before the earliest one ends (active schedules),
+    # so the result is the best of the schedules searched, not a proven optimum over all schedules.
+    # The heuristic plan in in_seq is the incumbent, and the search stops at the time budget;
+    # in_seq is kept if nothing better is found, or if the best plan fails the schedule certificate.
+    # incub_targ: keeper: target incubation (s), as in certify_sequence; defaults to targ_incub_time_s
+    # in_seq is edited in place, and returned sorted by the new start times
+    exp_sequence = as_action_sequence(in_seq)
+    num_actions = len(exp_sequence)
+    if num_actions == 0:
+        return exp_sequence
+    if time_budget_s is None:
+        time_budget_s = exp.plan_time_budget_s
+    weight = exp.incub_error_weight
+    max_error = exp.max_incub_error_s
+    swap_s = exp.tip_swap_s
+    load_rank = exp.load_rank  # sample keeper: position in the sample load order
+    last_rank = len(exp.incub_loc_order)
+
+    # group the actions into one chain per keeper, in their current order
+    def sort_key(sort_action: ActionInfo):
+        return sort_action.start, ACTION_RANK.get(sort_action.action, OTHER_ACTION_RANK)
+
+    chain_of = {}  # keeper: chain index
+    chains = []  # list of action lists, one for each keeper
+    for this_action in sorted(exp_sequence, key=sort_key):
+        if this_action.keeper not in chain_of:
+            chain_of[this_action.keeper] = len(chains)
+            chains.append([])
+        chains[chain_of[this_action.keeper]].append(this_action)
+    num_chains = len(chains)
+
+    # for each action: duration, and release offset from the end of the last 'load' (or None)
+    durations = []  # per chain, list of action lengths, without tip changes
+    tips = []  # per chain, list of action tips
+    pipettes = []  # per chain, list of action pipettes
+    offsets = []  # per chain, list of release offsets, None if no release time
+    last_load = []  # per chain, index of the last 'load' action (-1 if none)
+    targ_incub = []  # per chain, target incubation time in seconds (None if not a sample)
+    unload_at = []  # per chain, index of the first 'unload' (None if none)
+    ranks = []  # per chain, (action rank of each action, load rank)
+    for chain in chains:
+        keeper = chain[0].keeper
+        targ = None
+        if incub_targ is not None:
+            targ = incub_targ.get(keeper)
+        else:
+            try:
+                sam_indx = exp.find_sam_in_nest_list(keeper)
+                targ = exp.all_samples[sam_indx[0]][sam_indx[1]].targ_incub_time_s
+            except (ValueError, IndexError):
+                pass  # not a sample, eg: a dilution reservoir
+        load_indx = -1
+        unload_indx = None
+        for indx in range(len(chain)):
+            if chain[indx].action == 'load':
+                load_indx = indx
+            elif chain[indx].action == 'unload' and unload_indx is None:
+                unload_indx = indx
+        chain_offsets = []
+        for indx in range(len(chain)):
+            this_action = chain[indx]
+            offset = None
+            if indx > load_indx >= 0:
+                offset = 0  # after the sample is loaded
+                if this_action.action in ('mix', 'reload'):
+                    offset = max(this_action.start - chain[load_indx].end, 0)  # as in the heuristic plan
+                elif this_action.action == 'unload' and targ is not None:
+                    offset = targ
+            chain_offsets.append(offset)
+        durations.append([this_action.length - this_action.tip_swap_s for this_action in chain])
+        tips.append([this_action.tip_loc for this_action in chain])
+        pipettes.append([this_action.pipette for this_action in chain])
+        offsets.append(chain_offsets)
+        last_load.append(load_indx)
+        targ_incub.append(targ)
+        unload_at.append(unload_indx if targ is not None else None)
+        ranks.append(([ACTION_RANK.get(this_action.action, OTHER_ACTION_RANK) for this_action in chain],
+                      load_rank.get(chain[0].keeper, last_rank)))
+
+    # suffix sums for the lower bound of each chain
+    # tail[c][k]: time to run actions k.. of chain c, back to back
+    # rel_tail[c][k]: latest end of actions k.. of chain c, relative to the end of load
+    tail = []
+    rel_tail = []
+    for c in range(num_chains):
+        chain_len = len(chains[c])
+        c_tail = [0] * (chain_len + 1)
+        c_rel = [None] * (chain_len + 1)
+        for k in range(chain_len - 1, -1, -1):
+            c_tail[k] = c_tail[k + 1] + durations[c][k]
+            c_rel[k] = c_rel[k + 1]
+            if offsets[c][k] is not None:
+                this_end = offsets[c][k] + c_tail[k]
+                if c_rel[k] is None or this_end > c_rel[k]:
+                    c_rel[k] = this_end
+        tail.append(c_tail)
+        rel_tail.append(c_rel)
+
+    first_start = min(this_action.start for this_action in exp_sequence)
+    total_work = sum(tail[c][0] for c in range(num_chains))
+
+    # search state
+    next_k = [0] * num_chains  # next action to place in each chain
+    prev_end = [first_start] * num_chains  # end of the last placed action in each chain
+    load_end = [None] * num_chains  # end of the last 'load' in each chain
+    starts = [[None] * len(chains[c]) for c in range(num_chains)]  # placed start times
+    swaps = [[0] * len(chains[c]) for c in range(num_chains)]  # placed tip change times
+    state = {'free': first_start, 'makespan': first_start, 'error': 0, 'work': total_work, 'late': 0}
+    mounted = {}  # pipette: tip mounted on it
+
+    def swap_time(c: int):
+        # tip change time before the next action of chain c
+        if tips[c][next_k[c]] != mounted.get(pipettes[c][next_k[c]]):
+            return swap_s
+        return 0
+
+    def release(c: int):
+        # earliest start for the next action of chain c
+        k = next_k[c]
+        earliest = max(state['free'], prev_end[c])
+        if offsets[c][k] is not None and load_end[c] is not None:
+            earliest = max(earliest, load_end[c] + offsets[c][k])
+        return earliest
+
+    def place(c: int, start: int):
+        # place the next action of chain c at start, returns the info needed to undo it
+        k = next_k[c]
+        saved = (c, prev_end[c], load_end[c], state['free'], state['makespan'], state['error'], state['work'],
+                 state['late'], mounted.get(pipettes[c][k]))
+        swaps[c][k] = swap_time(c)
+        end = start + swaps[c][k] + durations[c][k]
+        starts[c][k] = start
+        if k == last_load[c]:
+            load_end[c] = end
+        elif k == unload_at[c] and load_end[c] is not None:
+            error = start - (load_end[c] + targ_incub[c])  # overshoot, never negative
+            state['error'] += error
+            if error > max_error:
+                state['late'] += 1  # past the incubation limit
+        prev_end[c] = end
+        state['free'] = end
+        state['makespan'] = max(state['makespan'], end)
+        state['work'] -= durations[c][k]
+        mounted[pipettes[c][k]] = tips[c][k]
+        next_k[c] = k + 1
+        return saved
+
+    def undo(saved):
+        c = saved[0]
+        next_k[c] -= 1
+        starts[c][next_k[c]] = None
+        prev_end[c] = saved[1]
+        load_end[c] = saved[2]
+        state['free'], state['makespan'], state['error'], state['work'], state['late'] = saved[3:8]
+        mounted[pipettes[c][next_k[c]]] = saved[8]
+
+    def cannot_meet_limit():
+        # True if an unload is late, or a loaded sample can no longer be unloaded within the limit
+        if state['late']:
+            return True
+        for c in range(num_chains):
+            k = next_k[c]
+            if load_end[c] is not None and unload_at[c] is not None and k <= unload_at[c]:
+                earliest = max(state['free'], prev_end[c]) + tail[c][k] - tail[c][unload_at[c]]
+                if earliest > load_end[c] + targ_incub[c] + max_error:
+                    return True
+        return False
+
+    def lower_bound():
+        bound = max(state['makespan'], state['free'] + state['work'])
+        for c in range(num_chains):
+            k = next_k[c]
+            if k < len(chains[c]):
+                chain_bound = max(state['free'], prev_end[c]) + tail[c][k]
+                if load_end[c] is not None and rel_tail[c][k] is not None:
+                    chain_bound = max(chain_bound, load_end[c] + rel_tail[c][k])
+                bound = max(bound, chain_bound)
+        return bound + weight * state['error']
+
+    def candidates():
+        # chains whose next action can start before the earliest possible end
+        # (start, tip change, action rank, load rank, chain), so the mounted tip is reused first
+        options = []
+        min_end = None
+        for c in range(num_chains):
+            if next_k[c] < len(chains[c]):
+                earliest = release(c)
+                this_swap = swap_time(c)
+                options.append((earliest, this_swap, ranks[c][0][next_k[c]], ranks[c][1], c))
+                this_end = earliest + this_swap + durations[c][next_k[c]]
+                if min_end is None or this_end < min_end:
+                    min_end = this_end
+        options = [option for option in options if option[0] < min_end]
+        options.sort()
+        return options
+
+    # incumbent: the heuristic plan as it is
+    heur_end = max(this_action.end for this_action in exp_sequence)
+    heur_error = 0
+    for c in range(num_chains):
+        if unload_at[c] is not None and last_load[c] >= 0:
+            heur_error += abs(chains[c][unload_at[c]].start - (chains[c][last_load[c]].end + targ_incub[c]))
+    best_cost = heur_end + weight * heur_error
+    heur_cost = best_cost
+    best_starts = None  # None: keep the heuristic plan
+    best_swaps = None
+    # warm start: the heuristic order, with each action placed as early as allowed, if within the limit
+    for this_action in sorted(exp_sequence, key=sort_key):
+        c = chain_of[this_action.keeper]
+        place(c, release(c))
+    if not state['late'] and state['makespan'] + weight * state['error'] < best_cost:
+        best_cost = state['makespan'] + weight * state['error']
+        best_starts = [list(chain_starts) for chain_starts in starts]
+        best_swaps = [list(chain_swaps) for chain_swaps in swaps]
+    for c in range(num_chains):
+        next_k[c] = 0
+        prev_end[c] = first_start
+        load_end[c] = None
+        starts[c] = [None] * len(chains[c])
+    state['free'] = first_start
+    state['makespan'] = first_start
+    state['error'] = 0
+    state['work'] = total_work
+    state['late'] = 0
+    mounted.clear()
+
+    # depth-first branch-and-bound with an explicit stack
+    stop_time = time.perf_counter() + time_budget_s
+    nodes = 0
+    timed_out = False
+    stack = [[candidates(), 0, None]]  # [options, next option, undo info for this node]
+    while stack:
+        frame = stack[-1]
+        if frame[1] >= len(frame[0]):
+            stack.pop()  # all options tried, backtrack
+            if frame[2] is not None:
+                undo(frame[2])
+            continue
+        option = frame[0][frame[1]]
+        frame[1] += 1
+        saved = place(option[-1], option[0])
+        nodes += 1
+        if nodes % 512 == 0 and time.perf_counter() > stop_time:
+            timed_out = True
+            break
+        if cannot_meet_limit():
+            undo(saved)  # prune, a sample would incubate too long
+            continue
+        if sum(next_k) == num_actions:
+            cost = state['makespan'] + weight * state['error']
+            if cost < best_cost:
+                best_cost = cost
+                best_starts = [list(chain_starts) for chain_starts in starts]
+                best_swaps = [list(chain_swaps) for chain_swaps in swaps]
+            undo(saved)
+            continue
+        if lower_bound() >= best_cost:
+            undo(saved)  # prune, cannot beat the best schedule
+            continue
+        stack.append([candidates(), 0, saved])
+
+    str_out = "Optimal planning: cost " + str(heur_cost) + " (heuristic plan) -> " + str(best_cost) + \
+              " after " + str(nodes) + " nodes"
+    if timed_out:
+        str_out = str_out + ", time budget reached (best found so far)"
+    else:
+        str_out = str_out + ", search complete (best of the active schedules)"
+    logger.info(str_out)
+    if best_starts is None:
+        logger.info("Optimal planning: keeping the heuristic plan")
+        return exp_sequence
+
+    # write the best start times to the actions, and keep them only if they pass the certificate
+    if incub_targ is None:
+        incub_targ = find_incub_targets(exp_sequence)
+    old_swaps = [this_action.tip_swap_s for this_action in exp_sequence]
+    old_order = exp_sequence.to_list()
+    exp_sequence.begin()
+    for c in range(num_chains):
+        for k in range(len(chains[c])):
+            if chains[c][k].tip_swap_s != best_swaps[c][k]:
+                chains[c][k].set_tip_swap(best_swaps[c][k])
+            if chains[c][k].start != best_starts[c][k]:
+                exp_sequence.change_start(chains[c][k], best_starts[c][k])
+    exp_sequence.sort(key=sort_key)
+    cert = certify_sequence(exp_sequence, incub_targ, max_error)
+    if not cert.valid:
+        logger.warning("Optimal plan failed the schedule certificate (%s), keeping the heuristic plan",
+                       cert)
+        exp_sequence.rollback()
+        for indx in range(len(old_order)):
+            if old_order[indx].tip_swap_s != old_swaps[indx]:
+                old_order[indx].set_tip_swap(old_swaps[indx])
+        return exp_sequence
+    exp_sequence.commit()
     return exp_sequence
 
 
+@profiled_stage
 def create_exp_sequence(exp: ExperimentData):
     # def create_exp_sequence(sample: SampleWell)
     # pass exp, exp_seq
+    log_buffer.clear()  # log_buffer.dump() shows the messages of this planning only
 
-    # get the time-ordered list of sample loading ( of sam indx)
-    sam_indx_in_order = exp.sam_indx_in_order
-    num_samples = exp.num_samples
+    # get the time-ordered list of sample loading (sample locations)
+    sam_indx_in_order = exp.incub_loc_order
+    num_samples = len(sam_indx_in_order)
     all_samples = exp.all_samples
 
     # first, concatenate action steps and add load time
@@ -1123,10 +3878,9 @@ def create_exp_sequence(exp: ExperimentData):
     this_action: ActionInfo
     time_in_seq = start_time
     for ij in range(num_samples):
-        sample_index = sam_indx_in_order[ij]
-        this_plate = exp.sam_plate_indx_nums[sample_index]
-        this_well = exp.sam_well_indx_nums[sample_index]
-        this_sample = all_samples[this_plate][this_well]
+        sam_loc = sam_indx_in_order[ij]
+        sam_indx = exp.find_sam_in_nest_list(sam_loc)  # (rack_indx, well_indx)
+        this_sample = all_samples[sam_indx[0]][sam_indx[1]]
         sam_sequence = deepcopy(list(this_sample.targ_act_seq))  # needs to be a deepcopy,
         # not just a copy of pointers to objects that can be modified;
         # to preserve each sample's targ_act_seq tuple
@@ -1139,41 +3893,65 @@ def create_exp_sequence(exp: ExperimentData):
             new_start_time = this_action.start + time_in_seq
             # print("jx is: ", jx, "; this action is: ", this_action )  # debug
             this_action.change_start(new_start_time)
+            this_action.set_pipette(exp.sample_pipette)  # the sample tips are on this pipette, see assign_tip
             # print("changed to: ", this_action)  # debug
         time_in_seq = time_in_seq + load_time_s  # shift the start time for next load by load_time
-    exp.num_actions = len(exp_sequence)
-
-    # then, sort by the timestamp and prioritize the list by action type
-    print("=====================================================================================")
-    exp_sequence = prioritize_sequence(exp_sequence, sam_indx_in_order)
-    print("Concatenated, sorted, swapped sequence is: ")  # debug
-    print(exp_sequence)  # debug
-    print("=====================================================================================")
-    exp_sequence = shift_timestamp(exp_sequence, sam_indx_in_order)
-    print("Concatenated, sorted, swapped, and shifted sequence is: ")  # debug
-    print(exp_sequence)
-    print("=====================================================================================")
-    print("Double checking sequence:")
-    exp_sequence = shift_timestamp(exp_sequence, sam_indx_in_order)
-    print(exp_sequence)
-    print("=====================================================================================")
-    print("Compressing sequence")
-    exp_sequence = find_gaps_compress_actions(exp_sequence)
-    print(exp_sequence)
-    print("=====================================================================================")
-    print("Shifting into gaps")
-    exp_sequence = swap_into_gaps(exp_sequence, sam_indx_in_order)
-    print(exp_sequence)
-    print("=====================================================================================")
-    print("Compressing sequence")
-    exp_sequence = find_gaps_compress_actions(exp_sequence)
-    print(exp_sequence)
-    print("=====================================================================================")
-    print("Triple checking sequence:")
-    exp_sequence = shift_timestamp(exp_sequence, sam_indx_in_order)
-    print(exp_sequence)
-
-    return exp_sequence
+    exp.tot_num_sam_act = len(exp_sequence)
+    if exp.tip_swap_s > 0:
+        add_tip_swaps(exp_sequence, exp.tip_swap_s)  # tip changes are part of the action times
+
+    # then, schedule the actions in one pass (no overlaps, samples in order, incubation on time)
+    # replaces prioritize_sequence + shift_timestamp (x3) + moving the rinses into gaps
+    logger.info("Scheduling %s actions for %s samples", len(exp_sequence), num_samples)
+    try:
+        exp_sequence, cert = fixed_point_schedule(exp_sequence, sam_indx_in_order, exp.max_incub_error_s)
+        logger.debug("Concatenated, scheduled sequence is: \n%s", exp_sequence)
+        logger.debug("Compressing sequence")
+        exp_sequence = find_gaps_compress_actions(exp_sequence)
+        logger.debug("Compressed sequence is: \n%s", exp_sequence)
+
+        if exp.plan_mode == 'optimal':
+            logger.info("Searching for an optimal sequence, for up to %s seconds", exp.plan_time_budget_s)
+            exp_sequence = plan_optimal_sequence(exp, exp_sequence, incub_targ=cert.incub_targ)
+            logger.debug("Optimal sequence is: \n%s", exp_sequence)
+        if exp.tip_swap_s > 0:
+            exp.num_tip_swaps = drop_tip_swaps(exp_sequence)
+        if exp.batch_tips:
+            exp_sequence, exp.tip_batch_report = batch_tip_runs(exp_sequence, exp.tip_swap_s, exp.tip_batch_window_s,
+                                                                ActionInfo.TIP_SWAP_TIME_S.get(exp.tip_swap_mode))
+            exp.num_tip_swaps = exp.tip_batch_report.swaps_after
+            logger.info("%s", exp.tip_batch_report)
+        if exp.tip_swap_s > 0:
+            logger.info("Planned %s tip changes (%s s each, mode '%s')", exp.num_tip_swaps, exp.tip_swap_s,
+                        exp.tip_swap_mode)
+        if exp.tip_inventory_lg is not None or exp.tip_inventory_sm is not None:
+            # tip demand over the final sequence, with the tip rack refills where the tips run out
+            exp.tip_forecast = forecast_tip_refills(exp_sequence, {'large': exp.tip_inventory_lg,
+                                                                   'small': exp.tip_inventory_sm},
+                                                    exp.tip_refill_time_s)
+            logger.info("%s", exp.tip_forecast)
+    except Exception:
+        logger.exception("Planning failed, the last planner messages are:")
+        log_buffer.dump()
+        raise
+
+    # certificate of the final sequence, against the incubation targets of the original plan
+    exp.plan_certificate = certify_sequence(exp_sequence, cert.incub_targ, exp.max_incub_error_s)
+    logger.info("%s", exp.plan_certificate)
+    if not exp.plan_certificate.valid:
+        logger.warning("Planned sequence failed the schedule certificate, check the plan before running! "
+                       "log_buffer.dump() prints the planner messages.")
+    # volumes of the wells over the final sequence, with the waste and rinse reservoir of each unload and rinse
+    exp.volume_ledger = VolumeLedger.from_exp(exp, exp_sequence)
+    if exp.plan_waste_rinse:
+        exp.waste_rinse_report = allocate_waste_rinse(exp, exp_sequence, exp.volume_ledger)
+        if exp.waste_rinse_report is not None:
+            logger.info("%s", exp.waste_rinse_report)
+    for loc, time_s, vol in exp.volume_ledger.violations():
+        logger.warning("Well %s has %s uL at %s s in the planned sequence, outside 0 to its max volume",
+                       loc, round(vol, 1), time_s)
+
+    return exp_sequence.to_list()  # planned sequence is a plain list of actions
 
 
 # used in config_samples
@@ -1229,6 +4007,7 @@ def reverse_the_list(t):
 
 
 # Run first, after user_config_exp()
+@profiled_stage
 def calc_nums_exp(exp: ExperimentData):
     # Simplifies the data users are required to enter for each experiment.
     # Function derives totals from user_config_exp(). Checks that info entered correctly.
@@ -1241,8 +4020,7 @@ def calc_nums_exp(exp: ExperimentData):
     # Identifies locations of solution wells and lists content types.
     # Determines if dilutions are needed. Prints info for user (debugging).
 
-    print("Running calc_nums_exp()")  # debug
-    print("===========================================================================================")  # debug
+    logger.debug("Running calc_nums_exp()")
 
     # ToDo: Print info about slots in deck order: text picture?
 
@@ -1259,27 +4037,27 @@ def calc_nums_exp(exp: ExperimentData):
     for each in all_slots:
         if each < 1 or each > 11:
             # OT-2 Deck only supports slots 1-11
-            s_out = "WARNING: Listed slot: " + str(each) \
+            s_out = "Listed slot: " + str(each) \
                     + " is out of range! Check user_config_exp() and retry."
-            print(s_out)
+            logger.error("%s", s_out)
             raise StopExecution
         num_times = all_slots.count(each)
         if num_times > 1:
             # Slots can only be used once
-            s_out = "WARNING: Listed slot: " + str(each) + " used more than once! Check user_config_exp and retry."
-            print(s_out)
+            s_out = "Listed slot: " + str(each) + " used more than once! Check user_config_exp and retry."
+            logger.error("%s", s_out)
             raise StopExecution
 
     # check that user_config_exp was filled out correctly
     if len(exp.offsets_res_racks) != exp.num_res_plates \
             or len(exp.res_plate_names) != exp.num_res_plates:
         s_out = "Number of items in offsets_res_racks or num_res_plates is incorrect. Check user_config_exp and retry."
-        print(s_out)
+        logger.error("%s", s_out)
         raise StopExecution
     if len(exp.offsets_sam_racks) != exp.num_sam_plates \
             or len(exp.sam_plate_names) != exp.num_sam_plates:
         s_out = "Number of items in offsets_sam_racks or sam_plate_names is incorrect. Check user_config_exp and retry."
-        print(s_out)
+        logger.error("%s", s_out)
         raise StopExecution
 
     def find_slot_in_nestedlist_4rack(res_list, slot_number: int):
@@ -1340,13 +4118,14 @@ def calc_nums_exp(exp: ExperimentData):
         exp.tot_num_lg_tips = num_tips  # total number of lg tips
         exp.available_tips_lg = tuple(tip_locs)  # convert list to immutable tuple
         exp.which_tip_lg = 0
+        exp.tip_inventory_lg = TipInventory(exp.tips_in_lg_racks, exp.tip_policy, exp.allow_tip_refills)
         str_out = "Loading large pipette with " + str(exp.num_lg_tipracks) + \
                   " racks in slots: " + str(exp.slots_tiprack_lg) + \
                   " with total number of available tips:  " + str(exp.tot_num_lg_tips)
-        print(str_out)
+        logger.info("%s", str_out)
     else:
-        str_out = "WARNING: without large pipette, cannot continue script."
-        print(str_out)
+        str_out = "Without large pipette, cannot continue script."
+        logger.error("%s", str_out)
         raise StopExecution
     if exp.pipettes_in_use == 'small' or exp.pipettes_in_use == 'both':
         num_tips = 0
@@ -1361,13 +4140,14 @@ def calc_nums_exp(exp: ExperimentData):
         exp.tot_num_sm_tips = num_tips  # total number of sm tips
         exp.available_tips_sm = tuple(tip_locs)  # convert list to immutable tuple
         exp.which_tip_sm = 0
+        exp.tip_inventory_sm = TipInventory(exp.tips_in_sm_racks, exp.tip_policy, exp.allow_tip_refills)
         str_out = "Loading small pipette with " + str(exp.num_sm_tipracks) + \
                   " racks in slots: " + str(exp.slots_tiprack_sm) + \
                   " with total number of available tips:  " + str(exp.tot_num_sm_tips)
-        print(str_out)
+        logger.info("%s", str_out)
     else:
-        str_out = "WARNING: No small pipette loaded. (Not needed for this script.)"
-        print(str_out)
+        str_out = "No small pipette loaded. (Not needed for this script.)"
+        logger.warning("%s", str_out)
 
     # from res_data input by user in user_config_exp(),
     # identify number of wells used in each rack,
@@ -1388,7 +4168,7 @@ def calc_nums_exp(exp: ExperimentData):
         ending = in_res[2]  # (end_vol_uL, end_conc_uM)
         content = in_res[3]  # res_data contents in user_config_exp()
         if res_info[2] != 'res':
-            print("Warning, first item of each res_data item must be (slot_num, well_id, 'res')")
+            logger.warning("First item of each res_data item must be (slot_num, well_id, 'res')")
         res_slot = res_info[0]  # Slot_#
         res_well = res_info[1]  # Well_#
         res_info = (res_slot, res_well)  # (Slot_#, Well_#)
@@ -1409,7 +4189,7 @@ def calc_nums_exp(exp: ExperimentData):
     exp.content_types = tuple(content_types)  # immutable list of content types
     exp.num_cont_types = len(content_types)  # number of contents, excludes waste/rinse
     if start_conc != end_conc:
-        print("Dilutions are needed. List of dilution steps will be generated in plan_dil_series()")  # debug
+        logger.debug("Dilutions are needed. List of dilution steps will be generated in plan_dil_series()")
         exp.do_dilutions = True  # compare before/after lists (not sorted)
 
     # from sam_data, identify number of wells in each sam rack & list well-numbers
@@ -1425,7 +4205,7 @@ def calc_nums_exp(exp: ExperimentData):
         # sam_name = in_sam[1]  # not needed in calc_nums_exp()
         all_res = in_sam[2]  # (num_sol, (rack_num, well_id, 'sol', (inoc_info)),...)
         if sam_loc[2] != 'sam':
-            print("Warning, first item of each sam_data item must be (slot_num, well_id, 'sam')")
+            logger.warning("First item of each sam_data item must be (slot_num, well_id, 'sam')")
         sam_slot = sam_loc[0]  # rack slot num
         sam_well = sam_loc[1]  # well id
         sam_loc = (sam_slot, sam_well)  # location
@@ -1435,7 +4215,7 @@ def calc_nums_exp(exp: ExperimentData):
         if num_inoc_res != input_num_inoc:
             s_out = "The number of inoculations solutions for sample " + str(sam_loc) \
                     + " does not match the provided data, check user_config_exp()"
-            print(s_out)
+            logger.error("%s", s_out)
             raise StopExecution  # if debugging, comment out
         inoc_times = []  # inoculation time for each sol res
         vol_fracs = []  # vol frac for each sol res
@@ -1446,14 +4226,14 @@ def calc_nums_exp(exp: ExperimentData):
             res_slot = res_info[0]  # Slot_#
             res_well = res_info[1]  # Well_#
             if res_info[2] != 'sol':
-                print("Warning, data in inoc_sol_locs of each sam_data item must be (slot_num, well_id, 'sol')")
+                logger.warning("Data in inoc_sol_locs of each sam_data item must be (slot_num, well_id, 'sol')")
             res_loc = (res_slot, res_well)  # reservoir location
             # print("Checking inoculation res at loc: ", res_loc)  # debug
             if res_loc not in exp.sol_res_locs:
                 s_out = "Inoculation reservoir " + str(res_loc) \
                         + " for sample " + str(sam_loc) \
                         + " is invalid, check user_config_exp"
-                print(s_out)
+                logger.error("%s", s_out)
                 raise StopExecution
             inoc_info = res_info[3]  # inoculation information, after 'sol'
             vol_frac = inoc_info[0]  # inoculation volume fraction
@@ -1476,13 +4256,13 @@ def calc_nums_exp(exp: ExperimentData):
                 s_out = "Volume fraction sum, " + str(sum_vol_frac) + ", for sample " \
                         + str(sam_loc) + " at time " + str(inoc_time) \
                         + " seconds exceeds 1.0, check user_config_exp()"
-                print(s_out)
+                logger.error("%s", s_out)
                 raise StopExecution  # if debugging, comment out
             elif sum_vol_frac < 1.0:
                 s_out = "Volume fraction sum, " + str(sum_vol_frac) + ", for sample " \
                         + str(sam_loc) + " at time " + str(inoc_time) \
                         + " seconds is less than 1.0, if incorrect, please confirm user_config_exp()"
-                print(s_out)
+                logger.info("%s", s_out)
         sam_rack_indx = exp.find_rack_in_sam_plates(sam_slot)  # indx from list of RackData
         exp.sam_plate_wells[sam_rack_indx].num_wells += 1  # update number of wells on this plate
         exp.sam_plate_wells[sam_rack_indx].well_ids.append(sam_well)  # update well index list
@@ -1499,22 +4279,22 @@ def calc_nums_exp(exp: ExperimentData):
         str_out = "Res plate in slot " + str(plate.slot) + " labeled " + str(plate.label) \
                   + " has " + str(plate.num_wells) + " occupied wells, each w/ max vol " \
                   + str(plate.max_vol) + " uL "  # debug
-        print(str_out)
+        logger.info("%s", str_out)
     str_out = "The first WASTE reservoir is located at: " + str(waste_loc)
-    print(str_out)
+    logger.info("%s", str_out)
     str_out = "The first RINSE reservoir is located at: " + str(rinse_loc)
-    print(str_out)
+    logger.info("%s", str_out)
     # print info about samples
     for plate in exp.sam_plate_wells:
         str_out = "Sample plate on slot " + str(plate.slot) + " labeled " \
                   + str(plate.label) + " with " + str(plate.num_wells) + \
                   " sample wells, each w/ max vol " + str(plate.max_vol) + " uL "  # debug
-        print(str_out)
-    print("===========================================================================================")  # debug
+        logger.info("%s", str_out)
     return exp
 
 
 # Run second, after calc_nums_exp()
+@profiled_stage
 def set_up_res_sam_data(exp: ExperimentData):
     # Populates the experiment's all_res_data and all_samples,
     # which are modifiable, nested list of ResWellData data objects.
@@ -1523,12 +4303,10 @@ def set_up_res_sam_data(exp: ExperimentData):
     # Assigns tip locations to each reservoir and sample well.
     # Determines if dilution needed for each res. Finds max incubation time.
     # Determines the inoculation order for each sample based on incubation time
-    print("Running set_up_res_sam_data()")  # debug
-    print("===========================================================================================")  # debug
-    which_pipette = 'large'  # using large pipette
-    # select the first tip for the plan:
-    next_tip_loc = exp.available_tips_lg[exp.which_tip_lg]  # first tip
-    print("Selecting first ", which_pipette, " tip in loc: ", next_tip_loc)  # debug
+    logger.debug("Running set_up_res_sam_data()")
+    which_pipette = exp.sample_pipette  # large pipette, unless only the small one is loaded
+    # each reservoir and sample gets its own tip from exp.tip_inventory_lg (exp.assign_tip)
+    logger.debug("Assigning %s tips with policy: %s", which_pipette, exp.tip_policy)
 
     def find_loc_in_nested_well_list(well_list, find_loc: (int, int)):
         # returns index of item for an item in a list such that:
@@ -1631,7 +4409,6 @@ def set_up_res_sam_data(exp: ExperimentData):
         # exp_sequence.append(this_action)
         sample.targ_act_seq = sam_sequence
         # debug block...
-        print("------------------------------------------------------------------------------------")  # debug
         f_out_string = "Sample name: " + str(sample.sample_name) + " indexed # " \
                        + str(this_sam_indx) + " on plate # " + str(plate_index) + " & well # " \
                        + str(this_well_on_plate) + " with sequence: "  # debug
@@ -1673,8 +4450,7 @@ def set_up_res_sam_data(exp: ExperimentData):
             new_res.contents = content  # content
             if new_res.curr_conc < new_res.goal_conc:
                 new_res.dilution_complete = False  # record if dilution to obtain res needed
-            new_res.assigned_tip = next_tip_loc  # assign tip
-            next_tip_loc = exp.find_next_tip(which_pipette)  # find next tip loc
+            new_res.assigned_tip = exp.assign_tip(res_loc, which_pipette)  # assign tip
             # print(new_res)  # debug
             rack_set.append(new_res)  # list of ResWell objects corresponding to this rack
         res_data_set.append(rack_set)  # nested list of ResWellData objects corresponding to all racks
@@ -1688,7 +4464,7 @@ def set_up_res_sam_data(exp: ExperimentData):
     sam_incub_set = []  # list of [(sam_incub_time, (sam_loc)),...], not ordered or nested by rack
     max_incub_time = 0  # max incubation time for all samples
     for rack in sam_racks:
-        print(rack)  # debug
+        logger.debug("%s", rack)
         slot_num = rack.slot  # find the slot_num for this rack
         num_wells = rack.num_wells  # find number of wells in this rack
         wells_ids = rack.well_ids  # list of wells in this rack
@@ -1787,8 +4563,7 @@ def set_up_res_sam_data(exp: ExperimentData):
             new_sam.inoc_fracs = tuple(inoc_fracs)  # inoculation fractions for above locations
             new_sam.incub_sols = tuple(inoc_contents)  # inoculation solution set contents
             new_sam.incub_conc = tuple(inoc_concentration)  # inoculation solution concentrations
-            new_sam.assigned_tip = next_tip_loc  # assign tip
-            next_tip_loc = exp.find_next_tip(which_pipette)  # find next tip loc
+            new_sam.assigned_tip = exp.assign_tip(sam_loc, which_pipette)  # assign tip, near its plate
             add_incub = (targ_incub_m, sam_loc)  # (incubation_time, (rack_num, well_id))
             # if target incubation time exceeds max time before evaporation
             if targ_incub_m > exp.max_time_before_evap_m:
@@ -1819,6 +4594,7 @@ def set_up_res_sam_data(exp: ExperimentData):
         incub_locs.append(item[1])  # (0:incubation_time, 1:(rack_num, well_id))
     exp.incub_loc_order = tuple(incub_locs)  # make immutable
     exp.max_incub_m = max_incub_time  # record max incubation time
+    exp.index_locations()  # hash indices for find_sam_in_nest_list, find_res_in_nest_list, etc.
 
     # sort through inoculation order of the samples
     for inoc_index in range(len(exp.incub_loc_order)):
@@ -1843,11 +4619,12 @@ def set_up_res_sam_data(exp: ExperimentData):
 
 
 # Run third, after set_up_res_sam_data()
+@profiled_stage
 def plan_dil_series(exp: ExperimentData):
     # plan dilution series:
     # double-checking that dilution is required
     if not exp.do_dilutions:
-        print("Dilution already complete.")  # debug
+        logger.debug("Dilution already complete.")
         return exp
 
     def find_res_in_list(res_list: list[ResWellData], loc: (int, int)):
@@ -1869,13 +4646,12 @@ def plan_dil_series(exp: ExperimentData):
         content_type = dil_subset[0].contents  # type of contents
         num_subset = len(res_subset)  # length of the list
         # run check of subset and print info for user debugging
-        print("--------------------------------------------------------------------------------")  # debug
-        print("Identifying parent for each dilution child w content: ", content_type)  # debug
-        print("id, loc,   cur_vol,  goal_vol,  goal_conc, curr_conc")  # debug
+        logger.debug("Identifying parent for each dilution child w content: %s", content_type)
+        logger.debug("id, loc, cur_vol, goal_vol, goal_conc, curr_conc")
         for res_id in range(num_subset):
             child_res = res_subset[res_id]
-            print(res_id, child_res.loc, "  ", child_res.curr_vol, "  ", child_res.goal_vol,
-                  "  ", child_res.goal_conc, "  ", child_res.curr_conc)  # debug
+            logger.debug("%s %s %s %s %s %s", res_id, child_res.loc, child_res.curr_vol, child_res.goal_vol,
+                         child_res.goal_conc, child_res.curr_conc)
             if child_res.contents != content_type:
                 s_out = "Reservoir subset sent to find_par_calc_tranf is not all of content type: " + str(content_type)
                 raise ValueError(s_out)  # double checks that the content is identical.
@@ -1886,48 +4662,48 @@ def plan_dil_series(exp: ExperimentData):
         for res_id in range(num_subset):
             # for each in range(num_subset - 1):
             child_res = res_subset[res_id]
-            print("____________________________________________________________________________")  # debug
-            print("Evaluating", res_id, child_res.loc, "w goal concentration: ",
-                  child_res.goal_conc, "uM and volume: ", child_res.goal_vol, "uL")  # debug
+            logger.debug("Evaluating %s %s w goal concentration: %s uM and volume: %s uL", res_id, child_res.loc,
+                         child_res.goal_conc, child_res.goal_vol)
             if not child_res.dilution_complete:
                 parent_id = res_id  # for first iteration, same as child
                 parent_res = res_subset[parent_id]  # for 1st, same as child
                 transf_vol = 1  # uL transferred from parent to res_child
-                tran_mod = 1  # transf_vol mod 100 uL
+                tran_mod = 1  # transf_vol mod step_ul
                 orig_vol = child_res.goal_vol  # w/o mods, goal volume for child_res
                 loop_num = 0  # fail-safe to prevent infinite loop
-                # when transfer volume is not divisible by 100 uL --> find parent, calc transf_vol
+                # when transfer volume is not divisible by step_ul --> find parent, calc transf_vol
                 while tran_mod > 0:
                     loop_num += 1  # fail-safe to prevent infinite loop
                     # recall res_subset sorted from the lowest goal concentration to highest
                     parent_id += 1  # selecting next higher concentration as parent
                     if loop_num > 1:  # skip first iteration
-                        print("Pipette cannot transfer: ", tran_mod, "uL")  # debug
+                        logger.debug("Pipette cannot transfer: %s uL", tran_mod)
                     if parent_id >= num_subset or loop_num > 10:
                         # if parent id exceeds number of items in the subset
                         # or the number of times tried exceeds 10, warn user and quit
-                        print("WARNING: Alternative dilution parent not available for reservoir in loc ", child_res.loc)
+                        logger.warning("Alternative dilution parent not available for reservoir in loc %s",
+                                       child_res.loc)
                         break
                     parent_res = res_subset[parent_id]  # selecting next higher concentration as parent
-                    print("Choosing parent for dilution ", parent_id, parent_res.loc,
-                          " with concentration ", parent_res.goal_conc, " uM")
+                    logger.info("Choosing parent for dilution %s %s with concentration %s uM",
+                                parent_id, parent_res.loc, parent_res.goal_conc)
                     # ratio of child to parent concentration
                     conc_ratio_chi_par = child_res.goal_conc / parent_res.goal_conc
                     transf_vol = int(conc_ratio_chi_par * child_res.goal_vol)  # calculate transfer volume
-                    tran_mod = int(transf_vol % 100)  # round mod to 100 uL, due to 'large' pipette restrictions
+                    tran_mod = int(transf_vol % step_ul)  # round mod to step_ul, due to pipette restrictions
                     # print("Transferring: ", transf_vol)  # debug
-                    # if transfer volume is not divisible by 100 uL,
+                    # if transfer volume is not divisible by step_ul,
                     # and fewer than 3 loops have run for this child
                     if tran_mod > 0 and loop_num < 3:
-                        transf_vol = int(transf_vol - tran_mod + 100)  # try increasing transf volume
+                        transf_vol = int(transf_vol - tran_mod + step_ul)  # try increasing transf volume
                         new_goal_vol = int(transf_vol / conc_ratio_chi_par)  # calculate new goal volume for child
                         # and tran_mod % 10 == 0
-                        # increase transfer volume,  mod to be divisible to 100
+                        # increase transfer volume,  mod to be divisible to step_ul
                         # print("Changing transf_vol to ", transf_vol,
                         #       ", with goal volume ", new_goal_vol) # debug
-                        # if new goal volume is divisible by 100 uL,
+                        # if new goal volume is divisible by step_ul,
                         # change the child reservoir goal vol and calculate again with the same parent
-                        if new_goal_vol % 100 == 0:
+                        if new_goal_vol % step_ul == 0:
                             child_res.goal_vol = new_goal_vol  # change goal vol
                             parent_id -= 1  # keep the same parent and try again
                             # if new goal is divisible by 100uL
@@ -1947,24 +4723,26 @@ def plan_dil_series(exp: ExperimentData):
                     parent_res.goal_vol = parent_res.goal_vol + transf_vol
                     if parent_res.goal_vol > parent_res.max_vol:
                         parent_res.goal_vol = parent_res.max_vol
-                        print("WARNING: adjusting parent volume to max for loc ", parent_res.loc)
-                    print("Changing parent", parent_res.loc, " volume to ", parent_res.goal_vol)  # debug
+                        logger.warning("Adjusting parent volume to max for loc %s", parent_res.loc)
+                    logger.debug("Changing parent %s volume to %s", parent_res.loc, parent_res.goal_vol)
                 child_res.parent_conc = parent_res.goal_conc  # update parent concentration for child reservoir
                 child_res.parent_loc = parent_res.loc  # update parent location for child reservoir
                 child_res.par_transf_vol = transf_vol  # update transfer volume for child reservoir
         res_subset.sort(key=lambda x: x.goal_conc, reverse=True)  # sort subset by goal_conc
         # sorted from the highest goal concentration to the lowest (reverse = True)
         # print info for user debugging
-        print("____________________________________________________________________________")  # debug
-        print("Updated subset of content type: ", content_type)  # debug
-        print("id, loc, goal_conc, goal_vol, parent, p_conc, tf_vol")  # debug
+        logger.debug("Updated subset of content type: %s", content_type)
+        logger.debug("id, loc, goal_conc, goal_vol, parent, p_conc, tf_vol")
         for res_id in range(num_subset):
             child_res = res_subset[res_id]
-            print(res_id, child_res.loc, "  ", child_res.goal_conc, "  ", child_res.goal_vol,
-                  "  ", child_res.parent_loc, "  ", child_res.parent_conc, "  ", child_res.par_transf_vol)  # debug
-        print("--------------------------------------------------------------------------------")  # debug
+            logger.debug("%s %s %s %s %s %s %s", res_id, child_res.loc, child_res.goal_conc, child_res.goal_vol,
+                         child_res.parent_loc, child_res.parent_conc, child_res.par_transf_vol)
         return dil_subset
 
+    # volume step of the transfers: multiples of 100 uL with only the large pipette,
+    # whole uL when the small pipette takes the transfers below 100 uL (see route_pipette)
+    step_ul = exp.transfer_step_ul
+
     # res_data = exp.all_res_data  # alias - can be modified incorrectly
     # modifiable, nested list of ResWellData objects, grouped by racks
     res_data = deepcopy(exp.all_res_data)  # not alias - needs to be copied back
@@ -1974,7 +4752,7 @@ def plan_dil_series(exp: ExperimentData):
     res_set_per_content = []  # nested list of ResWellData objects, grouped by content type
     for type_indx in range(num_types):
         this_type = exp.content_types[type_indx]  # iterate through content types
-        print("Content type: ", this_type)  # debug
+        logger.debug("Content type: %s", this_type)
         res_subset = []  # empty sublist of one content type
         for res_set_rack in res_data:
             for res in res_set_rack:
@@ -1995,7 +4773,7 @@ def plan_dil_series(exp: ExperimentData):
     for type_indx in range(num_types):
         this_type = exp.content_types[type_indx]  # select content type
         res_subset = res_set_per_content[type_indx]  # select res set for this content
-        print("Content type: ", this_type)  # debug
+        logger.debug("Content type: %s", this_type)
         for res in res_subset:
             # recall list with goal-concentration (highest to lowest) order
             if not res.dilution_complete:
@@ -2003,46 +4781,56 @@ def plan_dil_series(exp: ExperimentData):
                 # (1) transf concentrated solution from parent to child
                 # (2) transf DI dilution solution from parent to child
                 # (3) mix solution in current reservoir
-                print("Creating actions for: ", res.loc)  # debug
+                logger.debug("Creating actions for: %s", res.loc)
                 sol_parent = res.parent_loc  # select concentrated parent
                 par_indx = find_res_in_list(res_subset, sol_parent)  # index from subset list
                 par_res = res_subset[par_indx]  # select reservoir
-                par_tip = par_res.assigned_tip  # use tip of the 'from' reservoir
                 sol_vol = res.par_transf_vol  # transfer volume from concentrated parent
+                which_pip = exp.route_pipette(sol_vol)  # pipette for this volume
+                par_tip = exp.assign_tip(sol_parent, which_pip)  # use tip of the 'from' reservoir
                 is_complex = False
-                new_action = ActionInfo(res.loc, 'transf', 'dilution',
-                                        dilution_num, res_timestamp,
-                                        sol_parent, res.loc, sol_vol,
-                                        par_tip, zero_mixes, is_complex)
+                for step_vol in exp.transfer_steps(sol_vol, which_pip):  # one transfer, or several small ones
+                    new_action = ActionInfo(res.loc, 'transf', 'dilution',
+                                            dilution_num, res_timestamp,
+                                            sol_parent, res.loc, step_vol,
+                                            par_tip, zero_mixes, is_complex)
+                    new_action.set_pipette(which_pip)
+                    res_timestamp = new_action.end  # update the next start time
+                    action_set.append(new_action)  # add to list of actions
+                    logger.debug("%s", new_action)
                 par_res.dig_vol = par_res.dig_vol - sol_vol  # update parent res volume
                 res.dig_vol = res.dig_vol + sol_vol  # update current res volume
-                res_timestamp = new_action.end  # update the next start time
-                action_set.append(new_action)  # add to list of actions
-                print(new_action)  # debug
                 dil_vol = res.goal_vol - sol_vol  # calculate dilution volume
                 dil_loc = exp.give_rinse_loc()  # location of dilution parent, updated internally based on dig_vol
                 # dil_indx = find_res_in_nest_list(res_data, dil_loc)  # find indices for dilutant
                 dil_indx = exp.find_res_in_nest_list(dil_loc)  # find indices for dilutant, in all_res_data
                 dil_res = res_data[dil_indx[0]][dil_indx[1]]  # select disputant reservoir
-                dil_tip = dil_res.assigned_tip  # tip of the dilution reservoir
-                new_action = ActionInfo(res.loc, 'transf', 'dilution',
-                                        dilution_num, res_timestamp,
-                                        dil_loc, res.loc, dil_vol,
-                                        dil_tip, zero_mixes, is_complex)
+                which_pip = exp.route_pipette(dil_vol)  # pipette for this volume
+                dil_tip = exp.assign_tip(dil_loc, which_pip)  # tip of the dilution reservoir
+                for step_vol in exp.transfer_steps(dil_vol, which_pip):  # one transfer, or several small ones
+                    new_action = ActionInfo(res.loc, 'transf', 'dilution',
+                                            dilution_num, res_timestamp,
+                                            dil_loc, res.loc, step_vol,
+                                            dil_tip, zero_mixes, is_complex)
+                    new_action.set_pipette(which_pip)
+                    res_timestamp = new_action.end  # update the next start time
+                    action_set.append(new_action)  # add to list of actions
+                    logger.debug("%s", new_action)
                 res.dig_vol = res.dig_vol + dil_vol  # update current res volume
                 dil_res.dig_vol = dil_res.dig_vol - dil_vol  # update disputant res volume
-                res_timestamp = new_action.end  # update the next start time
-                action_set.append(new_action)  # add to list of actions
-                print(new_action)  # debug
                 mix_vol = min(1000, int(0.5 * res.goal_vol))  # choose smaller volume
-                res_tip = res.assigned_tip  # tip of the child reservoir
+                which_pip = exp.route_pipette(mix_vol)  # pipette for this volume
+                if which_pip == 'small':
+                    mix_vol = min(mix_vol, exp.pipette_sm_range_ul[1])  # mix at most the small pipette's max
+                res_tip = exp.assign_tip(res.loc, which_pip)  # tip of the child reservoir
                 new_action = ActionInfo(res.loc, 'mix', 'dilution',
                                         dilution_num, res_timestamp,
                                         res.loc, res.loc, mix_vol,
                                         res_tip, num_times_mixed, is_complex)
+                new_action.set_pipette(which_pip)
                 res_timestamp = new_action.end  # update the next start time
                 action_set.append(new_action)  # add to list of actions
-                print(new_action)  # debug
+                logger.debug("%s", new_action)
                 dilution_num += 1  # iterate dilution number
 
     exp.all_res_data = res_data  # copy res_data back to exp, since deepcopy was used
@@ -2052,6 +4840,7 @@ def plan_dil_series(exp: ExperimentData):
 
 
 # used after user_config_exp
+@profiled_stage
 def config_samples(exp: ExperimentData):
     # This function checks the number of plates & samples in configuration
     # both modifies exp variables and replaces all_samples in exp
@@ -2069,7 +4858,7 @@ def config_samples(exp: ExperimentData):
                 # expand this action
                 act_type = each_act.action
                 if act_type == 'load':
-                    print('decompressing action:', act_type)
+                    logger.debug("Decompressing action: %s", act_type)
                     sam_loc = each_act.keeper
                     res_loc = each_act.par_loc
                     is_complex = False
@@ -2081,17 +4870,17 @@ def config_samples(exp: ExperimentData):
                                             sol_parent, res.loc, sol_vol,
                                             par_tip, zero_mixes, is_complex)
                 elif act_type == 'reload':
-                    print('decompressing action:', act_type)
+                    logger.debug("Decompressing action: %s", act_type)
                     sam_loc = each_act.keeper
                     res_loc = each_act.par_loc
                     waste_loc = each_act.targ_loc
                 elif act_type == 'unload' or act_type == 'rinse':
-                    print('decompressing action:', act_type)
+                    logger.debug("Decompressing action: %s", act_type)
                     sam_loc = each_act.keeper
                     res_loc = each_act.par_loc
                     waste_loc = each_act.targ_loc
                 else:
-                    print(act_type, "is not a complex action")
+                    logger.debug("%s is not a complex action", act_type)
                     action_set.append(each_act)
 
             else:
@@ -2102,7 +4891,7 @@ def config_samples(exp: ExperimentData):
     exp = set_up_res_sam_data(exp)  # second, set up data for reservoirs and sample wells,
     # also, obtain order of inoculation exp.incub_loc_order
     if exp.do_dilutions:
-        print("Do dilutions")  # debug
+        logger.debug("Do dilutions")
         exp = plan_dil_series(exp)  # third, plan dilution series
 
     # TODO: start here on 5/4/23
@@ -2215,7 +5004,7 @@ def config_samples(exp: ExperimentData):
             #                + str(this_sam_indx) + " on plate # " + str(plate_index) + " & well # " \
             #                + str(this_well_on_plate) + " with sequence: "  # debug
             # print(f_out_string)  # debug
-            print(sample.targ_act_seq)  # debug
+            logger.debug("%s", sample.targ_act_seq)
             # print(vars(sample))  # debug
         all_on_prev_plates = all_on_prev_plates + num_wells_on_this_plate
         sample_set.append(plate_data_set)
@@ -2231,6 +5020,502 @@ def config_samples(exp: ExperimentData):
 
 
 # have user fill out for each experiment
+# tabular inputs for input_res_data and input_sam_data (load_input_files): CSV with a header row,
+# or JSON lines (.jsonl), one object per row with the same column names
+# reservoirs, one row per reservoir well (including waste/rinse), see user_config_exp:
+RES_INPUT_COLUMNS = ('slot', 'well', 'start_vol_uL', 'start_conc_uM', 'end_vol_uL', 'end_conc_uM', 'contents')
+# samples, one row per inoculation solution of a sample (rows of the same sample give num_inoc):
+SAM_INPUT_COLUMNS = ('slot', 'well', 'sam_name', 'sol_slot', 'sol_well', 'vol_frac',
+                     'inoc_min', 'incub_min', 'num_mixes', 'num_rinses')
+
+
+def iter_input_rows(file_path: str):
+    # (line number, row dict) for each row of a CSV or JSON-lines file, read one row at a time
+    if file_path.endswith('.jsonl') or file_path.endswith('.ndjson'):
+        with open(file_path, encoding='utf-8') as in_file:
+            for line_num, line in enumerate(in_file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as err:
+                    s_out = str(file_path) + ", line " + str(line_num) + ": not valid JSON (" + str(err) + ")"
+                    raise ValueError(s_out)
+                if not isinstance(row, dict):
+                    s_out = str(file_path) + ", line " + str(line_num) + ": each line must be a JSON object"
+                    raise ValueError(s_out)
+                yield line_num, row
+    else:
+        with open(file_path, newline='', encoding='utf-8-sig') as in_file:
+            csv_file = csv.DictReader(in_file)
+            for row in csv_file:
+                yield csv_file.line_num, row
+
+
+def _input_value(row: dict, column: str, kind, file_path: str, line_num: int, min_val=None, max_val=None):
+    # one validated value of a row: kind is int, float or str
+    value = row.get(column)
+    where = str(file_path) + ", line " + str(line_num) + ": "
+    if value is None or (isinstance(value, str) and value.strip() == ''):
+        s_out = where + "missing value for column '" + column + "'"
+        raise ValueError(s_out)
+    if kind is str:
+        return str(value).strip()
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        s_out = where + "column '" + column + "' must be a number, got " + repr(value)
+        raise ValueError(s_out)
+    if not math.isfinite(number):
+        s_out = where + "column '" + column + "' must be a finite number, got " + repr(value)
+        raise ValueError(s_out)
+    if kind is int:
+        if number != int(number):
+            s_out = where + "column '" + column + "' must be an integer, got " + repr(value)
+            raise ValueError(s_out)
+        number = int(number)
+    elif number == int(number):
+        number = int(number)  # eg: 50000 rather than 50000.0, as typed in user_config_exp
+    if (min_val is not None and number < min_val) or (max_val is not None and number > max_val):
+        s_out = where + "column '" + column + "' is " + str(number) + ", outside [" + str(min_val) + \
+                ", " + str(max_val) + "]"
+        raise ValueError(s_out)
+    return number
+
+
+def load_res_input(file_path: str):
+    # input_res_data tuple from a reservoir table (RES_INPUT_COLUMNS):
+    # ((Slot_#, Well_#, 'res'), (start_vol_uL, start_conc_uM), (end_vol_uL, end_conc_uM), 'contents'), ...
+    res_input = []
+    seen_locs = set()
+    for line_num, row in iter_input_rows(file_path):
+        slot = _input_value(row, 'slot', int, file_path, line_num, 1, 11)
+        well = _input_value(row, 'well', int, file_path, line_num, 0)
+        if (slot, well) in seen_locs:
+            s_out = str(file_path) + ", line " + str(line_num) + ": reservoir " + str((slot, well)) + \
+                    " is listed twice"
+            raise ValueError(s_out)
+        seen_locs.add((slot, well))
+        res_input.append(((slot, well, 'res'),
+                          (_input_value(row, 'start_vol_uL', float, file_path, line_num, 0),
+                           _input_value(row, 'start_conc_uM', float, file_path, line_num, 0)),
+                          (_input_value(row, 'end_vol_uL', float, file_path, line_num, 0),
+                           _input_value(row, 'end_conc_uM', float, file_path, line_num, 0)),
+                          _input_value(row, 'contents', str, file_path, line_num)))
+    return tuple(res_input)
+
+
+def load_sam_input(file_path: str):
+    # input_sam_data tuple from a sample table (SAM_INPUT_COLUMNS):
+    # ((Slot_#, Well_#, 'sam'), 'sam_name', (num_inoc, (sol_slot, sol_well, 'sol', (vol_frac, inoc_min,
+    # incub_min, num_mixes, num_rinses)), ...)), ... with samples in the order of their first row
+    sam_names = {}  # (slot, well): sam_name
+    sam_sols = {}  # (slot, well): list of inoculation solution tuples
+    for line_num, row in iter_input_rows(file_path):
+        slot = _input_value(row, 'slot', int, file_path, line_num, 1, 11)
+        well = _input_value(row, 'well', int, file_path, line_num, 0)
+        sam_name = _input_value(row, 'sam_name', str, file_path, line_num)
+        if sam_names.setdefault((slot, well), sam_name) != sam_name:
+            s_out = str(file_path) + ", line " + str(line_num) + ": sample " + str((slot, well)) + \
+                    " is named " + sam_names[(slot, well)] + " in an earlier row, not " + sam_name
+            raise ValueError(s_out)
+        inoc_info = (_input_value(row, 'vol_frac', float, file_path, line_num, 0, 1),
+                     _input_value(row, 'inoc_min', float, file_path, line_num, 0),
+                     _input_value(row, 'incub_min', float, file_path, line_num, 0),
+                     _input_value(row, 'num_mixes', int, file_path, line_num, 0),
+                     _input_value(row, 'num_rinses', int, file_path, line_num, 0))
+        sam_sols.setdefault((slot, well), []).append(
+            (_input_value(row, 'sol_slot', int, file_path, line_num, 1, 11),
+             _input_value(row, 'sol_well', int, file_path, line_num, 0), 'sol', inoc_info))
+    sam_input = []
+    for sam_loc, sols in sam_sols.items():
+        sam_input.append(((sam_loc[0], sam_loc[1], 'sam'), sam_names[sam_loc], (len(sols),) + tuple(sols)))
+    return tuple(sam_input)
+
+
+def load_input_files(exp: ExperimentData, res_file=None, sam_file=None):
+    # replace exp.input_res_data and/or exp.input_sam_data with the rows of these files,
+    # eg: in user_config_exp, load_input_files(my_exp, 'reservoirs.csv', 'samples.csv')
+    if res_file is not None:
+        exp.input_res_data = load_res_input(res_file)
+    if sam_file is not None:
+        exp.input_sam_data = load_sam_input(sam_file)
+    if res_file is not None and sam_file is not None:
+        res_locs = set((res[0][0], res[0][1]) for res in exp.input_res_data)
+        for in_sam in exp.input_sam_data:
+            for sol in in_sam[2][1:]:
+                if (sol[0], sol[1]) not in res_locs:
+                    s_out = "Inoculation solution " + str((sol[0], sol[1])) + " of sample " + \
+                            str(in_sam[1]) + " is not in " + str(res_file)
+                    raise ValueError(s_out)
+    return exp
+
+
+class PreflightReport:
+    # result of preflight_check: every violation found, and the budgets that were added up
+    def __init__(self):
+        self.violations = []  # messages, one per problem
+        self.budgets = {}  # name: (needed, available), eg: 'tips_lg': (25, 192)
+        self.busy_time_s = 0  # total pipette time of all sample actions, and of the tip refills
+        self.min_run_time_s = 0  # lower bound for the run time (longest sample, or busy_time_s)
+        self.tip_refills = {}  # pipette: operator refills of its tip racks (allow_tip_refills), if the racks run out
+
+    @property
+    def ok(self):
+        return not self.violations
+
+    def add(self, s_out: str):
+        self.violations.append(s_out)
+
+    # returns this when calling this object
+    def __repr__(self):
+        this_string = "PreflightReport(" + ("ok" if self.ok else str(len(self.violations)) + " violations") + \
+                      ", pipette busy " + str(self.busy_time_s) + "s, run >= " + str(self.min_run_time_s) + "s"
+        for name, (needed, available) in self.budgets.items():
+            this_string = this_string + ", " + name + " " + str(needed) + "/" + str(available)
+        for pipette, num_refills in self.tip_refills.items():
+            this_string = this_string + ", " + str(num_refills) + " " + pipette + " tip refills"
+        this_string = this_string + ")"
+        for s_out in self.violations:
+            this_string = this_string + "\n  " + s_out
+        return this_string
+
+    # returns this string when called via print(x)
+    def __str__(self):
+        return self.__repr__()
+
+
+def preflight_check(exp: ExperimentData):
+    # adds up the tip, volume, waste, rinse and time budgets of the inputs (input_res_data,
+    # input_sam_data, tip racks, waste/rinse locations, labware) in one pass over each input,
+    # with the same rules as planning (set_up_res_sam_data, list_actions_each_sam, run_sequence,
+    # give_waste_loc/give_rinse_loc), so an infeasible configuration is found before planning.
+    # Returns a PreflightReport with all violations; nothing in exp is changed.
+    report = PreflightReport()
+    do_dilutions = exp.needs_dilutions()  # exp.do_dilutions is only set by calc_nums_exp
+    res_slots = set(exp.slots_res_racks)
+    sam_slots = set(exp.slots_sam_plates)
+    rack_names = dict(tuple(exp.res_plate_names) + tuple(exp.sam_plate_names))  # slot: labware name
+
+    def rack_info(slot: int, kind: str):
+        # (max well volume, number of wells or None) for the labware in this slot
+        name = rack_names.get(slot)
+        if name is None:
+            report.add(kind + " slot " + str(slot) + " has no labware in res_plate_names/sam_plate_names")
+            return 0, None
+        this_def = labware_registry().get(name)
+        max_vol = exp.find_max_res_vol(name)
+        if max_vol == 0:
+            report.add("Labware " + str(name) + " in slot " + str(slot) + " is unknown (no definition in labware/)")
+        return max_vol, (this_def.num_wells if this_def is not None else None)
+
+    # reservoirs: volume available to draw (solutions), headroom (waste) and rinse volume
+    waste_locs = tuple(exp.waste_res_locs)
+    rinse_locs = tuple(exp.rinse_res_locs)
+    res_vol = {}  # (slot, well): start volume uL, decreased as samples draw from it
+    res_max = {}  # (slot, well): max volume uL
+    rack_cache = {}
+    for in_res in exp.input_res_data:
+        loc = (in_res[0][0], in_res[0][1])
+        if loc[0] not in res_slots:
+            report.add("Reservoir " + str(loc) + " is in slot " + str(loc[0]) + ", not in slots_res_racks")
+        if loc[0] not in rack_cache:
+            rack_cache[loc[0]] = rack_info(loc[0], "Reservoir")
+        max_vol, num_wells = rack_cache[loc[0]]
+        if num_wells is not None and loc[1] >= num_wells:
+            report.add("Reservoir " + str(loc) + ": well " + str(loc[1]) + " does not exist, the rack has " +
+                       str(num_wells) + " wells")
+        if loc in res_vol:
+            report.add("Reservoir " + str(loc) + " is listed twice in input_res_data")
+        start_vol = in_res[1][0]
+        if max_vol and start_vol > max_vol:
+            report.add("Reservoir " + str(loc) + " starts with " + str(start_vol) + "uL, above its max volume " +
+                       str(max_vol) + "uL")
+        if do_dilutions and in_res[2][0] > start_vol and loc not in waste_locs + rinse_locs:
+            start_vol = in_res[2][0]  # filled by plan_dil_series before the samples draw from it
+        res_vol[loc] = start_vol
+        res_max[loc] = max_vol
+    for loc in waste_locs + rinse_locs:
+        if loc not in res_vol:
+            report.add("Waste/rinse reservoir " + str(loc) + " is not in input_res_data")
+    # same margins as give_waste_loc (1000uL headspace) and give_rinse_loc (1000uL left)
+    waste_room = sum(max(res_max.get(loc, 0) - 1000 - res_vol.get(loc, 0), 0) for loc in waste_locs)
+    rinse_avail = sum(max(res_vol.get(loc, 0) - 1000, 0) for loc in rinse_locs)
+
+    # samples: loads, reloads, mixes, unload and rinses, as in set_up_res_sam_data and run_sequence
+    load_s = ActionInfo.ACTION_TIME_S['load']
+    mix_s = ActionInfo.ACTION_TIME_S['mix']
+    other_s = ActionInfo.OTHER_ACTION_TIME_S
+    waste_needed = 0
+    rinse_needed = 0
+    busy_time_s = 0
+    longest_s = 0
+    seen_sams = set()
+    for in_sam in exp.input_sam_data:
+        sam_loc = (in_sam[0][0], in_sam[0][1])
+        sols = in_sam[2][1:]
+        if sam_loc in seen_sams:
+            report.add("Sample " + str(sam_loc) + " is listed twice in input_sam_data")
+        seen_sams.add(sam_loc)
+        if sam_loc[0] not in sam_slots:
+            report.add("Sample " + str(sam_loc) + " is in slot " + str(sam_loc[0]) + ", not in slots_sam_plates")
+        if sam_loc[0] not in rack_cache:
+            rack_cache[sam_loc[0]] = rack_info(sam_loc[0], "Sample")
+        sam_max_vol, num_wells = rack_cache[sam_loc[0]]
+        if num_wells is not None and sam_loc[1] >= num_wells:
+            report.add("Sample " + str(sam_loc) + ": well " + str(sam_loc[1]) + " does not exist, the plate has " +
+                       str(num_wells) + " wells")
+        if in_sam[2][0] != len(sols) or not sols:
+            report.add("Sample " + str(sam_loc) + " lists " + str(len(sols)) + " inoculation solutions, num_inoc is " +
+                       str(in_sam[2][0]))
+            continue
+        incub_m = max(sol[3][2] for sol in sols)
+        num_mixes = max(sol[3][3] for sol in sols)
+        num_rinses = max(sol[3][4] for sol in sols)
+        num_reload = 0
+        if incub_m > exp.max_time_before_evap_m:
+            num_reload = int(incub_m / exp.max_time_before_evap_m)
+        num_mixes = max(num_mixes - num_reload, 0)
+        frac_at = {}  # inoculation time: sum of vol_frac
+        fill_vol = 0
+        for sol in sols:
+            sol_loc = (sol[0], sol[1])
+            frac_at[sol[3][1]] = frac_at.get(sol[3][1], 0) + sol[3][0]
+            draw = sam_max_vol * sol[3][0] * (1 + num_reload)
+            fill_vol += sam_max_vol * sol[3][0]
+            if sol_loc not in res_vol:
+                report.add("Sample " + str(sam_loc) + " uses solution " + str(sol_loc) + ", not in input_res_data")
+                continue
+            if sol_loc in waste_locs or sol_loc in rinse_locs:
+                report.add("Sample " + str(sam_loc) + " uses waste/rinse reservoir " + str(sol_loc) + " as a solution")
+            res_vol[sol_loc] -= draw
+        for inoc_time, frac in frac_at.items():
+            if frac > 1.0:
+                report.add("Sample " + str(sam_loc) + " is overfilled at " + str(inoc_time) + " min, volume fraction " +
+                           str(round(frac, 3)))
+        # unload and reloads empty the well into waste; the unload rinses twice, then each rinse
+        waste_needed += fill_vol * (1 + num_reload) + sam_max_vol * (num_rinses + 2)
+        rinse_needed += sam_max_vol * (num_rinses + 2)
+        # time: loads and reloads, mixes, unload, rinses; mixes and reloads must fit in the incubation
+        in_incub_s = num_mixes * mix_s + num_reload * len(sols) * load_s
+        if in_incub_s > 60 * incub_m:
+            report.add("Sample " + str(sam_loc) + " needs " + str(in_incub_s) + "s of mixes/reloads during a " +
+                       str(60 * incub_m) + "s incubation")
+        sam_busy_s = len(sols) * load_s + in_incub_s + other_s * (1 + num_rinses)
+        busy_time_s += sam_busy_s
+        longest_s = max(longest_s, len(sols) * load_s + 60 * incub_m + other_s * (1 + num_rinses))
+
+    for loc, vol_left in res_vol.items():
+        if vol_left < 0:
+            report.add("Reservoir " + str(loc) + " is over-drawn by " + str(round(-vol_left, 1)) + "uL")
+    report.budgets['waste_uL'] = (round(waste_needed, 1), round(waste_room, 1))
+    report.budgets['rinse_uL'] = (round(rinse_needed, 1), round(rinse_avail, 1))
+    if waste_needed > waste_room:
+        report.add("Waste needs " + str(round(waste_needed, 1)) + "uL, the waste reservoirs hold " +
+                   str(round(waste_room, 1)) + "uL")
+    if rinse_needed > rinse_avail:
+        report.add("Rinses need " + str(round(rinse_needed, 1)) + "uL, the rinse reservoirs have " +
+                   str(round(rinse_avail, 1)) + "uL")
+
+    # tips: planning assigns one tip of the sample pipette (exp.sample_pipette) to each reservoir and sample,
+    # and holds the next one; without enough tips, the racks are refilled by the operator (allow_tip_refills),
+    # and each refill is a pause of tip_refill_time_s
+    def check_tips(pipette: str, tips_needed: int, s_need: str):
+        if pipette == 'small':
+            tips_avail = sum(len(rack[1]) for rack in exp.tips_in_sm_racks)
+            report.budgets['tips_sm'] = (tips_needed, tips_avail)
+        else:
+            tips_avail = sum(len(rack[1]) for rack in exp.tips_in_lg_racks)
+            report.budgets['tips_lg'] = (tips_needed, tips_avail)
+        if tips_needed <= tips_avail:
+            return
+        if tips_avail == 0 or not exp.allow_tip_refills:
+            report.add(s_need + " " + str(tips_needed) + " " + pipette + " tips, the tip racks have " + str(tips_avail))
+        else:
+            num_refills = math.ceil((tips_needed - tips_avail) / tips_avail)
+            report.tip_refills[pipette] = max(report.tip_refills.get(pipette, 0), num_refills)
+
+    check_tips(exp.sample_pipette, len(exp.input_res_data) + len(exp.input_sam_data) + 1, "Planning needs")
+    if exp.pipettes_in_use == 'both' and do_dilutions:
+        # dilution transfers routed to the small pipette use a small tip for each reservoir, at most
+        check_tips('small', len(exp.input_res_data), "Dilutions with both pipettes need up to")
+
+    # time: the pipette's busy time (with the tip refills) or the longest sample, against max_run_time_m
+    report.busy_time_s = busy_time_s + exp.tip_refill_time_s * sum(report.tip_refills.values())
+    report.min_run_time_s = max(report.busy_time_s, start_time + longest_s)
+    if exp.max_run_time_m is not None:
+        report.budgets['run_time_s'] = (report.min_run_time_s, 60 * exp.max_run_time_m)
+        if report.min_run_time_s > 60 * exp.max_run_time_m:
+            report.add("The run takes at least " + str(report.min_run_time_s) + "s, max_run_time_m allows " +
+                       str(60 * exp.max_run_time_m) + "s")
+    return report
+
+
+# plans saved by plan_experiment, one pickle file per configuration (plan_config_key)
+PLAN_CACHE_DIR = os.path.join(MODULE_DIR, 'plan_cache')
+PLAN_CACHE_MAX_ENTRIES = 20  # oldest plans (by last use) are removed above this number
+PLAN_CACHE_MAX_MB = 50  # or above this total size
+PLAN_CACHE_VERSION = 9  # change when the planner plans the same configuration differently
+# ExperimentData inputs of the planning: the same values give the same planned sequence
+PLAN_CONFIG_FIELDS = ('pipettes_in_use', 'tip_rack_lg_name', 'tip_rack_sm_name', 'pipette_lg_name', 'pipette_sm_name',
+                      'slots_tiprack_sm', 'slots_tiprack_lg', 'slots_res_racks', 'slots_sam_plates',
+                      'offsets_lg_tiprx', 'offsets_sm_tiprx', 'offsets_res_racks', 'offsets_sam_racks',
+                      'tips_in_sm_racks', 'tips_in_lg_racks', 'sam_plate_names', 'res_plate_names',
+                      'waste_res_locs', 'rinse_res_locs', 'start_dry', 'store_dry', 'incub_longest_first',
+                      'max_time_before_evap_m', 'content_types', 'input_res_data', 'input_sam_data',
+                      'plan_mode', 'plan_time_budget_s', 'incub_error_weight', 'max_incub_error_s',
+                      'tip_policy', 'tip_swap_mode', 'model_tip_swaps', 'batch_tips', 'tip_batch_window_s',
+                      'pipette_lg_range_ul', 'pipette_sm_range_ul', 'allow_tip_refills', 'tip_refill_time_s',
+                      'plan_waste_rinse')
+# ExperimentData fields that are not planned, copied from the new configuration onto a cached plan
+PLAN_RUN_FIELDS = ('exp_name', 'exp_date', 'exp_rate_fraction', 'zero_timestmp',
+                   'profile_planning', 'profile_memory', 'use_plan_cache')
+
+
+def plan_config_key(exp: ExperimentData):
+    # content hash (sha256, hex) of the planning inputs in exp, the action and tip change durations,
+    # the reservoir margins and the labware volumes, so a change to any of them plans again
+    config = [('version', PLAN_CACHE_VERSION)]
+    for name in PLAN_CONFIG_FIELDS:
+        config.append((name, getattr(exp, name, None)))
+    config.append(('durations', (start_time, load_time_s, sorted(ActionInfo.ACTION_TIME_S.items()),
+                                 ActionInfo.OTHER_ACTION_TIME_S, sorted(ActionInfo.TIP_SWAP_TIME_S.items()))))
+    config.append(('margins', WASTE_RINSE_MARGIN_UL))
+    plate_names = [item[1] for item in tuple(exp.res_plate_names) + tuple(exp.sam_plate_names)]
+    config.append(('labware', [(name, exp.find_max_res_vol(name), exp.find_label(name))
+                               for name in sorted(set(plate_names))]))
+    return hashlib.sha256(repr(config).encode('utf-8')).hexdigest()
+
+
+class PlanCache:
+    # planned ExperimentData objects on disk, by plan_config_key; least recently used are evicted first
+    def __init__(self, cache_dir=PLAN_CACHE_DIR, max_entries=PLAN_CACHE_MAX_ENTRIES, max_mb=PLAN_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_mb * 1024 * 1024
+
+    def path(self, key: str):
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    def load(self, key: str):
+        # the cached ExperimentData for key, or None
+        file_path = self.path(key)
+        if not os.path.isfile(file_path):
+            return None
+        try:
+            with open(file_path, 'rb') as cache_file:
+                cached = pickle.load(cache_file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as err:
+            logger.warning("Removing unreadable cached plan %s: %s", file_path, err)
+            self.remove(key)
+            return None
+        if not isinstance(cached, ExperimentData) or cached.plan_key != key:
+            self.remove(key)
+            return None
+        try:
+            os.utime(file_path)  # last use, for eviction
+        except OSError:
+            pass
+        return cached
+
+    def store(self, key: str, exp: ExperimentData):
+        # save exp under key, then evict old entries; a read-only folder only loses the cache
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self.path(key) + '.tmp'
+            with open(tmp_path, 'wb') as cache_file:
+                pickle.dump(exp, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path(key))
+        except OSError as err:
+            logger.warning("Could not save the plan to %s: %s", self.cache_dir, err)
+            return
+        self.evict()
+
+    def entries(self):
+        # [(last use, size, path), ...] of the cached plans, oldest first
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith('.pkl'):
+                file_path = os.path.join(self.cache_dir, file_name)
+                file_stat = os.stat(file_path)
+                entries.append((file_stat.st_mtime, file_stat.st_size, file_path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        entries = self.entries()
+        tot_bytes = sum(entry[1] for entry in entries)
+        while entries and (len(entries) > self.max_entries or tot_bytes > self.max_bytes):
+            last_use, size, file_path = entries.pop(0)
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+            tot_bytes -= size
+
+    def remove(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for entry in self.entries():
+            os.remove(entry[2])
+
+
+def plan_experiment(exp: ExperimentData):
+    # config_samples + create_exp_sequence, or the saved plan of an identical configuration
+    # returns the planned ExperimentData (exp.planned_sequence is set)
+    if exp.profile_planning and not profiler.enabled:
+        # one profile for the whole planning, also stopped on an early return (plan file, cache) or an error
+        profiler.start(exp.profile_memory)
+        planned = exp
+        try:
+            planned = plan_experiment(exp)
+            return planned
+        finally:
+            finish_profile(planned)
+    exp.plan_key = plan_config_key(exp)
+    if exp.plan_file is not None and os.path.isfile(exp.plan_file):
+        # plan file made on a workstation, used if it was planned for this configuration
+        if read_plan_header(exp.plan_file)['plan_key'] == exp.plan_key:
+            loaded = load_plan_file(exp.plan_file)
+            for name in PLAN_RUN_FIELDS:
+                setattr(loaded, name, getattr(exp, name))
+            loaded.plan_file = exp.plan_file
+            logger.info("Loaded the plan of %s actions from %s", len(loaded.plan_table), exp.plan_file)
+            return loaded
+        logger.warning("Plan file %s is for a different configuration, planning again.", exp.plan_file)
+    cache = PlanCache()
+    if exp.use_plan_cache:
+        cached = cache.load(exp.plan_key)
+        if cached is not None:
+            for name in PLAN_RUN_FIELDS:
+                setattr(cached, name, getattr(exp, name))
+            logger.info("Loaded the planned sequence of %s actions from the plan cache (%s)",
+                        len(cached.planned_sequence), exp.plan_key[:12])
+            return cached
+    exp.preflight_report = preflight_check(exp)  # before planning, so a bad configuration fails quickly
+    if not exp.preflight_report.ok:
+        logger.error("%s", exp.preflight_report)
+        s_out = "Configuration is not feasible, " + str(len(exp.preflight_report.violations)) + \
+                " problems (see exp.preflight_report). Check user_config_exp and retry."
+        raise ValueError(s_out)
+    if exp.preflight_report.tip_refills:
+        logger.warning("The tip racks run out: %s refills, %s s each, see exp.preflight_report",
+                       exp.preflight_report.tip_refills, exp.tip_refill_time_s)
+    exp = config_samples(exp)
+    exp.planned_sequence = create_exp_sequence(exp)
+    if exp.use_plan_cache:
+        cache.store(exp.plan_key, exp)
+    if exp.plan_file is not None:
+        save_plan_file(exp, exp.plan_file)
+    return exp
+
+
 def user_config_exp():
     # Have user fill out the user_config_exp: five steps
     my_exp = ExperimentData()
@@ -2313,6 +5598,8 @@ def user_config_exp():
     # This information will be used to determine when dilutions are needed
     # prior to sample handling, with parent and child dilution reservoirs determined
     # by the use of identical 'contents' string.
+    # (or load them from a table, one row per reservoir: load_input_files(my_exp, res_file='res.csv'),
+    # with the columns in RES_INPUT_COLUMNS)
     my_exp.input_res_data = (((1, 0, 'res'), (50000, 0), (0, 0), 'DI_sol'),
                              ((1, 1, 'res'), (50000, 2000), (0, 2000), 'Thiol_1_sol'),
                              ((1, 2, 'res'), (0, 0), (30000, 0), 'Waste'),
@@ -2358,6 +5645,8 @@ def user_config_exp():
     # indicate identical inoculate_min_int and incubate_time_min_int for each solution
     # the max of num_mixes and num_rinses of all solutions will be used.
     # ...'sol', (vol_frac, inoc_min_int, incub_min_int, num_mixes, num_rinses)
+    # (or load them from a table, one row per inoculation solution of each sample:
+    # load_input_files(my_exp, sam_file='samples.csv'), with the columns in SAM_INPUT_COLUMNS)
     my_exp.input_sam_data = (((2, 0, 'sam'), 'USC23Au0509a', (1, (5, 0, 'sol', (1.0, 0, 32, 3, 4)),)),
                              ((2, 1, 'sam'), 'USC23Au0509b', (1, (5, 1, 'sol', (1.0, 0, 24, 3, 4)),)),
                              ((2, 2, 'sam'), 'USC23Au0509c', (1, (5, 2, 'sol', (1.0, 0, 4, 3, 4)),)),
@@ -2452,21 +5741,21 @@ def run(protocol: protocol_api.ProtocolContext):
 
     # set up experiment, exp is global to run()
     exp: ExperimentData = user_config_exp()
-    exp = config_samples(exp)
-    exp.planned_sequence = create_exp_sequence(exp)
+    exp = plan_experiment(exp)  # config_samples + create_exp_sequence, unless the plan is cached
 
     # MODIFY: "store" pipette tips in the tiprack to use for the same container, but
-    # MODIFY: removing pipette tips requires re-homing so adjust time for each action
+    # removing pipette tips requires re-homing in tip_swap_mode 'home': the planned time of each
+    # tip change is ActionInfo.TIP_SWAP_TIME_S[exp.tip_swap_mode], see add_tip_swaps / drop_tip_swaps
 
     # load pipettes and labware onto OT-2 deck
     pipette_sm: pipette_context  # define
     pipette_lg: pipette_context  # define
     if exp.pipettes_in_use == 'small' or exp.pipettes_in_use == 'both':
         tips_sm = []  # set of tip racks for this pipette size
-        for xx in range(exp.num_lg_tipracks):
+        for xx in range(exp.num_sm_tipracks):
             rack_slot = exp.slots_tiprack_sm[xx]
             new_tiprack = protocol.load_labware(exp.tip_rack_sm_name, rack_slot)
-            this_offset = exp.slot_offsets_sm_tips[xx]
+            this_offset = exp.offsets_sm_tiprx[xx]
             new_tiprack.set_offset(this_offset[0], this_offset[1], this_offset[2])
             tips_sm.append(new_tiprack)
         pipette_sm = protocol.load_instrument(exp.pipette_sm_name, exp.pipette_sm_loc, tip_racks=tips_sm)
@@ -2514,6 +5803,8 @@ def run(protocol: protocol_api.ProtocolContext):
     set_speeds(rate)
     protocol.set_rail_lights(False)
     pipette_lg.home()
+    if exp.pipettes_in_use == 'both':
+        pipette_sm.home()
 
     # print("Solution index is now: ", exp.this_indx_solut)  # debug
     # print("Rinse index is now: ", exp.this_indx_rinse)  # debug
@@ -2630,82 +5921,117 @@ def run(protocol: protocol_api.ProtocolContext):
     def swap_tips(next_tip_loc: (int, int), which_pip: str):
         # swap tips for the pipette,
         # if using different tips for diff solutions
-        rack_pos = next_tip_loc[0]
+        # next_tip_loc is (tip rack slot, tip well), as assigned by exp.assign_tip
         which_tipwell = next_tip_loc[1]
+        if which_pip != 'small' and which_pip != 'large':
+            logger.warning("Select pipette for swapping tips: 'small' or 'large'. Defaulting to 'large'")
+            which_pip = 'large'
         if which_pip == 'small':
             pipette = pipette_sm
-            which_rack = tips_sm[rack_pos]
-            max_racks = exp.num_sm_tipracks
-            if which_tipwell not in exp.tips_in_sm_racks[rack_pos]:
-                print("Not a valid position in this tiprack:", next_tip_loc)
-                # raise StopExecution
-        elif which_pip == 'large':
-            pipette = pipette_lg
-            which_rack = tips_lg[rack_pos]
-            max_racks = exp.num_lg_tipracks
-            if which_tipwell not in exp.tips_in_lg_racks[rack_pos]:
-                print("Not a valid position in this tiprack:", next_tip_loc)
-                # raise StopExecution
+            racks = tips_sm
+            inventory = exp.tip_inventory_sm
         else:
-            print("Select pipette for swapping tips: 'small' or 'large'. Defaulting to 'large'")
             pipette = pipette_lg
-            which_rack = tips_lg[rack_pos]
-            max_racks = exp.num_lg_tipracks
-            # raise StopExecution
-
-        if rack_pos >= max_racks:
-            print("Tiprack out of bounds!  Tiprack ", rack_pos, " is not loaded.")
+            racks = tips_lg
+            inventory = exp.tip_inventory_lg
+        if not inventory.is_loaded(next_tip_loc):
+            logger.warning("Not a valid position in this tiprack: %s", next_tip_loc)
             # raise StopExecution
+        rack_pos = inventory.rack_index.get(next_tip_loc[0])  # index in racks, same order as the slots
+        if rack_pos is None or rack_pos >= len(racks):
+            logger.warning("Tiprack out of bounds!  Tiprack in slot %s is not loaded.", next_tip_loc[0])
+            return None
+        which_rack = racks[rack_pos]
 
         # LOCAL VARIABLE - how to change global variable instead?
+        # tip_swap_mode 'home': home the pipette after each swap (as before),
+        # 'no_home': the plunger is not homed, it was homed at the start of run() and stays calibrated
+        do_home = exp.tip_swap_mode == 'home'
         if pipette.has_tip:
-            pipette.return_tip(home_after=True)  # return last tip to its rack  (not discarded)
+            pipette.return_tip(home_after=do_home)  # return last tip to its rack  (not discarded)
+            if which_pip == 'small':
+                inventory.return_tip(exp.cur_sm_tip)
+            else:
+                inventory.return_tip(exp.cur_lg_tip)
         pipette.pick_up_tip(which_rack.wells()[which_tipwell])  # pick up selected tip from chosen rack
-        pipette.home()  # homes pipette ONLY, NOT XYZ
+        if which_pip == 'small':
+            exp.cur_sm_tip = next_tip_loc
+        else:
+            exp.cur_lg_tip = next_tip_loc
+        inventory.in_rack[next_tip_loc] = False
+        if do_home:
+            pipette.home()  # homes pipette ONLY, NOT XYZ
 
         return None
 
     def run_sequence():
         # internal function, so dont need to pass exp, sample_plates, reservoirs, etc
         # run_sequence(exp: ExperimentData, plates_labware: List[Labware]):
-        which_pip = exp.pipettes_in_use
-        if which_pip == 'both':
-            which_pip = 'large'
-        exp_sequence = deepcopy(exp.planned_sequence)
-        num_actions = len(exp_sequence)
+        # each action runs on its planned pipette (ActionInfo.pipette, see route_pipette),
+        # and each pipette mount keeps its own tip between its actions
+        # columnar copy of the plan, ActionInfo objects are made one at a time below
+        if exp.plan_table is not None:
+            exp_table = exp.plan_table.copy()  # loaded from a plan file
+        else:
+            exp_table = ActionTable.from_actions(exp.planned_sequence)
+        num_actions = len(exp_table)
         all_samples = exp.all_samples  # data for samples (nested list of SampleWell type objects)
         # recall that protocol accessible labware object sample_plates is a list of sample plates!
         zero_timestmp = exp.zero_timestmp
 
         # shifting the timestamps to zero_timestmp (computer time)
-        for act in range(num_actions - 1, -1, -1):
-            print(act)
-            new_time = exp_sequence[act].start + zero_timestmp
-            exp_sequence[act].change_start(new_time)
-            # pass
-
-        exp.pln_seq_stamps = exp_sequence
-        which_tip = (0, 0)
+        exp_table.shift(zero_timestmp)
+        if exp_table.has_overlaps():
+            logger.warning("Planned sequence has overlapping actions at positions: %s", exp_table.overlaps())
+
+        exp.pln_seq_stamps = []  # actions with shifted timestamps, added as they run
+        which_tip = {'large': (0, 0), 'small': (0, 0)}  # tip mounted on each pipette
+        # planned tip rack refills (see forecast_tip_refills), shifted to zero_timestmp
+        refills = []
+        if exp.tip_forecast is not None:
+            refills = [(refill[0] + zero_timestmp,) + tuple(refill[1:]) for refill in exp.tip_forecast.refills]
+        which_refill = 0
 
         for ix in range(num_actions):
             # print("___________________________________________")
             # print("ix is now:", ix)  # debug
-            this_action = exp_sequence[ix]
+            this_action = exp_table.action_at(ix)
+            while which_refill < len(refills) and refills[which_refill][0] <= this_action.start:
+                # idle time planned for the operator to put fresh tips in the spent positions
+                refill = refills[which_refill]
+                timestamp_now = math.ceil(time.perf_counter())
+                if timestamp_now < refill[0]:
+                    time.sleep(refill[0] - timestamp_now)
+                str_out = "Refill " + refill[2] + " pipette tips, in (slot, tip well): " + str(refill[3])
+                print(str_out)
+                protocol.pause(str_out + ". Resume when done.")
+                which_refill += 1
+            exp.pln_seq_stamps.append(this_action)
             sample_id = this_action.keeper
 
             sam_plate_id = exp.sam_plate_indx_nums[sample_id]
             sam_well_id = exp.sam_well_indx_nums[sample_id]
             sam_data = all_samples[sam_plate_id][sam_well_id]  # choose sample data_set (alias)
             this_well = sample_plates[sam_plate_id].wells()[sam_well_id]  # Labware well object for protocol use
-            if which_tip != this_action.get_tip:
-                which_tip = this_action.get_tip
-                swap_tips(which_tip, which_pip)
-
-            ## MODIFY: use subset of res_data?
-            waste_data = exp.waste_data[exp._cur_waste]  # choose waste data_set (alias)
-            rinse_data = exp.rinse_data[exp._cur_rinse]  # choose rinse data_set (alias)
-            this_rinse = rinse_res_arr[exp._cur_rinse]  # Labware well object for protocol use
-            this_waste = waste_res_arr[exp._cur_waste]  # Labware well object for protocol use
+            which_pip = this_action.pipette
+            if which_tip[which_pip] != this_action.tip_loc:
+                which_tip[which_pip] = this_action.tip_loc  # the planned tip change, see drop_tip_swaps
+                swap_tips(this_action.tip_loc, which_pip)
+
+            if this_action.waste_loc is not None:
+                # waste and rinse reservoirs planned by allocate_waste_rinse (may be the same, shared well)
+                res_indx = exp.find_res_in_nest_list(this_action.waste_loc)
+                waste_data = exp.all_res_data[res_indx[0]][res_indx[1]]
+                res_indx = exp.find_res_in_nest_list(this_action.rinse_loc)
+                rinse_data = exp.all_res_data[res_indx[0]][res_indx[1]]
+                this_rinse = rinse_res_arr[exp.rinse_res_locs.index(this_action.rinse_loc)]
+                this_waste = waste_res_arr[exp.waste_res_locs.index(this_action.waste_loc)]
+            else:
+                ## MODIFY: use subset of res_data?
+                waste_data = exp.waste_data[exp._cur_waste]  # choose waste data_set (alias)
+                rinse_data = exp.rinse_data[exp._cur_rinse]  # choose rinse data_set (alias)
+                this_rinse = rinse_res_arr[exp._cur_rinse]  # Labware well object for protocol use
+                this_waste = waste_res_arr[exp._cur_waste]  # Labware well object for protocol use
 
             goal_time = this_action.start - 10  # start action within 10 seconds of start/end time
             action_type = this_action.action